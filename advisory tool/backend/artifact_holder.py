@@ -0,0 +1,162 @@
+"""
+Process-wide holder for artifacts that are expensive to load
+------------------------------------------------------------
+Loads an artifact (a saved model directory, a data file) once, serves the loaded
+copy to every request and swaps in a new copy in the background when the files
+on disk change.
+"""
+
+import json
+import os
+import threading
+import time
+
+
+def _artifact_files(path):
+    """(relative path, stat) for every file under a directory, sorted"""
+    files = []
+    for root, dirs, names in os.walk(path):
+        dirs.sort()
+        for name in sorted(names):
+            file_path = os.path.join(root, name)
+            try:
+                files.append((os.path.relpath(file_path, path), os.stat(file_path)))
+            except FileNotFoundError:
+                pass  # Replaced between listing and stat
+    return files
+
+
+def directory_bytes(path):
+    """Total size of the files under a directory"""
+    return sum(stat.st_size for _, stat in _artifact_files(path))
+
+
+def artifact_signature(path):
+    """Return a value that changes whenever the artifact at path changes"""
+    if not os.path.exists(path):
+        return None
+
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    # For a model directory use every file's mtime and size plus the version
+    # written to metadata.json at the end of training
+    entries = []
+    for name, stat in _artifact_files(path):
+        entries.append((name, stat.st_mtime_ns, stat.st_size))
+
+    version = None
+    metadata_path = os.path.join(path, "metadata.json")
+    if os.path.exists(metadata_path):
+        try:
+            with open(metadata_path, "r") as f:
+                version = json.load(f).get("version")
+        except (OSError, ValueError):
+            # metadata.json is being rewritten, the next poll will see it
+            version = "unreadable"
+
+    return (version, tuple(entries))
+
+
+def artifact_is_complete(path):
+    """Check that a model directory is not in the middle of being written"""
+    metadata_path = os.path.join(path, "metadata.json")
+    if not os.path.isdir(path) or not os.path.exists(metadata_path):
+        return True
+
+    # Training writes metadata.json after every other component, so a directory
+    # whose metadata is older than one of its files is still being written
+    metadata_mtime = os.stat(metadata_path).st_mtime_ns
+    for name, stat in _artifact_files(path):
+        if stat.st_mtime_ns > metadata_mtime:
+            return False
+    return True
+
+
+class ArtifactHolder:
+    """Keeps one loaded copy of an artifact and hot-swaps it when it changes"""
+
+    def __init__(self, path, loader, poll_interval=30.0, name=None, on_swap=None):
+        self.path = path
+        self.loader = loader
+        self.poll_interval = poll_interval
+        self.name = name or os.path.basename(os.path.normpath(path))
+        # Called with the new artifact right after it replaces the old one
+        self.on_swap = on_swap
+
+        # (artifact, signature) is replaced as a whole so readers never see a
+        # new artifact paired with an old signature or a half-loaded artifact
+        self._current = (None, None)
+        self._load_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._watcher = None
+        self.load_count = 0
+        self.last_load_seconds = None
+
+    def get(self):
+        """Return the currently loaded artifact (None if nothing loaded yet)"""
+        return self._current[0]
+
+    @property
+    def signature(self):
+        return self._current[1]
+
+    def refresh(self, force=False):
+        """Reload the artifact if it changed on disk; return True if swapped"""
+        with self._load_lock:
+            signature = artifact_signature(self.path)
+            if signature is None:
+                print(f"Artifact not found: {self.path}")
+                return False
+            if not force and signature == self._current[1]:
+                return False
+            if not force and not artifact_is_complete(self.path):
+                return False
+
+            start = time.perf_counter()
+            artifact = self.loader(self.path)
+            elapsed = time.perf_counter() - start
+
+            if artifact is None:
+                print(f"Failed to load {self.name}, keeping the current copy")
+                return False
+
+            # Files changed while we were reading them (e.g. training is still
+            # writing the artifact); drop this copy and retry on the next poll
+            if artifact_signature(self.path) != signature:
+                print(f"{self.name} changed while loading, retrying later")
+                return False
+
+            self._current = (artifact, signature)
+            self.load_count += 1
+            self.last_load_seconds = elapsed
+            print(f"Loaded {self.name} in {elapsed:.2f}s")
+            if self.on_swap is not None:
+                self.on_swap(artifact)
+            return True
+
+    def start(self, watch=True):
+        """Load the artifact now and optionally start the background watcher"""
+        self.refresh(force=True)
+
+        if watch and self.poll_interval and self._watcher is None:
+            self._stop_event.clear()
+            self._watcher = threading.Thread(
+                target=self._watch, name=f"watch-{self.name}", daemon=True
+            )
+            self._watcher.start()
+
+    def stop(self):
+        """Stop the background watcher"""
+        self._stop_event.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    def _watch(self):
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error while reloading {self.name}: {e}")
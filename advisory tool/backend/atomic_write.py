@@ -0,0 +1,34 @@
+"""
+Atomic writes for artifact files
+--------------------------------
+Every file is written to a temporary file next to it and renamed into place,
+so a reader sees either the old file or the complete new one, and readers
+that memory-mapped the old file keep their pages. Saved tables and engines
+write their manifest last with save_json, which marks the directory as
+complete.
+"""
+
+import json
+import os
+
+import numpy as np
+
+
+def _tmp_path(path):
+    return f"{path}.tmp-{os.getpid()}"
+
+
+def save_array(path, array):
+    """Write an .npy file (no pickled objects)"""
+    tmp_path = _tmp_path(path)
+    with open(tmp_path, "wb") as f:
+        np.save(f, array, allow_pickle=False)
+    os.replace(tmp_path, path)
+
+
+def save_json(path, data, indent=None):
+    """Write a JSON file"""
+    tmp_path = _tmp_path(path)
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=indent)
+    os.replace(tmp_path, path)
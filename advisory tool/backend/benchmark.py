@@ -0,0 +1,333 @@
+"""
+Benchmarks for the training and serving hot paths
+-------------------------------------------------
+Generates a seeded synthetic data.csv (see synthetic_data.py) in a scratch
+directory, then times preprocess_data, engineer_features, the dense and
+sparse preprocessing modes (with their matrix sizes, peak memory of the
+transform and of training, and prediction differences),
+train_and_save_model, load_model, predict_sales, the cold start of the API
+(importing main.py and a first prediction in a new process) and the POST /
+handler there.
+Results are written as JSON; --compare checks them against an earlier run
+and exits with status 1 when a median got slower by more than --threshold.
+
+The model and data paths of monthly.py and main.py are relative to the
+working directory, so everything runs inside --workdir and the saved models
+next to this file are not touched.
+
+Usage:
+    python benchmark.py --products 50 --months 36 --rows 200000 --output bench.json
+    python benchmark.py --output new.json --compare bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic_data import write_sales_data
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Run in a fresh interpreter: import the API module, load the model and
+# answer one prediction
+COLD_START_CODE = """
+import sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+model = main.load_model(main.MODEL_DIR)
+model.predict_sales(next(iter(model.product_data)), seed=0)
+print(imported - start, time.perf_counter() - start, 'sklearn' in sys.modules)
+"""
+
+
+def measure(fn, repeat, setup=None):
+    """Run fn repeat times; returns the durations in seconds and the last result"""
+    seconds = []
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        seconds.append(time.perf_counter() - start)
+    return seconds, result
+
+
+def summarize(seconds, **extra):
+    return {
+        'repeat': len(seconds),
+        'min': min(seconds),
+        'median': statistics.median(seconds),
+        'mean': statistics.fmean(seconds),
+        'max': max(seconds),
+        **extra
+    }
+
+
+def run_benchmarks(products=12, months=24, rows=20000, seed=0, repeat=5, train_repeat=1,
+                   n_jobs=None, workdir=None):
+    """Run the suite in workdir (default: a new temporary directory)"""
+    workdir = os.path.abspath(workdir or tempfile.mkdtemp(prefix="advisory-bench-"))
+    os.makedirs(workdir, exist_ok=True)
+    results = {}
+
+    def record(name, seconds, **extra):
+        results[name] = summarize(seconds, **extra)
+        print(f"  {name:<20} median {results[name]['median'] * 1000:10.2f} ms  (n={len(seconds)})")
+
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        print(f"Benchmarking in {workdir}")
+        seconds, n_rows = measure(lambda: write_sales_data(
+            "data.csv", products=products, months=months, rows=rows, seed=seed
+        ), 1)
+        record('generate_data', seconds, rows=n_rows)
+
+        # The training stack is only imported once the data is in place
+        import pandas as pd
+        import monthly
+
+        df = pd.read_csv("data.csv")
+        seconds, (_, monthly_data) = measure(lambda: monthly.preprocess_data(df), repeat)
+        record('preprocess_data', seconds, rows=len(df))
+
+        seconds, processed = measure(lambda: monthly.engineer_features(monthly_data), repeat)
+        record('engineer_features', seconds, rows=len(monthly_data))
+        del df, monthly_data
+
+        results.update(benchmark_preprocessing(processed, repeat, n_jobs))
+        del processed
+
+        seconds, _ = measure(lambda: monthly.train_and_save_model("data.csv", n_jobs=n_jobs), train_repeat)
+        model_dir = os.path.join("saved_models", "grid_sales_model")
+        if not os.path.exists(os.path.join(model_dir, "metadata.json")):
+            raise RuntimeError("Training did not produce a model")
+        record('train_and_save_model', seconds)
+
+        seconds, model = measure(lambda: monthly.load_model(model_dir), repeat)
+        record('load_model', seconds)
+
+        product_names = list(model.product_data)
+        calls = iter(range(sys.maxsize))
+
+        def predict_next():
+            return model.predict_sales(product_names[next(calls) % len(product_names)], seed=seed)
+
+        seconds, _ = measure(predict_next, repeat * len(product_names))
+        record('predict_sales', seconds, table=model.prediction_table is not None)
+
+        # The same calls without the precomputed table
+        table, model.prediction_table = model.prediction_table, None
+        seconds, _ = measure(predict_next, repeat * len(product_names))
+        record('predict_sales_live', seconds, compiled=model.compiled is not None)
+        model.prediction_table = table
+
+        results.update(benchmark_cold_start(repeat))
+        results.update(benchmark_endpoint(product_names, repeat))
+    finally:
+        os.chdir(previous_cwd)
+
+    return {
+        'meta': {
+            'products': products,
+            'months': months,
+            'rows': rows,
+            'seed': seed,
+            'repeat': repeat,
+            'n_jobs': n_jobs,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S")
+        },
+        'benchmarks': results
+    }
+
+
+def training_peak_bytes(processed, mode, n_jobs):
+    """Peak RSS of a process that preprocesses processed and fits the members
+
+    Run in a fresh process so the peak is this run's (it includes the
+    interpreter and the imported libraries); the members are fit one after
+    another in that process, with n_jobs threads each.
+    """
+    import resource
+    import monthly
+
+    model = monthly.GridSalesEnsembleModel()
+    model.store_feature_info(processed)
+    preprocessor = monthly.build_preprocessor(model.categorical_features, model.numerical_features, mode)
+    X = preprocessor.fit_transform(processed[model.categorical_features + model.numerical_features])
+    y = processed['Quantity'].to_numpy()
+    for name in monthly.MEMBER_LABELS:
+        monthly._fit_member(name, X, y, n_jobs)
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def benchmark_preprocessing(processed, repeat, n_jobs):
+    """Each preprocessing mode on the engineered data: transform, fit and predict
+
+    Records the size of the transformed matrix, the peak memory of the
+    transform (tracemalloc) and of the transform plus fitting the members
+    (peak process RSS, which includes XGBoost's and the trees' native
+    buffers), and the largest prediction difference from the dense mode.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    import tracemalloc
+    import numpy as np
+    import monthly
+
+    model = monthly.GridSalesEnsembleModel()
+    model.store_feature_info(processed)
+    features = processed[model.categorical_features + model.numerical_features]
+    y = processed['Quantity'].to_numpy()
+
+    results = {}
+    sizes = {}
+    reference = None
+    for mode in monthly.PREPROCESSING_MODES:
+        preprocessor = monthly.build_preprocessor(model.categorical_features, model.numerical_features, mode)
+        seconds, X = measure(lambda: preprocessor.fit_transform(features), repeat)
+        tracemalloc.start()
+        preprocessor.fit_transform(features)
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        sizes[mode] = (monthly.matrix_bytes(X), peak_bytes)
+        results[f'preprocess_{mode}'] = summarize(seconds, matrix_bytes=sizes[mode][0], peak_bytes=peak_bytes)
+
+        fit_seconds, (members, _) = measure(lambda: monthly.fit_ensemble_members(X, y, n_jobs=n_jobs), 1)
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            training_peak = pool.submit(training_peak_bytes, processed, mode, n_jobs or os.cpu_count()).result()
+        sizes[mode] += (training_peak,)
+        results[f'fit_{mode}'] = summarize(fit_seconds, training_peak_bytes=training_peak)
+
+        model.store_models(members['xgb_model'], members['rf_model_1'], members['rf_model_2'])
+        model.store_preprocessor(preprocessor)
+        model.preprocessing = mode
+        seconds, predictions = measure(lambda: model._predict_frame(processed, use_compiled=False), repeat)
+        if reference is None:
+            reference = predictions
+        results[f'predict_{mode}'] = summarize(
+            seconds, max_abs_diff=float(np.abs(predictions - reference).max()),
+            mean_abs_diff=float(np.abs(predictions - reference).mean())
+        )
+
+    for name, result in results.items():
+        print(f"  {name:<20} median {result['median'] * 1000:10.2f} ms  (n={result['repeat']})")
+    dense_bytes, dense_peak, dense_training = sizes['dense']
+    sparse_bytes, sparse_peak, sparse_training = sizes['sparse']
+    print(f"  sparse vs dense: matrix {sparse_bytes / 1e6:.2f} / {dense_bytes / 1e6:.2f} MB, "
+          f"transform peak {sparse_peak / 1e6:.2f} / {dense_peak / 1e6:.2f} MB, "
+          f"training peak {sparse_training / 1e6:.2f} / {dense_training / 1e6:.2f} MB, "
+          f"fit {results['fit_sparse']['median'] / results['fit_dense']['median']:.2f}x, "
+          f"max prediction difference {results['predict_sparse']['max_abs_diff']:.3g}")
+    return results
+
+
+def benchmark_cold_start(repeat):
+    """Import time of main.py and time to a first prediction, in new processes"""
+    env = dict(os.environ, ADVISORY_LOG_LEVEL="OFF", PYTHONPATH=BACKEND_DIR)
+    import_seconds, start_seconds, sklearn_loaded = [], [], False
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", COLD_START_CODE], env=env, check=True, capture_output=True, text=True
+        ).stdout.split("\n")
+        imported, started, sklearn = output[-2].split()
+        import_seconds.append(float(imported))
+        start_seconds.append(float(started))
+        sklearn_loaded = sklearn_loaded or sklearn == "True"
+
+    results = {
+        'import_main': summarize(import_seconds),
+        'cold_start': summarize(start_seconds, sklearn_imported=sklearn_loaded)
+    }
+    for name in results:
+        print(f"  {name:<20} median {results[name]['median'] * 1000:10.2f} ms  (n={repeat})")
+    return results
+
+
+def benchmark_endpoint(product_names, repeat):
+    """Time POST / in process, with the prediction cache cleared before each request"""
+    os.environ.setdefault("ADVISORY_LOG_LEVEL", "OFF")
+    os.environ.setdefault("ADVISORY_WORKERS", "0")
+    from fastapi.testclient import TestClient
+    import main
+
+    results = {}
+    with TestClient(main.app) as client:
+        calls = iter(range(sys.maxsize))
+
+        def post_next():
+            response = client.post("/", json={'product_name': product_names[next(calls) % len(product_names)]})
+            response.raise_for_status()
+            return response
+
+        seconds, _ = measure(post_next, repeat * len(product_names), setup=main.prediction_cache.clear)
+        results['post_optimize'] = summarize(seconds)
+        print(f"  {'post_optimize':<20} median {results['post_optimize']['median'] * 1000:10.2f} ms  (n={len(seconds)})")
+    return results
+
+
+def compare(results, baseline, threshold=0.2):
+    """Print median ratios against a baseline run; returns the regressed benchmarks"""
+    if baseline['meta'].get('rows') != results['meta']['rows'] or \
+            baseline['meta'].get('products') != results['meta']['products']:
+        print("Warning: the baseline was run at a different scale")
+
+    regressions = []
+    print(f"\n{'benchmark':<22}{'baseline ms':>14}{'current ms':>14}{'ratio':>9}")
+    for name, current in results['benchmarks'].items():
+        previous = baseline['benchmarks'].get(name)
+        if previous is None:
+            print(f"{name:<22}{'-':>14}{current['median'] * 1000:>14.2f}{'new':>9}")
+            continue
+        ratio = current['median'] / previous['median'] if previous['median'] > 0 else float('inf')
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = "  SLOWER"
+        print(f"{name:<22}{previous['median'] * 1000:>14.2f}{current['median'] * 1000:>14.2f}{ratio:>9.2f}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the training and serving hot paths")
+    parser.add_argument("--products", type=int, default=12)
+    parser.add_argument("--months", type=int, default=24)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5, help="runs of each fast benchmark")
+    parser.add_argument("--train-repeat", type=int, default=1, help="runs of train_and_save_model")
+    parser.add_argument("--n-jobs", type=int, default=None, help="core budget for training (default: all)")
+    parser.add_argument("--workdir", default=None, help="scratch directory (default: a new temporary one)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", default=None, help="results JSON of an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative slowdown of a median that counts as a regression")
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        products=args.products, months=args.months, rows=args.rows, seed=args.seed,
+        repeat=args.repeat, train_repeat=args.train_repeat, n_jobs=args.n_jobs, workdir=args.workdir
+    )
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nSlower than the baseline by more than {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
@@ -0,0 +1,133 @@
+"""
+Content-addressed cache for training features
+---------------------------------------------
+Training spends much of its time aggregating data.csv, engineering features
+and fitting the preprocessor, and the result only depends on the data, the
+feature code and a few settings. Each result is stored in a directory named
+by a hash of those inputs, so a retrain on unchanged data (for example a
+hyperparameter experiment) starts at model fitting.
+
+Entries are written to a temporary directory and renamed into place, so a
+crashed run never leaves a partial entry. Only the `keep` most recently used
+entries are kept.
+
+Usage:
+    cache = FeatureCache("saved_models/feature_cache")
+    key = cache.key(data=file_digest("data.csv"), code=code_digest([preprocess_data]))
+    path = cache.lookup(key)
+    if path is None:
+        with cache.writer(key) as path:
+            ...  # write files into path
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
+from atomic_write import save_json
+
+_BLOCK_SIZE = 1 << 20
+
+
+def file_digest(path, memo_path=None):
+    """SHA-256 of a file's content
+
+    With memo_path, digests are remembered by (size, mtime) so an unchanged
+    file is not read again.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    memo = {}
+    if memo_path is not None and os.path.exists(memo_path):
+        try:
+            with open(memo_path, "r") as f:
+                memo = json.load(f)
+        except (OSError, ValueError):
+            memo = {}
+        entry = memo.get(path)
+        if entry is not None and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return entry[2]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_BLOCK_SIZE), b""):
+            digest.update(block)
+    digest = digest.hexdigest()
+
+    if memo_path is not None:
+        memo[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        save_json(memo_path, memo)
+    return digest
+
+
+def code_digest(objects):
+    """SHA-256 of the source code of functions and classes"""
+    digest = hashlib.sha256()
+    for obj in objects:
+        digest.update(inspect.getsource(obj).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class FeatureCache:
+    """Directory of cache entries named by the hash of their inputs"""
+
+    def __init__(self, directory, keep=3):
+        self.directory = directory
+        self.keep = keep
+
+    @staticmethod
+    def key(**parts):
+        """Hash of JSON-serializable inputs"""
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def lookup(self, key):
+        """Directory of a complete entry, or None"""
+        path = self.path(key)
+        if not os.path.exists(os.path.join(path, "manifest.json")):
+            return None
+        # Mark as recently used for pruning
+        os.utime(os.path.join(path, "manifest.json"))
+        return path
+
+    @contextmanager
+    def writer(self, key, **manifest):
+        """Directory to write a new entry into; it becomes visible on success"""
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = os.path.join(self.directory, f".tmp-{key}-{os.getpid()}")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        try:
+            yield tmp_path
+            with open(os.path.join(tmp_path, "manifest.json"), "w") as f:
+                json.dump({'key': key, 'created': time.strftime("%Y%m%d%H%M%S"), **manifest}, f, indent=4)
+            shutil.rmtree(self.path(key), ignore_errors=True)
+            os.replace(tmp_path, self.path(key))
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        self.prune()
+
+    def entries(self):
+        """Complete entries as (last used, key), most recent first"""
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for name in os.listdir(self.directory):
+            manifest_path = os.path.join(self.directory, name, "manifest.json")
+            if not name.startswith(".") and os.path.exists(manifest_path):
+                entries.append((os.stat(manifest_path).st_mtime_ns, name))
+        return sorted(entries, reverse=True)
+
+    def prune(self):
+        """Remove all but the keep most recently used entries"""
+        for _, name in self.entries()[self.keep:]:
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,143 @@
+"""
+Reference (row-wise) feature pipeline
+-------------------------------------
+The original preprocess_data and engineer_features, kept unchanged so the
+vectorized versions in monthly.py can be checked against them.
+
+Usage:
+    python feature_reference.py [data.csv]
+"""
+
+import sys
+
+import pandas as pd
+
+
+def preprocess_data(df):
+    """Preprocess the dataset for training"""
+    # Make a copy to avoid modifying the original
+    df = df.copy()
+    
+    # Convert date to datetime and extract month and year
+    df['Date'] = pd.to_datetime(df['Date'])
+    df['Month'] = df['Date'].dt.month
+    df['Year'] = df['Date'].dt.year
+    df['Month_Year'] = df['Date'].dt.strftime('%Y-%m')
+    df['Month_Num'] = (df['Year'] - df['Year'].min()) * 12 + df['Month']
+    
+    # Extract grid components
+    df['Grid_Row'] = df['Grid Position'].str[0]
+    
+    try:
+        df['Grid_Col'] = df['Grid Position'].str[1:].astype(int)
+    except ValueError:
+        df['Grid_Col'] = df['Grid Position'].str.extract(r'[A-Za-z](\d+)', expand=False).fillna(1).astype(int)
+        
+    # Convert categorical variables
+    df['Competitor_Presence_Binary'] = (df['Competitor Presence'] == 'Yes').astype(int)
+    
+    # Create aggregated dataset
+    monthly_grid_sales = df.groupby(['Product Name', 'Grid Position', 'Month_Year', 'Month_Num']).agg({
+        'Quantity': 'sum',
+        'Profit Margin (%)': 'mean',
+        'Total Profit ($)': 'sum',
+        'Competitor_Presence_Binary': 'mean',
+        'Competitor Product Impact': 'mean',
+        'Product Sales Velocity': 'mean',
+        'Month': 'first',
+        'Year': 'first',
+        'Product Line': 'first',
+        'Product Size Category': 'first',
+        'Grid_Row': 'first',
+        'Grid_Col': 'first',
+        'Buying Decision': lambda x: x.mode().iloc[0] if not x.mode().empty else 'Unknown'
+    }).reset_index()
+    
+    # Create features for seasonality
+    monthly_grid_sales['Season'] = pd.cut(
+        monthly_grid_sales['Month'],
+        bins=[0, 3, 6, 9, 12],
+        labels=['Winter', 'Spring', 'Summer', 'Fall'],
+        include_lowest=True
+    )
+    
+    return df, monthly_grid_sales
+
+def engineer_features(monthly_sales):
+    """Create additional features for better prediction performance"""
+    df = monthly_sales.copy()
+    
+    # Calculate grid popularity across all products
+    grid_popularity = df.groupby('Grid Position')['Quantity'].sum().reset_index()
+    grid_popularity.columns = ['Grid Position', 'Grid_Popularity']
+    df = pd.merge(df, grid_popularity, on='Grid Position', how='left')
+    
+    # Calculate product popularity across all grids
+    product_popularity = df.groupby('Product Name')['Quantity'].sum().reset_index()
+    product_popularity.columns = ['Product Name', 'Product_Popularity']
+    df = pd.merge(df, product_popularity, on='Product Name', how='left')
+    
+    # Grid row and column popularity
+    df['Row_Popularity'] = df.groupby('Grid_Row')['Quantity'].transform('sum')
+    df['Col_Popularity'] = df.groupby('Grid_Col')['Quantity'].transform('sum')
+    
+    # Calculate distance from center (C3)
+    def calculate_grid_distance(row):
+        try:
+            row_num = ord(row['Grid_Row']) - ord('A') + 1
+            col_num = row['Grid_Col']
+            center_row, center_col = 3, 3  # C3 position
+            return ((row_num - center_row) ** 2 + (col_num - center_col) ** 2) ** 0.5
+        except (TypeError, ValueError):
+            return 0
+            
+    df['Distance_From_Center'] = df.apply(calculate_grid_distance, axis=1)
+    
+    # Competitor impact ratio with safe division
+    df['Competitor_Impact_Ratio'] = df['Competitor Product Impact'] / df['Quantity'].clip(lower=1)
+    
+    # Add premium location indicator
+    def premium_location(row):
+        row_letter = row['Grid_Row']
+        col_num = row['Grid_Col']
+        
+        # Corners and edges are premium
+        if row_letter in ['A', 'E'] or col_num in [1, 5]:
+            return 1
+        return 0
+        
+    df['Premium_Location'] = df.apply(premium_location, axis=1)
+    
+    # Add trend features
+    df = df.sort_values(['Product Name', 'Grid Position', 'Month_Num'])
+    df['Sales_Previous_Month'] = df.groupby(['Product Name', 'Grid Position'])['Quantity'].shift(1)
+    df['Sales_Growth'] = df['Quantity'] - df['Sales_Previous_Month']
+    df['Sales_Growth_Pct'] = df['Sales_Growth'] / df['Sales_Previous_Month'].clip(lower=1)
+    
+    # Fill NaN values
+    df['Sales_Previous_Month'] = df['Sales_Previous_Month'].fillna(df['Quantity'])
+    df['Sales_Growth'] = df['Sales_Growth'].fillna(0)
+    df['Sales_Growth_Pct'] = df['Sales_Growth_Pct'].fillna(0)
+    
+    return df
+
+
+def check_features(df):
+    """Assert that monthly.py produces exactly the reference frames for df"""
+    import monthly
+
+    expected_raw, expected_monthly = preprocess_data(df)
+    actual_raw, actual_monthly = monthly.preprocess_data(df)
+    pd.testing.assert_frame_equal(actual_raw, expected_raw)
+    pd.testing.assert_frame_equal(actual_monthly, expected_monthly)
+
+    expected = engineer_features(expected_monthly)
+    actual = monthly.engineer_features(actual_monthly)
+    pd.testing.assert_frame_equal(actual, expected)
+    return actual
+
+
+if __name__ == "__main__":
+    data_file = sys.argv[1] if len(sys.argv) > 1 else "data.csv"
+    features = check_features(pd.read_csv(data_file))
+    print(f"Vectorized features match the reference implementation ({len(features)} rows)")
@@ -0,0 +1,601 @@
+"""
+Serving side of the grid sales model
+------------------------------------
+GridSalesEnsembleModel and load_model, without the training code in
+monthly.py. Importing this module has no side effects and does not import
+sklearn or xgboost; they are imported when the pickled preprocessor and
+estimators are loaded. A model with a prediction table loads those on first
+use, so a server answering from the table starts without them.
+"""
+
+import json
+import logging
+import os
+import pickle
+import threading
+import zlib
+from collections import OrderedDict
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from product_table import ProductTable
+from tree_engine import CompiledEnsemble
+from prediction_table import PredictionTable
+from layouts import DEFAULT_LAYOUT, StoreLayout
+from metrics import observe_stage
+
+# Serving-path messages; the CLI reports through print
+logger = logging.getLogger("advisory.model")
+
+def season_of(month):
+    """Season labels for a Series of month numbers"""
+    return pd.cut(
+        month,
+        bins=[0, 3, 6, 9, 12],
+        labels=['Winter', 'Spring', 'Summer', 'Fall'],
+        include_lowest=True
+    )
+
+# Ensemble model class (no TensorFlow dependencies)
+class GridSalesEnsembleModel:
+    # Feature templates kept for the most recently predicted products
+    TEMPLATE_CACHE_SIZE = 1024
+    
+    def __init__(self):
+        # Internal models
+        self.xgb_model = None
+        self.rf_model_1 = None
+        self.rf_model_2 = None  # Instead of neural network, use a second RF model
+        
+        # Saved model directory the members are loaded from on first use
+        self._member_dir = None
+        self._member_lock = threading.Lock()
+        
+        # All members compiled into one flat-array engine (optional)
+        self.compiled = None
+        
+        # Precomputed predictions for every product x month x grid (optional)
+        self.prediction_table = None
+        
+        # Preprocessor; 'sparse' ones output float32 CSR matrices (same model
+        # as 'dense', the matrix just takes less memory)
+        self.preprocessor = None
+        self.preprocessing = 'dense'
+        
+        # Features
+        self.categorical_features = [
+            'Product Line', 'Product Size Category', 'Buying Decision',
+            'Season', 'Grid_Row'
+        ]
+        self.numerical_features = [
+            'Month', 'Month_Num', 'Grid_Col', 'Competitor_Presence_Binary',
+            'Competitor Product Impact', 'Product Sales Velocity',
+            'Profit Margin (%)', 'Grid_Popularity', 'Product_Popularity',
+            'Row_Popularity', 'Col_Popularity', 'Distance_From_Center',
+            'Competitor_Impact_Ratio', 'Premium_Location',
+            'Sales_Previous_Month', 'Sales_Growth', 'Sales_Growth_Pct'
+        ]
+        
+        # Ensemble weights
+        self.ensemble_weights = {
+            'xgb': 0.4,
+            'rf_1': 0.3,
+            'rf_2': 0.3
+        }
+        
+        # Product data storage
+        self.product_data = {}
+        self.all_grids = []
+        
+        # Store layout the grid positions and their features come from
+        self.layout = DEFAULT_LAYOUT
+
+        # Artifact version and training bookkeeping (from metadata.json)
+        self.version = None
+        self.training_info = {}
+        
+        # Per-product feature templates (least recently used first) and grid
+        # feature vectors for prediction
+        self._templates = OrderedDict()
+        self._template_lock = threading.Lock()
+        self._grid_feature_cache = {}
+    
+    def store_feature_info(self, data):
+        """Store which features are available in the dataset"""
+        # Validate that required columns exist
+        self.categorical_features = [col for col in self.categorical_features if col in data.columns]
+        self.numerical_features = [col for col in self.numerical_features if col in data.columns]
+
+    def store_preprocessor(self, preprocessor):
+        """Store the preprocessor"""
+        self.preprocessor = preprocessor
+        
+    def store_product_data(self, data, layout=None):
+        """Store the latest preprocessed data for each product"""
+        # Store all possible grid positions
+        if layout is not None:
+            self.layout = layout
+        self.all_grids = list(self.layout.grids)
+        
+        self._templates = OrderedDict()
+        self._grid_feature_cache = {}
+        
+        # Get the latest month data for each product and grid in one pass
+        latest_data = (
+            data.sort_values('Month_Num')
+            .groupby(['Product Name', 'Grid Position'])
+            .last()
+            .reset_index()
+        )
+        # Same column order as a per-product groupby('Grid Position')
+        latest_data = latest_data[['Grid Position'] + [col for col in data.columns if col != 'Grid Position']]
+        
+        # Store this for later prediction
+        self.product_data = ProductTable.from_frame(latest_data)
+        self.prediction_table = None
+    
+    def store_models(self, xgb_model, rf_model_1, rf_model_2):
+        """Store the trained models"""
+        self.xgb_model = xgb_model
+        self.rf_model_1 = rf_model_1
+        self.rf_model_2 = rf_model_2
+        self.compiled = None
+        self.prediction_table = None
+    
+    def has_members(self):
+        """Whether the members are loaded or can be loaded on first use"""
+        loaded = self.xgb_model is not None and self.rf_model_1 is not None and self.rf_model_2 is not None
+        return loaded or self._member_dir is not None
+    
+    def _check_member_version(self):
+        """The member directory may have been overwritten by a newer model since loading"""
+        with open(os.path.join(self._member_dir, "metadata.json"), "r") as f:
+            if json.load(f).get("version") != self.version:
+                raise RuntimeError("Model files changed since the model was loaded")
+    
+    def load_preprocessor(self):
+        """Load the preprocessor of a model loaded without it (imports sklearn)"""
+        if self.preprocessor is not None or self._member_dir is None:
+            return
+        with self._member_lock:
+            if self.preprocessor is not None:
+                return
+            logger.info("Loading preprocessor from %s", self._member_dir)
+            preprocessor = joblib.load(os.path.join(self._member_dir, "preprocessor.joblib"))
+            self._check_member_version()
+            self.preprocessor = preprocessor
+    
+    def load_members(self):
+        """Load the estimators (and preprocessor) of a model loaded without them"""
+        self.load_preprocessor()
+        if self.xgb_model is not None or self._member_dir is None:
+            return
+        with self._member_lock:
+            if self.xgb_model is not None:
+                return
+            logger.info("Loading ensemble members from %s", self._member_dir)
+            rf_model_1 = joblib.load(os.path.join(self._member_dir, "rf_model_1.joblib"))
+            rf_model_2 = joblib.load(os.path.join(self._member_dir, "rf_model_2.joblib"))
+            xgb_model = joblib.load(os.path.join(self._member_dir, "xgb_model.joblib"))
+            self._check_member_version()
+            
+            self.rf_model_1 = rf_model_1
+            self.rf_model_2 = rf_model_2
+            self.xgb_model = xgb_model
+    
+    def memory_bytes(self):
+        """Approximate memory of the loaded components
+        
+        Counts the compiled engine, prediction table and product data in full
+        (memory-mapped arrays included), and the preprocessor and members
+        loaded from the model directory by the size of their files.
+        """
+        total = 0
+        for component in (self.compiled, self.prediction_table, self.product_data):
+            total += getattr(component, 'nbytes', 0)
+        if self._member_dir is not None:
+            loaded = {
+                'preprocessor.joblib': self.preprocessor,
+                'xgb_model.joblib': self.xgb_model,
+                'rf_model_1.joblib': self.rf_model_1,
+                'rf_model_2.joblib': self.rf_model_2
+            }
+            for file_name, component in loaded.items():
+                if component is not None:
+                    try:
+                        total += os.path.getsize(os.path.join(self._member_dir, file_name))
+                    except OSError:
+                        pass  # Replaced by a newer model; the old size is unknown
+        return total
+    
+    def compile(self):
+        """Compile the three members and the blend weights into one engine"""
+        self.load_members()
+        n_features = self.xgb_model.get_booster().num_features()
+        return CompiledEnsemble.from_members([
+            (self.xgb_model, self.ensemble_weights['xgb']),
+            (self.rf_model_1, self.ensemble_weights['rf_1']),
+            (self.rf_model_2, self.ensemble_weights['rf_2'])
+        ], n_features)
+        
+    def _grid_features(self, grids):
+        """Grid-specific feature vectors for a list of grid positions"""
+        key = tuple(grids)
+        if key in self._grid_feature_cache:
+            return self._grid_feature_cache[key]
+        
+        positions = self.layout.positions(grids)
+        features = {
+            'Grid_Row': self.layout.grid_rows[positions],
+            'Grid_Col': self.layout.grid_cols[positions],
+            'Distance_From_Center': self.layout.distance[positions],
+            'Premium_Location': self.layout.premium[positions].astype(np.int64)
+        }
+        self._grid_feature_cache[key] = features
+        return features
+    
+    def _product_template(self, product_name):
+        """Feature columns of a product's latest data as NumPy arrays"""
+        with self._template_lock:
+            template = self._templates.get(product_name)
+            if template is not None:
+                self._templates.move_to_end(product_name)
+                return template
+        
+        latest_data = self.product_data[product_name]['latest_data']
+        if len(latest_data) == 0:
+            return None
+        
+        # Row holding each grid's own history (first match, as before)
+        grid_rows = {}
+        for i, grid_pos in enumerate(latest_data['Grid Position']):
+            grid_rows.setdefault(grid_pos, i)
+        
+        columns = {}
+        for feat_list in [self.categorical_features, self.numerical_features]:
+            for col in feat_list:
+                if col in latest_data.columns:
+                    columns[col] = latest_data[col].to_numpy()
+        
+        template = {'grid_rows': grid_rows, 'columns': columns}
+        with self._template_lock:
+            self._templates[product_name] = template
+            while len(self._templates) > self.TEMPLATE_CACHE_SIZE:
+                self._templates.popitem(last=False)
+        return template
+    
+    def _build_prediction_frame(self, product_name, grids_to_predict, month=None):
+        """Build one feature row per requested grid from the product's latest data
+        
+        With month (1-12), the rows are evaluated as that calendar month
+        instead of the month of the latest data.
+        """
+        template = self._product_template(product_name)
+        if template is None:
+            logger.warning("No data available for product %s", product_name)
+            return None
+        
+        # Grids with their own history use that row, the rest are copies of
+        # the first row with the grid position swapped in
+        grid_rows = template['grid_rows']
+        source_rows = np.array([grid_rows.get(grid_pos, -1) for grid_pos in grids_to_predict])
+        has_history = source_rows >= 0
+        source_rows[~has_history] = 0
+        
+        grid_features = self._grid_features(grids_to_predict)
+        columns = {}
+        for col, values in template['columns'].items():
+            columns[col] = values[source_rows]
+        
+        # Only the template rows get the requested grid's row and column
+        for col in ['Grid_Row', 'Grid_Col']:
+            if col in columns:
+                columns[col] = np.where(has_history, columns[col], grid_features[col])
+        
+        # Distance and premium flag are always recomputed for the grid
+        for col in ['Distance_From_Center', 'Premium_Location']:
+            if col in columns:
+                columns[col] = grid_features[col]
+        
+        if month is not None:
+            if 'Month' in columns:
+                columns['Month'] = np.full(len(grids_to_predict), month, dtype=np.int64)
+            if 'Season' in columns:
+                season = str(season_of(pd.Series([month]))[0])
+                columns['Season'] = np.full(len(grids_to_predict), season, dtype=object)
+        
+        return pd.DataFrame(columns)
+    
+    def _predict_frame(self, pred_df, use_compiled=True):
+        """Run the preprocessor and the three ensemble members on a feature frame
+        
+        Small request batches go through the compiled engine when there is
+        one; bulk scoring is faster with use_compiled=False.
+        """
+        # Get features for prediction (only available ones)
+        pred_features = []
+        for feat_list in [self.categorical_features, self.numerical_features]:
+            for col in feat_list:
+                if col in pred_df.columns:
+                    pred_features.append(col)
+        
+        X_pred = pred_df[pred_features]
+        
+        # Preprocess the data
+        self.load_preprocessor()
+        with observe_stage('preprocess'):
+            X_pred_processed = self.preprocessor.transform(X_pred)
+            # Members are fit on dense rows (see member_rows in monthly.py);
+            # XGBoost would take entries left out of a sparse matrix as missing
+            if hasattr(X_pred_processed, 'toarray'):
+                X_pred_processed = X_pred_processed.toarray()
+        
+        # One batched pass over every tree when the members are compiled
+        if use_compiled and self.compiled is not None:
+            with observe_stage('predict_compiled'):
+                return self.compiled.predict(X_pred_processed)
+        
+        # Make predictions with each model
+        self.load_members()
+        with observe_stage('predict_xgb'):
+            xgb_pred = self.xgb_model.predict(X_pred_processed)
+        with observe_stage('predict_rf_1'):
+            rf_1_pred = self.rf_model_1.predict(X_pred_processed)
+        with observe_stage('predict_rf_2'):
+            rf_2_pred = self.rf_model_2.predict(X_pred_processed)
+        
+        # Combine for ensemble prediction
+        return (
+            self.ensemble_weights['xgb'] * xgb_pred +
+            self.ensemble_weights['rf_1'] * rf_1_pred +
+            self.ensemble_weights['rf_2'] * rf_2_pred
+        )
+    
+    def _scale_predictions(self, grids, predictions, rng=None):
+        """Clip, amplify and (with a generator) jitter raw ensemble output
+        
+        predictions may be a single product's vector or a products x grids
+        matrix; the jitter is drawn for all of it in one call.
+        """
+        # Ensure predictions are non-negative and apply amplification
+        predictions = np.maximum(predictions, 0) * 1.5
+        
+        # Add controlled randomness for diversity: premium positions get
+        # -5%..+15%, the rest -10%..+10%
+        if rng is not None:
+            premium = self._grid_features(grids)['Premium_Location'].astype(bool)
+            low = np.where(premium, -0.05, -0.10)
+            high = np.where(premium, 0.15, 0.10)
+            randomness = rng.uniform(low, high, size=predictions.shape)
+            predictions = np.where(predictions > 0, predictions * (1 + randomness), predictions)
+        
+        return predictions
+    
+    @staticmethod
+    def _jitter_rng(product_name, seed):
+        """Jitter generator; a seeded one depends only on (seed, product)"""
+        if seed is None:
+            return np.random.default_rng()
+        return np.random.default_rng([seed, zlib.crc32(product_name.encode('utf-8'))])
+    
+    def _format_predictions(self, grids_to_predict, predictions):
+        """Rank scaled predictions for one product"""
+        # Create results DataFrame
+        results = pd.DataFrame({
+            'Grid Position': grids_to_predict,
+            'Predicted Monthly Sales': np.round(predictions).astype(int)
+        })
+        
+        # Sort by predicted sales in descending order
+        return results.sort_values('Predicted Monthly Sales', ascending=False)
+    
+    def _check_month(self, month):
+        if month is not None and not (isinstance(month, (int, np.integer)) and 1 <= month <= 12):
+            raise ValueError(f"Invalid month: {month}")
+    
+    def _raw_predictions(self, product_name, grids_to_predict, month=None):
+        """Raw ensemble output from the prediction table, else the model"""
+        if self.prediction_table is not None:
+            with observe_stage('predict_table'):
+                predictions = self.prediction_table.lookup(product_name, grids_to_predict, month)
+            if predictions is not None:
+                return predictions
+        
+        pred_df = self._build_prediction_frame(product_name, grids_to_predict, month)
+        if pred_df is None:
+            return None
+        return self._predict_frame(pred_df)
+    
+    def predict_sales(self, product_name, grid=None, jitter=True, seed=None, month=None):
+        """Make predictions for a product using the ensemble model
+        
+        jitter adds the controlled per-grid randomness; pass a seed to make
+        it reproducible (the same seed gives the same output here and in
+        predict_sales_batch), or jitter=False for the plain ensemble output.
+        month (1-12) predicts for that calendar month instead of the month of
+        the product's latest data.
+        """
+        # Check if models are trained
+        if self.prediction_table is None and not self.has_members():
+            logger.warning("Models not trained.")
+            return None
+        
+        # Check if we have stored data for this product
+        if product_name not in self.product_data:
+            logger.warning("No data found for product: %s", product_name)
+            return None
+        
+        try:
+            # If specific grid is requested, filter for that grid
+            if grid is not None:
+                if grid in self.all_grids:
+                    grids_to_predict = [grid]
+                else:
+                    logger.warning("Invalid grid position: %s", grid)
+                    return None
+            else:
+                # Otherwise predict for all grids
+                grids_to_predict = self.all_grids
+            
+            self._check_month(month)
+            raw_predictions = self._raw_predictions(product_name, grids_to_predict, month)
+            if raw_predictions is None:
+                return None
+            
+            rng = self._jitter_rng(product_name, seed) if jitter else None
+            predictions = self._scale_predictions(grids_to_predict, raw_predictions, rng)
+            return self._format_predictions(grids_to_predict, predictions)
+            
+        except Exception as e:
+            logger.warning("Error during prediction: %s", e)
+            return None
+    
+    def predict_sales_batch(self, product_names, jitter=True, seed=None, month=None):
+        """Predict all grids for many products with one predict call per model
+        
+        Products in the prediction table are looked up; one feature frame
+        covering the rest is scored in a single call. Returns (results,
+        errors): results maps each product that could be predicted to the
+        same DataFrame predict_sales returns, errors maps the remaining
+        products to a message.
+        """
+        results = {}
+        errors = {}
+        
+        if self.prediction_table is None and not self.has_members():
+            return results, {product: "Models not trained." for product in product_names}
+        
+        try:
+            self._check_month(month)
+        except ValueError as e:
+            return results, {product: str(e) for product in product_names}
+        
+        # Table lookups, plus one feature frame covering every other product x grid
+        raw_rows = {}
+        frames = []
+        batch_products = []
+        for product_name in dict.fromkeys(product_names):
+            if product_name not in self.product_data:
+                errors[product_name] = f"No data found for product: {product_name}"
+                continue
+            if self.prediction_table is not None and product_name in self.prediction_table:
+                with observe_stage('predict_table'):
+                    raw_rows[product_name] = self.prediction_table.lookup(product_name, self.all_grids, month)
+                continue
+            try:
+                pred_df = self._build_prediction_frame(product_name, self.all_grids, month)
+            except Exception as e:
+                errors[product_name] = f"Error during prediction: {e}"
+                continue
+            if pred_df is None:
+                errors[product_name] = f"No data available for product {product_name}"
+                continue
+            frames.append(pred_df)
+            batch_products.append(product_name)
+        
+        if frames:
+            try:
+                predictions = self._predict_frame(pd.concat(frames, ignore_index=True))
+            except Exception as e:
+                for product_name in batch_products:
+                    errors[product_name] = f"Error during prediction: {e}"
+                batch_products = []
+            else:
+                predictions = predictions.reshape(len(batch_products), len(self.all_grids))
+                raw_rows.update(zip(batch_products, predictions))
+        
+        if not raw_rows:
+            return results, errors
+        
+        # One products x grids matrix, scaled and jittered in one pass; seeded
+        # jitter is drawn per product so it matches predict_sales
+        batch_products = [product_name for product_name in dict.fromkeys(product_names) if product_name in raw_rows]
+        predictions = np.vstack([raw_rows[product_name] for product_name in batch_products])
+        if jitter and seed is not None:
+            predictions = np.vstack([
+                self._scale_predictions(self.all_grids, row, self._jitter_rng(product_name, seed))
+                for product_name, row in zip(batch_products, predictions)
+            ])
+        else:
+            rng = np.random.default_rng() if jitter else None
+            predictions = self._scale_predictions(self.all_grids, predictions, rng)
+        
+        for product_name, product_predictions in zip(batch_products, predictions):
+            results[product_name] = self._format_predictions(self.all_grids, product_predictions)
+        
+        return results, errors
+
+# Function to load the model
+def load_model(model_dir="saved_models/grid_sales_model"):
+    """Load the trained model with all components"""
+    print(f"Loading model from {model_dir}...")
+    
+    if not os.path.exists(model_dir):
+        print(f"Model directory not found: {model_dir}")
+        return None
+    
+    try:
+        # Create a new model instance
+        model = GridSalesEnsembleModel()
+        
+        # Load metadata
+        with open(os.path.join(model_dir, "metadata.json"), "r") as f:
+            metadata = json.load(f)
+        
+        # Set metadata
+        model.categorical_features = metadata["categorical_features"]
+        model.numerical_features = metadata["numerical_features"]
+        model.ensemble_weights = metadata["ensemble_weights"]
+        model.all_grids = metadata["all_grids"]
+        if "layout" in metadata:
+            model.layout = StoreLayout.from_config(metadata["layout"])
+        model.preprocessing = metadata.get("preprocessing", "dense")
+        model.version = metadata.get("version")
+        model.training_info = metadata.get("training", {})
+        
+        # Use the compiled engine and prediction table if they were built
+        # from these members
+        compiled_dir = os.path.join(model_dir, "compiled_ensemble")
+        if os.path.exists(compiled_dir):
+            compiled = CompiledEnsemble.load(compiled_dir)
+            if compiled.source_version == model.version:
+                model.compiled = compiled
+            else:
+                print("Ignoring compiled ensemble from another model version.")
+        
+        prediction_dir = os.path.join(model_dir, "prediction_table")
+        if os.path.exists(prediction_dir):
+            table = PredictionTable.load(prediction_dir)
+            if table.source_version == model.version:
+                model.prediction_table = table
+            else:
+                print("Ignoring prediction table from another model version.")
+        
+        # Load the preprocessor and models; with a prediction table the
+        # preprocessor (and with it sklearn) is only needed for products
+        # missing from it, and with a compiled engine or prediction table the
+        # members are only needed for retraining and rebuilds, so they load
+        # on first use
+        model._member_dir = model_dir
+        if model.prediction_table is None:
+            model.load_preprocessor()
+        if model.compiled is None and model.prediction_table is None:
+            model.load_members()
+        
+        # Load product data (per-product frames are built on first use)
+        table_dir = os.path.join(model_dir, "product_table")
+        if os.path.exists(table_dir):
+            model.product_data = ProductTable.load(table_dir)
+        else:
+            # Artifacts saved before the columnar format
+            with open(os.path.join(model_dir, "product_data.pkl"), "rb") as f:
+                model.product_data = ProductTable.from_records(pickle.load(f))
+        
+        print("Model loaded successfully.")
+        return model
+        
+    except Exception as e:
+        print(f"Error loading model: {e}")
+        return None
@@ -0,0 +1,189 @@
+"""
+Store layouts
+-------------
+A layout describes one store's shelf grid: row and column labels, the
+slotting fee of every position, the center used for the distance feature and
+which rows and columns are eye level, end caps, etc. Positions are numbered
+row-major and every per-position attribute is a NumPy array, so fee and
+eligibility lookups for any number of grids are array indexing.
+
+Layouts are loaded from JSON; everything but rows, cols and fees is optional:
+
+    {
+        "name": "standard",
+        "rows": ["A", "B", "C", "D", "E"],         # top to bottom, no digits
+        "cols": [1, 2, 3, 4, 5],                   # integer column labels
+        "fees": [[5500, 4500, 5000, 4500, 5500],   # one list per row
+                 ...],
+        "center": ["C", 3],                        # default: middle row and column
+        "eye_level_rows": ["C"],                   # default: middle row
+        "large_item_rows": ["A", "E"],             # default: top and bottom rows
+        "small_item_rows": ["B", "C", "D"],        # default: the other rows
+        "end_cols": [1, 5],                        # default: first and last column
+        "premium_rows": ["A", "E"]                 # default: top and bottom rows
+    }
+
+A position is named by its row label followed by its column ("C3", "AB12").
+"""
+
+import json
+import re
+
+import numpy as np
+import pandas as pd
+
+# The original 5x5 store
+DEFAULT_LAYOUT_CONFIG = {
+    'name': 'standard',
+    'rows': ['A', 'B', 'C', 'D', 'E'],
+    'cols': [1, 2, 3, 4, 5],
+    'fees': [
+        [5500, 4500, 5000, 4500, 5500],    # Top row
+        [7200, 6000, 6600, 6000, 7200],    # High row
+        [10000, 8500, 9400, 8500, 10000],  # Eye-level
+        [6000, 5000, 5500, 5000, 6000],    # Low row
+        [4500, 3800, 4200, 3800, 4500]     # Bottom row
+    ]
+}
+
+_GRID_NAME = re.compile(r'^(\D+)(\d+)$')
+
+
+def split_grid_names(names):
+    """Row labels and integer columns for an array of position names
+
+    Names that do not parse keep their first character as the row and get
+    column 1, like the original single-letter parsing.
+    """
+    rows = np.empty(len(names), dtype=object)
+    cols = np.ones(len(names), dtype=np.int64)
+    for i, name in enumerate(names):
+        match = _GRID_NAME.match(name) if isinstance(name, str) else None
+        if match:
+            rows[i] = match.group(1)
+            cols[i] = int(match.group(2))
+        else:
+            rows[i] = name[0] if isinstance(name, str) and name else np.nan
+    return rows, cols
+
+
+class StoreLayout:
+    """Grid positions of one store with per-position NumPy arrays"""
+
+    def __init__(self, rows, cols, fees, name='custom', center=None, eye_level_rows=None,
+                 large_item_rows=None, small_item_rows=None, end_cols=None, premium_rows=None):
+        self.name = name
+        self.rows = [str(row) for row in rows]
+        self.cols = [int(col) for col in cols]
+        n_rows, n_cols = len(self.rows), len(self.cols)
+
+        if not n_rows or not n_cols:
+            raise ValueError("A layout needs at least one row and one column")
+        if any(not row or re.search(r'\d', row) for row in self.rows):
+            raise ValueError("Row labels must be non-empty and contain no digits")
+        if len(set(self.rows)) != n_rows or len(set(self.cols)) != n_cols:
+            raise ValueError("Row and column labels must be unique")
+
+        fee_matrix = np.asarray(fees, dtype=float)
+        if fee_matrix.shape != (n_rows, n_cols):
+            raise ValueError(f"Fee matrix must be {n_rows} x {n_cols}, got {fee_matrix.shape}")
+        self.fee_matrix = fee_matrix
+
+        # Row-major positions
+        self.row_index = np.repeat(np.arange(n_rows), n_cols)
+        self.col_index = np.tile(np.arange(n_cols), n_rows)
+        self.grids = [f"{row}{col}" for row in self.rows for col in self.cols]
+        self._positions = {grid: i for i, grid in enumerate(self.grids)}
+        self._row_positions = {row: i for i, row in enumerate(self.rows)}
+
+        self.fees = fee_matrix.ravel()
+        self.grid_rows = np.array(self.rows, dtype=object)[self.row_index]
+        self.grid_cols = np.array(self.cols, dtype=np.int64)[self.col_index]
+
+        # Distance feature: row steps and column numbers from the center
+        center_row, center_col = center if center is not None else (self.rows[n_rows // 2], self.cols[n_cols // 2])
+        self.center = (str(center_row), int(center_col))
+        self.center_row = self._row_positions[self.center[0]]
+        self.distance = np.sqrt((self.row_index - self.center_row) ** 2 + (self.grid_cols - self.center[1]) ** 2)
+
+        # Defaults only for fields not given; an empty list means none
+        outer_rows = [self.rows[0], self.rows[-1]]
+        if eye_level_rows is None:
+            eye_level_rows = [self.rows[n_rows // 2]]
+        if large_item_rows is None:
+            large_item_rows = outer_rows
+        if small_item_rows is None:
+            small_item_rows = [row for row in self.rows if row not in outer_rows]
+        if end_cols is None:
+            end_cols = [self.cols[0], self.cols[-1]]
+        if premium_rows is None:
+            premium_rows = outer_rows
+        self.eye_level_rows = [str(row) for row in eye_level_rows]
+        self.large_item_rows = [str(row) for row in large_item_rows]
+        self.small_item_rows = [str(row) for row in small_item_rows]
+        self.end_cols = [int(col) for col in end_cols]
+        self.premium_rows = [str(row) for row in premium_rows]
+
+        # Eligibility masks
+        self.eye_level = np.isin(self.grid_rows, self.eye_level_rows)
+        self.large_item = np.isin(self.grid_rows, self.large_item_rows)
+        self.small_item = np.isin(self.grid_rows, self.small_item_rows)
+        self.end_cap = np.isin(self.grid_cols, self.end_cols)
+        self.strategic = self.eye_level | self.end_cap
+        self.premium = np.isin(self.grid_rows, self.premium_rows) | self.end_cap
+
+    def __len__(self):
+        return len(self.grids)
+
+    def __contains__(self, grid):
+        return grid in self._positions
+
+    def positions(self, grids):
+        """Position numbers of a list of grid names"""
+        try:
+            return np.fromiter((self._positions[grid] for grid in grids), dtype=np.int64, count=len(grids))
+        except KeyError as e:
+            raise ValueError(f"Grid position {e.args[0]} is not in layout '{self.name}'") from None
+
+    def row_coordinates(self, row_labels):
+        """Row number of each label in a Series, NaN for unknown rows"""
+        return row_labels.map(self._row_positions).to_numpy(dtype=float)
+
+    def grid_distance(self, row_labels, cols):
+        """Distance from the center for Series of row labels and columns (0 for unknown rows)"""
+        row_num = self.row_coordinates(row_labels)
+        distance = np.sqrt((row_num - self.center_row) ** 2 + (np.asarray(cols, dtype=float) - self.center[1]) ** 2)
+        return np.where(np.isnan(row_num), 0, distance)
+
+    def is_premium(self, row_labels, cols):
+        """Premium flag for Series of row labels and columns"""
+        return (row_labels.isin(self.premium_rows) | pd.Series(cols, index=row_labels.index).isin(self.end_cols)).to_numpy()
+
+    def to_config(self):
+        return {
+            'name': self.name,
+            'rows': self.rows,
+            'cols': self.cols,
+            'fees': self.fee_matrix.tolist(),
+            'center': list(self.center),
+            'eye_level_rows': self.eye_level_rows,
+            'large_item_rows': self.large_item_rows,
+            'small_item_rows': self.small_item_rows,
+            'end_cols': self.end_cols,
+            'premium_rows': self.premium_rows
+        }
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(**config)
+
+
+DEFAULT_LAYOUT = StoreLayout.from_config(DEFAULT_LAYOUT_CONFIG)
+
+
+def load_layout(path=None):
+    """Read a layout JSON file; without a path, the standard 5x5 layout"""
+    if path is None:
+        return DEFAULT_LAYOUT
+    with open(path, "r") as f:
+        return StoreLayout.from_config(json.load(f))
@@ -0,0 +1,209 @@
+"""
+HTTP load test for the optimization endpoint
+--------------------------------------------
+Trains a model on a synthetic data.csv in a scratch directory (see
+synthetic_data.py), starts main:app there under uvicorn and drives POST /
+at one or more concurrency levels. For each level it reports throughput,
+latency percentiles and the error rate; 503 responses from a full worker
+pool are counted separately as rejected. Everything runs on this machine.
+
+Product mix: "uniform" picks products evenly, "zipf" favours a few hot
+products (the usual shape of real traffic, and the best case for the
+prediction cache); --unknown-rate mixes in products that do not exist.
+
+Usage:
+    python load_test.py --concurrency 1 8 32 --duration 20 --workers 2
+    python load_test.py --workdir /tmp/lt --mix zipf --no-cache --output load.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+import pandas as pd
+
+from synthetic_data import write_sales_data
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def prepare_workdir(workdir, products, months, rows, seed):
+    """Synthetic data.csv and a trained model in workdir (kept if already there)"""
+    os.makedirs(workdir, exist_ok=True)
+    if not os.path.exists(os.path.join(workdir, "data.csv")):
+        print(f"Generating {rows} rows for {products} products...")
+        write_sales_data(os.path.join(workdir, "data.csv"), products=products, months=months, rows=rows, seed=seed)
+    if not os.path.exists(os.path.join(workdir, "saved_models", "grid_sales_model", "metadata.json")):
+        print("Training the model...")
+        subprocess.run(
+            [sys.executable, os.path.join(BACKEND_DIR, "monthly.py"), "train", "--data", "data.csv"],
+            cwd=workdir, check=True, stdout=subprocess.DEVNULL
+        )
+    if not os.path.exists(os.path.join(workdir, "saved_models", "grid_sales_model", "metadata.json")):
+        raise RuntimeError(f"No trained model in {workdir}")
+
+
+def start_server(workdir, port, workers, max_in_flight, cache):
+    """Start uvicorn with main:app in workdir and wait until it answers"""
+    env = dict(
+        os.environ,
+        ADVISORY_LOG_LEVEL="OFF",
+        ADVISORY_WORKERS=str(workers),
+        ADVISORY_MAX_IN_FLIGHT=str(max_in_flight),
+        PREDICTION_CACHE_SIZE=os.environ.get("PREDICTION_CACHE_SIZE", "1024") if cache else "0"
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "--app-dir", BACKEND_DIR, "main:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env
+    )
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with status {server.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/queue", timeout=1).status_code == 200:
+                return server
+        except httpx.TransportError:
+            pass
+        time.sleep(0.25)
+    server.terminate()
+    raise RuntimeError("Server did not start within 120s")
+
+
+def product_sampler(product_names, mix, unknown_rate, zipf_s, seed):
+    """Function returning the next product name to request"""
+    rng = np.random.default_rng(seed)
+    if mix == "zipf":
+        weights = 1.0 / np.arange(1, len(product_names) + 1) ** zipf_s
+    else:
+        weights = np.ones(len(product_names))
+    weights = weights / weights.sum()
+
+    def next_product():
+        if unknown_rate and rng.random() < unknown_rate:
+            return f"Unknown Product {rng.integers(1_000_000)}"
+        return product_names[rng.choice(len(product_names), p=weights)]
+    return next_product
+
+
+async def run_level(base_url, concurrency, duration, next_product, timeout):
+    """Closed loop: concurrency clients each sending requests back to back for duration seconds"""
+    latencies = []
+    counts = {'ok': 0, 'app_error': 0, 'rejected': 0, 'http_error': 0, 'failed': 0}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        deadline = time.perf_counter() + duration
+
+        async def client_loop():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/", json={'product_name': next_product()})
+                except httpx.HTTPError:
+                    counts['failed'] += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+                if response.status_code == 503:
+                    counts['rejected'] += 1
+                elif response.status_code != 200:
+                    counts['http_error'] += 1
+                elif response.json().get('status') == 'Error':
+                    counts['app_error'] += 1
+                else:
+                    counts['ok'] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    total = sum(counts.values())
+    errors = total - counts['ok']
+    percentiles = np.percentile(latencies, [50, 95, 99]) * 1000 if latencies else [float('nan')] * 3
+    return {
+        'concurrency': concurrency,
+        'requests': total,
+        'seconds': elapsed,
+        'rps': total / elapsed,
+        'ok_rps': counts['ok'] / elapsed,
+        'p50_ms': float(percentiles[0]),
+        'p95_ms': float(percentiles[1]),
+        'p99_ms': float(percentiles[2]),
+        'mean_ms': float(np.mean(latencies) * 1000) if latencies else float('nan'),
+        'error_rate': errors / total if total else 0.0,
+        **counts
+    }
+
+
+def print_level(result):
+    print(f"{result['concurrency']:>11}{result['requests']:>10}{result['rps']:>10.1f}"
+          f"{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+          f"{result['error_rate']:>9.2%}{result['rejected']:>10}")
+
+
+async def run_load_test(base_url, levels, duration, warmup, next_product, timeout):
+    if warmup > 0:
+        await run_level(base_url, levels[0], warmup, next_product, timeout)
+    print(f"\n{'concurrency':>11}{'requests':>10}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'errors':>9}{'rejected':>10}")
+    results = []
+    for concurrency in levels:
+        result = await run_level(base_url, concurrency, duration, next_product, timeout)
+        print_level(result)
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test POST / of the advisory API")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="concurrency levels to run")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per concurrency level")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds of unmeasured requests first")
+    parser.add_argument("--mix", choices=["uniform", "zipf"], default="uniform", help="product popularity")
+    parser.add_argument("--zipf-s", type=float, default=1.1, help="zipf exponent for --mix zipf")
+    parser.add_argument("--unknown-rate", type=float, default=0.0, help="share of requests for unknown products")
+    parser.add_argument("--products", type=int, default=12)
+    parser.add_argument("--months", type=int, default=24)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=0, help="ADVISORY_WORKERS of the server")
+    parser.add_argument("--max-in-flight", type=int, default=32, help="ADVISORY_MAX_IN_FLIGHT of the server")
+    parser.add_argument("--no-cache", action="store_true", help="disable the prediction cache")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout in seconds")
+    parser.add_argument("--workdir", default=None,
+                        help="directory for the data and model (default: a new temporary one); reused if it has them")
+    parser.add_argument("--output", default=None, help="write the results as JSON")
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="advisory-load-"))
+    prepare_workdir(workdir, args.products, args.months, args.rows, args.seed)
+    product_names = sorted(pd.read_csv(os.path.join(workdir, "data.csv"), usecols=['Product Name'])['Product Name'].unique())
+    next_product = product_sampler(product_names, args.mix, args.unknown_rate, args.zipf_s, args.seed)
+
+    print(f"Starting main:app in {workdir} with {args.workers} workers...")
+    server = start_server(workdir, args.port, args.workers, args.max_in_flight, cache=not args.no_cache)
+    try:
+        results = asyncio.run(run_load_test(
+            f"http://127.0.0.1:{args.port}", args.concurrency,
+            args.duration, args.warmup, next_product, args.timeout
+        ))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                'config': {key: value for key, value in vars(args).items() if key != 'output'},
+                'levels': results
+            }, f, indent=4)
+        print(f"Results saved to {args.output}")
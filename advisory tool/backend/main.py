@@ -1,28 +1,144 @@
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import List, Optional, Union
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 import pandas as pd
 import numpy as np
-from pulp import *
-from monthly import load_model
-
-app = FastAPI()
-
-# Slotting fee dictionary
-slotting_fee = {
-    'A': {'1': 5500, '2': 4500, '3': 5000, '4': 4500, '5': 5500},  # Top row
-    'B': {'1': 7200, '2': 6000, '3': 6600, '4': 6000, '5': 7200},  # High row
-    'C': {'1': 10000, '2': 8500, '3': 9400, '4': 8500, '5': 10000},  # Eye-level
-    'D': {'1': 6000, '2': 5000, '3': 5500, '4': 5000, '5': 6000},   # Low row
-    'E': {'1': 4500, '2': 3800, '3': 4200, '4': 3800, '5': 4500}    # Bottom row
-}
+from inference import load_model
+from artifact_holder import ArtifactHolder
+from product_index import load_product_index
+from layouts import load_layout
+from placement_solver import PlacementProblem, get_solver
+from prediction_cache import PredictionCache, combine_stats
+from worker_pool import WorkerPool, PoolFull
+from model_registry import ModelRegistry, StoreArtifacts
+from metrics import (REGISTRY, STAGE_SECONDS, PLACEMENT_PATHS, WORKER_POOL, PREDICTION_CACHE,
+                     observe_stage, timed_stage)
+
+# Request logging; ADVISORY_LOG_LEVEL=DEBUG shows per-grid details, OFF silences it
+LOG_LEVEL = os.environ.get("ADVISORY_LOG_LEVEL", "WARNING").upper()
+logging.basicConfig(format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("advisory")
+logger.setLevel(logging.CRITICAL + 1 if LOG_LEVEL == "OFF" else LOG_LEVEL)
+
+MODEL_DIR = os.environ.get("GRID_SALES_MODEL_DIR", "saved_models/grid_sales_model")
+MODEL_POLL_SECONDS = float(os.environ.get("GRID_SALES_MODEL_POLL_SECONDS", "30"))
+DATA_PATH = os.environ.get("ADVISORY_DATA_PATH", "data.csv")
+
+# Seed for the prediction jitter; "random" gives unseeded (and uncached) jitter
+JITTER_SEED = os.environ.get("ADVISORY_JITTER_SEED", "42")
+JITTER_SEED = None if JITTER_SEED == "random" else int(JITTER_SEED)
+
+# Repeat predictions for a product are served from memory until the model changes
+prediction_cache = PredictionCache(
+    maxsize=int(os.environ.get("PREDICTION_CACHE_SIZE", "1024")),
+    ttl=float(os.environ.get("PREDICTION_CACHE_TTL_SECONDS", "3600"))
+)
+
+# Loaded once at startup and hot-swapped when the saved model is retrained
+model_holder = ArtifactHolder(
+    MODEL_DIR, timed_stage('model_load', load_model), poll_interval=MODEL_POLL_SECONDS,
+    on_swap=lambda model: prediction_cache.clear()
+)
+
+# Shelf grid, slotting fees and position roles of the store
+store_layout = load_layout(os.environ.get("ADVISORY_LAYOUT_PATH"))
+
+# Per-product aggregates over data.csv, rebuilt when the file changes
+product_index_holder = ArtifactHolder(
+    DATA_PATH, timed_stage('data_load', partial(load_product_index, grids=store_layout.grids)),
+    poll_interval=MODEL_POLL_SECONDS
+)
+
+# Slotting-fee budget of one placement; POST /what-if sweeps other budgets
+# and fee multipliers, up to MAX_WHAT_IF_SCENARIOS combinations per request
+MAX_BUDGET = float(os.environ.get("ADVISORY_MAX_BUDGET", "300"))
+MAX_WHAT_IF_SCENARIOS = int(os.environ.get("ADVISORY_MAX_WHAT_IF_SCENARIOS", "1000"))
+
+# Per-store models under STORES_DIR/<store_id>/, selected by store_id on a
+# request (requests without one use MODEL_DIR and DATA_PATH). Loaded stores
+# are dropped least recently used first beyond STORE_MEMORY_MB per process.
+STORES_DIR = os.environ.get("ADVISORY_STORES_DIR", "stores")
+STORE_MEMORY_MB = float(os.environ.get("ADVISORY_STORE_MEMORY_MB", "2048"))
+store_registry = ModelRegistry(STORES_DIR, STORE_MEMORY_MB * 1024 ** 2, poll_interval=MODEL_POLL_SECONDS)
+
+def init_worker():
+    """Load (and watch) the model and product index in a worker process"""
+    model_holder.start()
+    product_index_holder.start()
+    store_registry.start()
+
+# Prediction and solving run in this many worker processes (0 = in this
+# process); beyond MAX_IN_FLIGHT accepted jobs requests get a 503
+WORKERS = int(os.environ.get("ADVISORY_WORKERS", "0"))
+MAX_IN_FLIGHT = int(os.environ.get("ADVISORY_MAX_IN_FLIGHT", "32"))
+RETRY_AFTER_SECONDS = int(os.environ.get("ADVISORY_RETRY_AFTER_SECONDS", "1"))
+worker_pool = WorkerPool(workers=WORKERS, max_in_flight=MAX_IN_FLIGHT, initializer=init_worker)
+
+@asynccontextmanager
+async def lifespan(app):
+    # With worker processes the artifacts are only loaded in the workers
+    if WORKERS == 0:
+        init_worker()
+    worker_pool.start()
+    yield
+    worker_pool.stop()
+    store_registry.stop()
+    product_index_holder.stop()
+    model_holder.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 class RequestFormat(BaseModel):
     product_name: str
+    store_id: Optional[str] = None
 
-def call_internal_trained_model(product_name):
-    model = load_model("saved_models/grid_sales_model")
-    # Make predictions with just the product name
-    predictions = model.predict_sales(product_name)
+class BatchRequestFormat(BaseModel):
+    product_names: List[str]
+    store_id: Optional[str] = None
+
+class SweepRange(BaseModel):
+    start: float
+    stop: float
+    steps: int = 10
+
+class WhatIfRequestFormat(BaseModel):
+    product_name: str
+    # A list of values or an evenly spaced range; default: the current setting
+    budgets: Optional[Union[List[float], SweepRange]] = None
+    fee_multipliers: Optional[Union[List[float], SweepRange]] = None
+    store_id: Optional[str] = None
+
+def sweep_values(spec, default):
+    """Values of a list or range sweep parameter"""
+    if spec is None:
+        return [default]
+    if isinstance(spec, SweepRange):
+        if spec.steps < 1:
+            raise ValueError("A range needs at least one step")
+        # Checked before the values are built; the scenario limit applies after
+        if spec.steps > MAX_WHAT_IF_SCENARIOS:
+            raise ValueError(f"A range has at most {MAX_WHAT_IF_SCENARIOS} steps, got {spec.steps}")
+        return np.linspace(spec.start, spec.stop, spec.steps).tolist()
+    return list(spec)
+
+def get_store(store_id=None):
+    """Model, product index and layout of a store (None: the default store)"""
+    if store_id is not None:
+        return store_registry.get(store_id)
+    product_index = product_index_holder.get()
+    if product_index is None:
+        raise RuntimeError(f"Product data is not loaded from {DATA_PATH}")
+    # The model is checked where predictions are made
+    return StoreArtifacts(None, model_holder.get(), product_index, store_layout)
+
+def select_target_grids(predictions):
+    """Top 5 predicted grids with their units multiplied by 3"""
     predictions_dict = dict(zip(predictions['Grid Position'], predictions['Predicted Monthly Sales']))
     # Sort and keep top 5 items
     top_5 = dict(sorted(predictions_dict.items(), key=lambda x: x[1], reverse=True)[:5])
@@ -31,372 +147,471 @@ def call_internal_trained_model(product_name):
         top_5[k] *= 3
     return top_5
 
-@app.post("/")
-def main(request: RequestFormat):
-    try:
-        target_grids_with_units = call_internal_trained_model(request.product_name)
-        max_budget = 300
-        data = pd.read_csv("data.csv")
-        #print(f"Loaded {len(data)} rows from {data_file}")
-
-        # Extract target grids
-        target_grids = list(target_grids_with_units.keys())
-        print(f"Target grid positions: {target_grids}")
-
-        # Filter data for the specific product
-        product_data = data[data['Product Name'] == request.product_name]
-
-        if len(product_data) == 0:
-            return {
-                'status': 'Error',
-                'message': f"No data found for product '{request.product_name}'"
-            }
-
-        print(f"Found {len(product_data)} rows for product '{request.product_name}'")
-
-        # Get product line for this product
-        product_line = product_data['Product Line'].iloc[0]
-        print(f"Product line: {product_line}")
-
-        # Calculate product metrics
-        avg_profit_per_unit = product_data['Total Profit ($)'].mean() / product_data['Quantity'].mean()
-        avg_margin = product_data['Profit Margin (%)'].mean()
-        # Use Product Size Category instead of Shelf Space Required
-        product_size = product_data['Product Size Category'].iloc[0]
-        avg_velocity = product_data['Product Sales Velocity'].mean()
-        competitor_present = 'Yes' if any(product_data['Competitor Presence'] == 'Yes') else 'No'
-        buying_decision = product_data['Buying Decision'].iloc[0]  # Use the first occurrence
-
-        # Calculate predicted sales for each grid position
-        predicted_sales = {}
-        all_grid_positions = {}
-
-        # Generate all possible grid positions
-        for shelf in ['A', 'B', 'C', 'D', 'E']:
-            for col in ['1', '2', '3', '4', '5']:
-                grid = shelf + col
-                all_grid_positions[grid] = 0
-
-        # Fill in predicted sales where we have data
-        for grid in all_grid_positions.keys():
-            grid_data = product_data[product_data['Grid Position'] == grid]
-
-            if len(grid_data) > 0:
-                predicted_sales[grid] = grid_data['Quantity'].mean()
-            else:
-                # If no data for this specific grid, use average for product
-                predicted_sales[grid] = product_data['Quantity'].mean() * 0.5  # Conservative estimate
-
-        # Print predicted sales for target grids
-        #print("\nPredicted sales for target grid positions:")
-        for grid in target_grids:
-            print(f"  {grid}: {predicted_sales.get(grid, 0):.2f} units")
-
-        # Calculate net profit for each grid and check for positive net profit
-        grid_profits = {}
-        positive_profit_grids = []
-
-        for grid in target_grids:
-            shelf, col = grid[0], grid[1]
-            sales = predicted_sales.get(grid, 0)
-            revenue = sales * avg_profit_per_unit
-            fee = slotting_fee[shelf][col]
-            net_profit = revenue - fee
-
-            grid_profits[grid] = net_profit
-
-            if net_profit > 0:
-                positive_profit_grids.append(grid)
-
-        # Print net profit analysis
-        #print("\nNet profit analysis for target grid positions:")
-        for grid in target_grids:
-            sales = predicted_sales.get(grid, 0)
-            revenue = sales * avg_profit_per_unit
-            fee = slotting_fee[grid[0]][grid[1]]
-            net = grid_profits[grid]
-            print(f"  {grid}: Sales={sales:.2f}, Revenue=${revenue:.2f}, Fee=${fee:.2f}, Net=${net:.2f}")
-
-        # Check if we have any positive profit grid positions
-        if not positive_profit_grids:
-            #print("\nWarning: No grid positions found with positive net profit!")
-            # For this special case, we'll boost the sales estimate to make optimization possible
-            # This is a temporary measure to ensure we still get results
-            boost_factor = 1.2  # Increase predicted sales by 20%
-            #print(f"Boosting sales estimates by {(boost_factor-1)*100}% to find feasible solutions")
-
-            for grid in target_grids:
-                predicted_sales[grid] *= boost_factor
-                shelf, col = grid[0], grid[1]
-                sales = predicted_sales.get(grid, 0)
-                revenue = sales * avg_profit_per_unit
-                fee = slotting_fee[shelf][col]
-                net_profit = revenue - fee
-
-                grid_profits[grid] = net_profit
-
-                if net_profit > 0:
-                    positive_profit_grids.append(grid)
-
-            # If we still don't have any positive profit grids, prioritize by least negative
-            if not positive_profit_grids:
-                #print("Still no positive profit grids after boosting. Using least negative grids.")
-                grid_items = sorted(grid_profits.items(), key=lambda x: x[1], reverse=True)
-                top_grids = grid_items[:3]
-
-                selected_positions = [g[0] for g in top_grids]
-
-                # Print the shelf layout directly
-                #print("\nRecommended shelf layout:")
-                #print_shelf_layout(selected_positions)
-
-                # Calculate metrics for the selected grids
-                total_sales = sum(predicted_sales.get(pos, 0) for pos in selected_positions)
-                total_fees = sum(slotting_fee[pos[0]][pos[1]] for pos in selected_positions)
-                total_profit = sum(grid_profits[pos] for pos in selected_positions)
-
-                # Print detailed information for each selected grid
-                #print("\nTop 3 grid positions (sorted by profit):")
-                for i, pos in enumerate(selected_positions):
-                    sales = predicted_sales.get(pos, 0)
-                    revenue = sales * avg_profit_per_unit
-                    fee = slotting_fee[pos[0]][pos[1]]
-                    net = grid_profits[pos]
-                    print(f"{i+1}. Position {pos}: Sales={sales:.2f} units, Revenue=${revenue:.2f}, Fee=${fee:.2f}, Net=${net:.2f}")
-
-                #print(f"\nTotal expected sales: {total_sales:.2f} units")
-                #print(f"Total slotting fees: ${total_fees:.2f}")
-                #print(f"Total expected profit: ${total_profit:.2f}")
-
-                return {
-                    'selected_positions': selected_positions,
-                }
-
-        # Create the LP model
-        model = LpProblem(name=f"{request.product_name}_Optimization", sense=LpMaximize)
-
-        # Decision variables: X[grid] = 1 if product is placed in position grid, 0 otherwise
-        X = {}
-        for grid in all_grid_positions.keys():
-            X[grid] = LpVariable(f"X_{grid}", cat='Binary')
-
-        # Objective function: Maximize (Predicted_Sales × Profit_Margin - Slotting_Fee)
-        objective_terms = []
-
-        for grid in all_grid_positions.keys():
-            if grid in target_grids:
-                shelf, col = grid[0], grid[1]
-                sales = predicted_sales.get(grid, 0)
-                profit = sales * avg_profit_per_unit
-                fee = slotting_fee[shelf][col]
-
-                net_profit = profit - fee
-
-                # Add a small sales velocity bonus to break ties
-                velocity_bonus = 0.1 * avg_velocity if avg_velocity > 5 else 0
-
-                objective_terms.append((net_profit + velocity_bonus) * X[grid])
-
-        model += lpSum(objective_terms)
-
-        # CONSTRAINTS
-
-        # 1. Must place the product in at least 1 position
-        model += (lpSum([X[grid] for grid in target_grids]) >= 1, "Minimum_Placement")
-
-        # 2. Maximum of 3 placements (changed from 4)
-        model += (lpSum([X[grid] for grid in all_grid_positions.keys()]) <= 3, "Maximum_Placement")
-
-        # 3. Can only place in the specified target grids
-        for grid in all_grid_positions.keys():
-            if grid not in target_grids:
-                model += (X[grid] == 0, f"Not_Target_{grid}")
-
-        # 4. Budget constraint
-        budget_terms = []
-        for grid in target_grids:
-            shelf, col = grid[0], grid[1]
-            budget_terms.append(slotting_fee[shelf][col] * X[grid])
-        model += (lpSum(budget_terms) <= max_budget, "Budget_Constraint")
-
-        # 5. Additional constraint: At least one position must have positive net profit
-        # This ensures we don't select only negative profit positions
-        if positive_profit_grids:
-            model += (lpSum([X[grid] for grid in positive_profit_grids]) >= 1, "Positive_Profit_Constraint")
-
-        # Constraints specific to product characteristics
-
-        # Check if constraints are compatible with target grids
-        has_c_shelf = any(grid.startswith('C') for grid in target_grids)
-        has_strategic = any(grid.startswith('C') or grid.endswith('1') or grid.endswith('5') for grid in target_grids)
-
-        # 6. Profit Margin Prioritization
-        if avg_margin > 30 and has_c_shelf:
-            eye_level_terms = []
-            for grid in target_grids:
-                if grid.startswith('C'):  # Eye-level positions
-                    eye_level_terms.append(X[grid])
-            if eye_level_terms:
-                model += (lpSum(eye_level_terms) >= 1, "High_Margin_Placement")
-
-        # 7. Competitor Response
-        if competitor_present == 'Yes' and has_c_shelf:
-            competitor_terms = []
-            for grid in target_grids:
-                if grid.startswith('C'):  # Eye-level positions
-                    competitor_terms.append(X[grid])
-            if competitor_terms:
-                model += (lpSum(competitor_terms) >= 1, "Competitor_Response")
-
-        # 8. Product Size Placement (using Product Size Category)
-        if product_size == 'Large':
-            large_product_terms = []
-            valid_shelves = ['A', 'E']  # Top and bottom shelves for large products
-            for grid in target_grids:
-                if grid[0] in valid_shelves:
-                    large_product_terms.append(X[grid])
-            if large_product_terms:
-                model += (lpSum(large_product_terms) >= 1, "Large_Product_Placement")
-
-        # 9. Product Visibility for Small Items
-        if product_size == 'Small':
-            small_product_terms = []
-            valid_shelves = ['B', 'C', 'D']  # Middle shelves for small products
-            for grid in target_grids:
-                if grid[0] in valid_shelves:
-                    small_product_terms.append(X[grid])
-            if small_product_terms:
-                model += (lpSum(small_product_terms) >= 1, "Small_Product_Placement")
-
-        # 10. Impulse Purchase Products
-        if buying_decision == 'Impulsive' and has_strategic:
-            impulse_terms = []
-            for grid in target_grids:
-                if grid.startswith('C') or grid.endswith('1') or grid.endswith('5'):
-                    impulse_terms.append(X[grid])
-            if impulse_terms:
-                model += (lpSum(impulse_terms) >= 1, "Impulse_Placement")
+def predict_products(model, product_names):
+    """Cached ensemble predictions for many products: (results, errors)"""
+    if model is None:
+        raise RuntimeError(f"Model is not loaded from {MODEL_DIR}")
+    # id() tells apart models that share a version (or have none)
+    model_version = (model.version, id(model))
+    results = {}
+    missing = []
+    for product_name in dict.fromkeys(product_names):
+        cached = None
+        if JITTER_SEED is not None:
+            key = PredictionCache.make_key(product_name, model.all_grids, model_version, JITTER_SEED)
+            cached = prediction_cache.get(key)
+        if cached is not None:
+            results[product_name] = cached
+        else:
+            missing.append(product_name)
+
+    errors = {}
+    if missing:
+        # Misses are predicted together; seeded jitter is per product, so the
+        # output does not depend on what else was in the batch
+        computed, errors = model.predict_sales_batch(missing, seed=JITTER_SEED)
+        for product_name, predictions in computed.items():
+            if JITTER_SEED is not None:
+                key = PredictionCache.make_key(product_name, model.all_grids, model_version, JITTER_SEED)
+                prediction_cache.put(key, predictions)
+            results[product_name] = predictions
+
+    return results, errors
+
+def call_internal_trained_model(product_name, store=None):
+    model = (store or get_store()).model
+    # Make predictions with just the product name
+    predictions, errors = predict_products(model, [product_name])
+    if product_name in errors:
+        raise ValueError(errors[product_name])
+    return select_target_grids(predictions[product_name])
+
+def log_positions(positions, sales, fees, avg_profit_per_unit):
+    """Log sales, revenue, fee and net profit for a list of positions"""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    revenue = sales * avg_profit_per_unit
+    for i, pos in enumerate(positions):
+        logger.debug("%d. Position %s: Sales=%.2f units, Revenue=$%.2f, Fee=$%.2f, Net=$%.2f",
+                     i + 1, pos, sales[i], revenue[i], fees[i], revenue[i] - fees[i])
+
+def placement_inputs(product_name, target_grids_with_units, store):
+    """Product aggregates and per-target-grid arrays, or an error dictionary
+
+    Returns (product_stats, grids, positions, sales): the layout positions of
+    the target grids and the predicted sales there (mean quantity where we
+    have data, a conservative half-of-average estimate elsewhere). The
+    product index is built over the layout's positions, so everything is an
+    array lookup.
+    """
+    # Extract target grids
+    target_grids = list(target_grids_with_units.keys())
+    logger.info("Target grid positions for %s: %s", product_name, target_grids)
+
+    # Look up the precomputed aggregates for the specific product
+    product_stats = store.product_index.get(product_name)
+
+    if product_stats is None:
+        return {
+            'status': 'Error',
+            'message': f"No data found for product '{product_name}'"
+        }
 
+    logger.debug("Found %d rows for product '%s', product line %s",
+                 product_stats.row_count, product_name, product_stats.product_line)
+
+    positions = store.layout.positions(target_grids)
+    grids = np.array(target_grids, dtype=object)
+    sales = product_stats.grid_sales[positions]
+    return product_stats, grids, positions, sales
+
+def solve_placements(product_name, layout, product_stats, grids, positions, sales, fees, budgets):
+    """Choose shelf positions among the target grids for each budget
+
+    positions are the target grids' positions in layout and fees their
+    slotting fees. The objective and the
+    constraints only depend on the fees, so they are built once and only the
+    solve is repeated per budget. Returns one (selected indices in layout
+    order, path) pair per budget; path is 'optimal', 'relaxed' or
+    'least_negative'.
+    """
+    # Product metrics
+    avg_profit_per_unit = product_stats.avg_profit_per_unit
+    avg_margin = product_stats.avg_margin
+    # Use Product Size Category instead of Shelf Space Required
+    product_size = product_stats.product_size
+    avg_velocity = product_stats.avg_velocity
+    competitor_present = product_stats.competitor_present
+    buying_decision = product_stats.buying_decision  # First occurrence
+    target_grids = grids.tolist()
+
+    # Calculate net profit for each grid and check for positive net profit
+    net_profit = sales * avg_profit_per_unit - fees
+    positive_profit = net_profit > 0
+
+    logger.debug("Net profit analysis for target grid positions:")
+    log_positions(target_grids, sales, fees, avg_profit_per_unit)
+
+    # Check if we have any positive profit grid positions
+    if not positive_profit.any():
+        # For this special case, we'll boost the sales estimate to make optimization possible
+        # This is a temporary measure to ensure we still get results
+        boost_factor = 1.2  # Increase predicted sales by 20%
+        sales = sales * boost_factor
+        net_profit = sales * avg_profit_per_unit - fees
+        positive_profit = net_profit > 0
+
+        # If we still don't have any positive profit grids, prioritize by least negative
+        if not positive_profit.any():
+            with observe_stage('fallback'):
+                top = np.argsort(-net_profit, kind='stable')[:3]
+
+            logger.info("No positive profit grid for %s, using the least negative ones", product_name)
+            log_positions(grids[top].tolist(), sales[top], fees[top], avg_profit_per_unit)
+            return [(top, 'least_negative')] * len(budgets)
+
+    build_start = time.perf_counter()
+
+    # Objective: Maximize (Predicted_Sales × Profit_Margin - Slotting_Fee)
+    # for every target grid, with a small sales velocity bonus to break ties
+    velocity_bonus = 0.1 * avg_velocity if avg_velocity > 5 else 0
+    objective = net_profit + velocity_bonus
+
+    # CONSTRAINTS
+    # Minimum of 1 and maximum of 3 placements, only in the target grids,
+    # within the budget, plus "at least one of" constraints below
+    constraints = {}
+
+    # 5. Additional constraint: At least one position must have positive net profit
+    # This ensures we don't select only negative profit positions
+    constraints["Positive_Profit_Constraint"] = grids[positive_profit].tolist()
+
+    # Constraints specific to product characteristics; each only applies
+    # when at least one target grid qualifies
+    eye_level = layout.eye_level[positions]
+    strategic = layout.strategic[positions]
+    large_item = layout.large_item[positions]
+    small_item = layout.small_item[positions]
+
+    # 6. Profit Margin Prioritization
+    if avg_margin > 30 and eye_level.any():
+        constraints["High_Margin_Placement"] = grids[eye_level].tolist()
+
+    # 7. Competitor Response
+    if competitor_present == 'Yes' and eye_level.any():
+        constraints["Competitor_Response"] = grids[eye_level].tolist()
+
+    # 8. Product Size Placement (using Product Size Category)
+    # Top and bottom shelves for large products
+    if product_size == 'Large' and large_item.any():
+        constraints["Large_Product_Placement"] = grids[large_item].tolist()
+
+    # 9. Product Visibility for Small Items
+    # Middle shelves for small products
+    if product_size == 'Small' and small_item.any():
+        constraints["Small_Product_Placement"] = grids[small_item].tolist()
+
+    # 10. Impulse Purchase Products
+    if buying_decision == 'Impulsive' and strategic.any():
+        constraints["Impulse_Placement"] = grids[strategic].tolist()
+
+    # Keep the same objective and essential constraints, plus positive
+    # profit and (for impulsive products) strategic positions if possible
+    relaxed_constraints = {}
+    for name in ["Positive_Profit_Constraint", "Impulse_Placement"]:
+        if name in constraints:
+            relaxed_constraints[name] = constraints[name]
+
+    solver = get_solver()
+    STAGE_SECONDS.observe(time.perf_counter() - build_start, stage='lp_build')
+
+    results = []
+    for max_budget in budgets:
         # Solve the model
-        solver = PULP_CBC_CMD(msg=False)
-        result = model.solve(solver)
+        problem = PlacementProblem(
+            f"{product_name}_Optimization", target_grids, objective, fees, max_budget,
+            min_placements=1, max_placements=3, cover_constraints=constraints
+        )
+        with observe_stage('solve'):
+            solution = solver.solve(problem)
+        path = 'optimal'
 
         # Check solution status
-        print(f"\nSolution Status: {LpStatus[model.status]}")
-
-        if LpStatus[model.status] != 'Optimal':
-            print("No optimal solution found with all constraints. Trying with relaxed constraints...")
-
-            # Create a simpler model with relaxed constraints
-            simple_model = LpProblem(f"Simple_{request.product_name}_Optimization", LpMaximize)
-
-            # Keep the same objective function
-            simple_model += lpSum(objective_terms)
-
-            # Include only essential constraints
-            # 1. Must place the product in at least 1 position
-            simple_model += (lpSum([X[grid] for grid in target_grids]) >= 1, "Minimum_Placement")
-
-            # 2. Maximum of 3 placements
-            simple_model += (lpSum([X[grid] for grid in all_grid_positions.keys()]) <= 3, "Maximum_Placement")
-
-            # 3. Can only place in the specified target grids
-            for grid in all_grid_positions.keys():
-                if grid not in target_grids:
-                    simple_model += (X[grid] == 0, f"Not_Target_{grid}")
-
-            # 4. Budget constraint
-            simple_model += (lpSum(budget_terms) <= max_budget, "Budget_Constraint")
-
-            # 5. If possible, include the positive profit constraint
-            if positive_profit_grids:
-                simple_model += (lpSum([X[grid] for grid in positive_profit_grids]) >= 1, "Positive_Profit_Constraint")
-
-            # If product is impulsive, prioritize strategic positions
-            if buying_decision == 'Impulsive' and has_strategic:
-                impulse_terms = []
-                for grid in target_grids:
-                    if grid.startswith('C') or grid.endswith('1') or grid.endswith('5'):
-                        impulse_terms.append(X[grid])
-                if impulse_terms:
-                    simple_model += (lpSum(impulse_terms) >= 1, "Impulse_Placement")
-
-            # Solve the simpler model
-            result = simple_model.solve(solver)
-
-            if LpStatus[simple_model.status] != 'Optimal':
-                print("Still no optimal solution. Selecting the best grid positions based on net profit...")
-
-                # Sort grid positions by net profit
-                grid_items = sorted(grid_profits.items(), key=lambda x: x[1], reverse=True)
-                top_grids = grid_items[:3]
-
-                selected_positions = [g[0] for g in top_grids]
-
-                # Print the shelf layout directly
-                #print("\nRecommended shelf layout:")
-                #print_shelf_layout(selected_positions)
-
-                # Calculate metrics for the selected grids
-                total_sales = sum(predicted_sales.get(pos, 0) for pos in selected_positions)
-                total_fees = sum(slotting_fee[pos[0]][pos[1]] for pos in selected_positions)
-                total_profit = sum(grid_profits[pos] for pos in selected_positions)
-
-                # Print detailed information for each selected grid
-                print("\nTop 3 grid positions (sorted by profit):")
-                for i, pos in enumerate(selected_positions):
-                    sales = predicted_sales.get(pos, 0)
-                    revenue = sales * avg_profit_per_unit
-                    fee = slotting_fee[pos[0]][pos[1]]
-                    net = grid_profits[pos]
-                    print(f"{i+1}. Position {pos}: Sales={sales:.2f} units, Revenue=${revenue:.2f}, Fee=${fee:.2f}, Net=${net:.2f}")
+        logger.info("Solution status for %s: %s", product_name, solution.status)
+
+        if solution.status != 'Optimal':
+            logger.info("No optimal solution for %s with all constraints, relaxing", product_name)
+            path = 'relaxed'
+
+            simple_problem = PlacementProblem(
+                f"Simple_{product_name}_Optimization", target_grids, objective, fees, max_budget,
+                min_placements=1, max_placements=3, cover_constraints=relaxed_constraints
+            )
+            with observe_stage('relaxed_solve'):
+                solution = solver.solve(simple_problem)
+
+            if solution.status != 'Optimal':
+                logger.info("Still no optimal solution for %s, using the best grids by net profit", product_name)
+
+                # Best grid positions by net profit
+                with observe_stage('fallback'):
+                    top = np.argsort(-net_profit, kind='stable')[:3]
+
+                log_positions(grids[top].tolist(), sales[top], fees[top], avg_profit_per_unit)
+                logger.debug("Total expected sales: %.2f units, slotting fees: $%.2f, profit: $%.2f",
+                             sales[top].sum(), fees[top].sum(), net_profit[top].sum())
+                results.append((top, 'least_negative'))
+                continue
+
+        # Extract the solution in layout order
+        selected = np.flatnonzero(np.isin(grids, solution.selected))
+        selected = selected[np.argsort(positions[selected], kind='stable')]
+
+        logger.debug("Objective value: $%.2f", solution.objective_value)
+        log_positions(grids[selected].tolist(), sales[selected], fees[selected], avg_profit_per_unit)
+        logger.debug("Total expected sales: %.2f units, slotting fees: $%.2f, profit: $%.2f",
+                     sales[selected].sum(), fees[selected].sum(), net_profit[selected].sum())
+        results.append((selected, path))
+
+    return results
+
+def optimize_placement(product_name, target_grids_with_units, max_budget=MAX_BUDGET, fee_multiplier=1.0, store=None):
+    """Choose shelf positions for one product among its target grids"""
+    store = store or get_store()
+    inputs = placement_inputs(product_name, target_grids_with_units, store)
+    if isinstance(inputs, dict):
+        PLACEMENT_PATHS.inc(path='error')
+        return inputs
+    product_stats, grids, positions, sales = inputs
+
+    fees = store.layout.fees[positions] * fee_multiplier
+    [(selected, path)] = solve_placements(
+        product_name, store.layout, product_stats, grids, positions, sales, fees, [max_budget]
+    )
+    PLACEMENT_PATHS.inc(path=path)
+
+    return {
+        'selected_positions': grids[selected].tolist(),
+    }
+
+def optimize_product(product_name, store_id=None):
+    """Predict and optimize one product (runs in the worker pool)"""
+    try:
+        store = get_store(store_id)
+        target_grids_with_units = call_internal_trained_model(product_name, store)
+        return optimize_placement(product_name, target_grids_with_units, store=store)
+    except Exception as e:
+        logger.warning("Placement for %s failed: %s", product_name, e)
+        PLACEMENT_PATHS.inc(path='error')
+        return {
+            'status': 'Error',
+            'message': f"An error occurred: {str(e)}"
+        }
 
-                print(f"\nTotal expected sales: {total_sales:.2f} units")
-                print(f"Total slotting fees: ${total_fees:.2f}")
-                print(f"Total expected profit: ${total_profit:.2f}")
+def optimize_batch(product_names, store_id=None):
+    """Optimize many products with one batched model prediction (runs in the worker pool)"""
+    try:
+        store = get_store(store_id)
+        predictions, errors = predict_products(store.model, product_names)
+    except Exception as e:
+        logger.warning("Batch prediction failed: %s", e)
+        PLACEMENT_PATHS.inc(len(product_names), path='error')
+        return {
+            'status': 'Error',
+            'message': f"An error occurred: {str(e)}"
+        }
 
-                return {
-                    'selected_positions': selected_positions,
+    # Failures are reported per product instead of failing the whole batch
+    results = []
+    for product_name in product_names:
+        if product_name in errors:
+            PLACEMENT_PATHS.inc(path='error')
+            result = {
+                'status': 'Error',
+                'message': errors[product_name]
+            }
+        else:
+            try:
+                target_grids_with_units = select_target_grids(predictions[product_name])
+                result = optimize_placement(product_name, target_grids_with_units, store=store)
+            except Exception as e:
+                logger.warning("Placement for %s failed: %s", product_name, e)
+                PLACEMENT_PATHS.inc(path='error')
+                result = {
+                    'status': 'Error',
+                    'message': f"An error occurred: {str(e)}"
                 }
+        results.append({'product_name': product_name, **result})
+
+    return {'results': results}
+
+def pareto_frontier(scenarios):
+    """Distinct placements no other scenario beats on both fees and profit
+
+    Scenarios are compared within one fee schedule; a cheaper schedule
+    would otherwise dominate every other one.
+    """
+    frontier = []
+    best_profit = float('-inf')
+    for scenario in sorted(scenarios, key=lambda s: (s['total_fees'], -s['expected_profit'])):
+        if scenario['expected_profit'] > best_profit:
+            best_profit = scenario['expected_profit']
+            frontier.append({
+                'total_fees': scenario['total_fees'],
+                'expected_profit': scenario['expected_profit'],
+                'selected_positions': scenario['selected_positions']
+            })
+    return frontier
+
+def what_if_product(product_name, budgets, fee_multipliers, store_id=None):
+    """Placements of one product for every budget x fee multiplier (runs in the worker pool)
+
+    The prediction and the per-grid sales are computed once; each fee
+    multiplier builds the objective and constraints once and re-solves them
+    for every budget.
+    """
+    try:
+        with observe_stage('what_if'):
+            store = get_store(store_id)
+            target_grids_with_units = call_internal_trained_model(product_name, store)
+            inputs = placement_inputs(product_name, target_grids_with_units, store)
+            if isinstance(inputs, dict):
+                return inputs
+            product_stats, grids, positions, sales = inputs
+            base_fees = store.layout.fees[positions]
+
+            scenarios = []
+            for fee_multiplier in fee_multipliers:
+                fees = base_fees * fee_multiplier
+                # Reported profit uses the predicted sales as they are
+                net_profit = sales * product_stats.avg_profit_per_unit - fees
+                placements = solve_placements(
+                    product_name, store.layout, product_stats, grids, positions, sales, fees, budgets
+                )
+                for max_budget, (selected, path) in zip(budgets, placements):
+                    scenarios.append({
+                        'max_budget': max_budget,
+                        'fee_multiplier': fee_multiplier,
+                        'selected_positions': grids[selected].tolist(),
+                        'path': path,
+                        'total_fees': round(float(fees[selected].sum()), 2),
+                        'expected_profit': round(float(net_profit[selected].sum()), 2)
+                    })
+    except Exception as e:
+        logger.warning("What-if sweep for %s failed: %s", product_name, e)
+        return {
+            'status': 'Error',
+            'message': f"An error occurred: {str(e)}"
+        }
 
-            model = simple_model
+    return {
+        'product_name': product_name,
+        'scenarios': scenarios,
+        'frontiers': [
+            {
+                'fee_multiplier': fee_multiplier,
+                'points': pareto_frontier([s for s in scenarios if s['fee_multiplier'] == fee_multiplier])
+            }
+            for fee_multiplier in dict.fromkeys(fee_multipliers)
+        ]
+    }
 
-        # Extract the solution
-        selected_positions = []
-        for grid in all_grid_positions.keys():
-            if value(X[grid]) == 1:
-                selected_positions.append(grid)
+def store_registry_stats():
+    """Stores loaded by the process that runs this job"""
+    return {'pid': os.getpid(), **store_registry.stats()}
 
-        # Calculate total predicted sales and total slotting fees
-        total_sales = sum(predicted_sales.get(pos, 0) for pos in selected_positions)
-        total_fees = sum(slotting_fee[pos[0]][pos[1]] for pos in selected_positions)
-        total_profit = sum((predicted_sales.get(pos, 0) * avg_profit_per_unit - slotting_fee[pos[0]][pos[1]]) for pos in selected_positions)
+def run_with_metrics(fn, *args):
+    """Worker process side of a job: the result, the metrics it recorded and
+    the worker's prediction cache stats"""
+    return fn(*args), REGISTRY.drain(), (os.getpid(), prediction_cache.stats())
 
-        print(f"Objective Value: ${value(model.objective):.2f}")
-        print(f"Total Expected Profit: ${total_profit:.2f}")
+# Latest prediction cache stats of each worker process (WORKERS > 0); the
+# cache of this process is not used then
+worker_cache_stats = {}
 
-        # Print the shelf layout directly
-        print("\nRecommended shelf layout:")
-        #print_shelf_layout(selected_positions)
+async def run_job(fn, *args):
+    """Run a job in the worker pool, answering 503 when the queue is full"""
+    try:
+        if WORKERS == 0:
+            return await worker_pool.run(fn, *args)
+        result, worker_metrics, (pid, cache_stats) = await worker_pool.run(run_with_metrics, fn, *args)
+        REGISTRY.merge(worker_metrics)
+        worker_cache_stats[pid] = cache_stats
+        return result
+    except PoolFull:
+        return JSONResponse(
+            status_code=503,
+            content={
+                'status': 'Error',
+                'message': "Server is busy, please retry"
+            },
+            headers={'Retry-After': str(RETRY_AFTER_SECONDS)}
+        )
+    except Exception as e:
+        return {
+            'status': 'Error',
+            'message': f"An error occurred: {str(e)}"
+        }
 
-        # Print detailed information for each selected grid
-        print("\nSelected Grid Positions:")
-        for i, pos in enumerate(selected_positions):
-            sales = predicted_sales.get(pos, 0)
-            profit = sales * avg_profit_per_unit
-            fee = slotting_fee[pos[0]][pos[1]]
-            net = profit - fee
-            print(f"{i+1}. Position {pos}: Sales={sales:.2f} units, Revenue=${profit:.2f}, Fee=${fee:.2f}, Net=${net:.2f}")
+@app.post("/")
+async def main(request: RequestFormat):
+    return await run_job(optimize_product, request.product_name, request.store_id)
 
-        print(f"\nTotal expected sales: {total_sales:.2f} units")
-        print(f"Total slotting fees: ${total_fees:.2f}")
-        print(f"Total expected profit: ${total_profit:.2f}")
+@app.post("/batch")
+async def batch(request: BatchRequestFormat):
+    """Optimize many products with one batched model prediction"""
+    return await run_job(optimize_batch, request.product_names, request.store_id)
 
-        return {
-            'selected_positions': selected_positions,
-        }
-    except Exception as e:
+@app.post("/what-if")
+async def what_if(request: WhatIfRequestFormat):
+    """Sweep slotting-fee budgets and fee multipliers for one product"""
+    try:
+        budgets = sweep_values(request.budgets, MAX_BUDGET)
+        fee_multipliers = sweep_values(request.fee_multipliers, 1.0)
+    except ValueError as e:
+        return {'status': 'Error', 'message': str(e)}
+    if not budgets or not fee_multipliers:
+        return {'status': 'Error', 'message': "Budgets and fee multipliers must not be empty"}
+    if min(budgets) < 0 or min(fee_multipliers) < 0:
+        return {'status': 'Error', 'message': "Budgets and fee multipliers must not be negative"}
+    if len(budgets) * len(fee_multipliers) > MAX_WHAT_IF_SCENARIOS:
         return {
             'status': 'Error',
-            'message': f"An error occurred: {str(e)}"
-        }
\ No newline at end of file
+            'message': f"At most {MAX_WHAT_IF_SCENARIOS} scenarios per request, "
+                       f"got {len(budgets) * len(fee_multipliers)}"
+        }
+    return await run_job(what_if_product, request.product_name, budgets, fee_multipliers, request.store_id)
+
+@app.get("/stores")
+async def stores():
+    """Per-store load, hit and eviction statistics (of one worker process)"""
+    return await run_job(store_registry_stats)
+
+@app.get("/queue")
+def queue_stats():
+    """Worker pool depth: jobs in flight, running and queued, plus counters"""
+    return worker_pool.stats()
+
+@app.get("/metrics")
+def metrics():
+    """Stage latency histograms and placement path counters (Prometheus text format)"""
+    for state, value in worker_pool.stats().items():
+        if isinstance(value, (int, float)):
+            WORKER_POOL.set(value, state=state)
+    for field, value in combined_cache_stats().items():
+        if isinstance(value, (int, float)):
+            PREDICTION_CACHE.set(value, field=field)
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+def combined_cache_stats():
+    """Prediction cache stats summed over the processes that predict
+
+    Worker stats are as of each worker's latest job.
+    """
+    if WORKERS == 0:
+        return combine_stats([prediction_cache.stats()])
+    return combine_stats(list(worker_cache_stats.values()))
+
+@app.get("/prediction-cache")
+def prediction_cache_stats():
+    return combined_cache_stats()
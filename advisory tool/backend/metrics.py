@@ -0,0 +1,216 @@
+"""
+Request metrics in the Prometheus text format
+---------------------------------------------
+Per-stage latency histograms and placement path counters for the advisory
+backend, rendered for GET /metrics without extra dependencies.
+
+Worker processes keep their own registry. Each job hands back drain(),
+the changes since the previous drain, and the API process merge()s them,
+so /metrics covers the whole pool.
+
+Usage:
+    with observe_stage('solve'):
+        solution = solver.solve(problem)
+    PLACEMENT_PATHS.inc(path='optimal')
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from table lookups to model loads
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+
+def _format_labels(labelnames, labels, extra=()):
+    pairs = list(zip(labelnames, labels)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonic count per label set"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def drain(self):
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values):
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0.0) + value
+
+    def samples(self):
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                yield f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge:
+    """Current value per label set, set at scrape time"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def drain(self):
+        # Gauges describe this process only and are not shipped between processes
+        return {}
+
+    def merge(self, values):
+        pass
+
+    def samples(self):
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram:
+    """Bucketed observations per label set"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # label key -> [per-bucket counts (not cumulative), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def drain(self):
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values):
+        with self._lock:
+            for key, (counts, total) in values.items():
+                entry = self._values.get(key)
+                if entry is None:
+                    entry = self._values[key] = [[0] * len(self.buckets), 0.0]
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+
+    def samples(self):
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                    yield f"{self.name}_bucket{labels} {cumulative}"
+                labels = _format_labels(self.labelnames, key)
+                yield f"{self.name}_sum{labels} {_format_value(total)}"
+                yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    """The metrics of one process"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def drain(self):
+        """Changes since the last drain, as a picklable dict (for merge)"""
+        return {metric.name: metric.drain() for metric in self._metrics}
+
+    def merge(self, drained):
+        """Add the changes drained from another process"""
+        for metric in self._metrics:
+            if metric.name in drained:
+                metric.merge(drained[metric.name])
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "advisory_stage_seconds", "Time spent in each request stage", ["stage"]
+))
+PLACEMENT_PATHS = REGISTRY.register(Counter(
+    "advisory_placement_path", "Placement requests by the path that produced the answer", ["path"]
+))
+WORKER_POOL = REGISTRY.register(Gauge(
+    "advisory_worker_pool", "Worker pool state (in_flight, running, queued, ...)", ["state"]
+))
+PREDICTION_CACHE = REGISTRY.register(Gauge(
+    "advisory_prediction_cache", "Prediction cache size and counters, summed over the processes that predict", ["field"]
+))
+
+
+@contextmanager
+def observe_stage(stage):
+    """Time the enclosed block into advisory_stage_seconds{stage=...}"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def timed_stage(stage, fn):
+    """Wrap fn so every call is timed as stage"""
+    def wrapper(*args, **kwargs):
+        with observe_stage(stage):
+            return fn(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,240 @@
+"""
+Per-store models under a memory budget
+--------------------------------------
+Serves the model, product index and layout of many stores from one process.
+Each store is a directory under the stores directory:
+
+    stores/<store_id>/grid_sales_model/   the saved model (its metadata holds
+                                          the store layout)
+    stores/<store_id>/data.csv            the store's sales history
+
+A store is loaded on its first request. Its size is the memory of what is
+loaded: the compiled engine, prediction table and product data (in full,
+also when memory-mapped), the estimators loaded so far and the product
+index. When the loaded stores exceed the memory budget, checked after each
+load and each poll, the least recently used ones are dropped; requests
+still holding one keep using their copy. One background thread checks the loaded stores for retrained
+models and new data.
+
+Usage:
+    registry = ModelRegistry("stores", memory_budget=2 * 1024 ** 3)
+    registry.start()
+    store = registry.get("store-042")
+    store.model.predict_sales(...), store.product_index.get(...), store.layout
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+
+from artifact_holder import ArtifactHolder
+from inference import load_model
+from metrics import timed_stage
+from product_index import load_product_index
+
+# Store ids are directory names; nothing that could leave the stores directory
+STORE_ID = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$')
+
+
+class UnknownStore(Exception):
+    """Raised for store ids that are invalid or have no model"""
+
+
+class StoreArtifacts:
+    """Model, product index and layout of one store"""
+
+    __slots__ = ('store_id', 'model', 'product_index', 'layout')
+
+    def __init__(self, store_id, model, product_index, layout):
+        self.store_id = store_id
+        self.model = model
+        self.product_index = product_index
+        self.layout = layout
+
+
+class _StoreEntry:
+    """Holders and statistics of one store"""
+
+    def __init__(self, store_id, model_dir, data_path):
+        self.store_id = store_id
+        self.model_dir = model_dir
+        self.data_path = data_path
+        self.load_lock = threading.Lock()
+        self.model_holder = None
+        self.index_holder = None
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+        self.last_load_seconds = None
+        self.last_used = None
+
+    @property
+    def loaded(self):
+        return self.model_holder is not None
+
+    @property
+    def nbytes(self):
+        """Memory of the loaded model and product index (0 when not loaded)"""
+        model_holder, index_holder = self.model_holder, self.index_holder
+        if model_holder is None or index_holder is None:
+            return 0
+        return model_holder.get().memory_bytes() + index_holder.get().nbytes
+
+    def load(self):
+        start = time.perf_counter()
+        model_holder = ArtifactHolder(
+            self.model_dir, timed_stage('model_load', load_model), poll_interval=0, name=f"{self.store_id} model"
+        )
+        model_holder.start(watch=False)
+        model = model_holder.get()
+        if model is None:
+            raise RuntimeError(f"Model of store '{self.store_id}' could not be loaded")
+
+        # The product index covers the positions of the store's own layout
+        index_holder = ArtifactHolder(
+            self.data_path, timed_stage('data_load', partial(load_product_index, grids=model.layout.grids)),
+            poll_interval=0, name=f"{self.store_id} data"
+        )
+        index_holder.start(watch=False)
+        if index_holder.get() is None:
+            raise RuntimeError(f"Sales data of store '{self.store_id}' could not be loaded")
+
+        self.model_holder, self.index_holder = model_holder, index_holder
+        self.loads += 1
+        self.last_load_seconds = time.perf_counter() - start
+
+    def unload(self):
+        self.model_holder = None
+        self.index_holder = None
+        self.evictions += 1
+
+    def artifacts(self):
+        model_holder, index_holder = self.model_holder, self.index_holder
+        if model_holder is None or index_holder is None:
+            return None
+        model = model_holder.get()
+        return StoreArtifacts(self.store_id, model, index_holder.get(), model.layout)
+
+    def refresh(self):
+        model_holder, index_holder = self.model_holder, self.index_holder
+        if model_holder is None:
+            return
+        model_holder.refresh()
+        index_holder.refresh()
+
+    def stats(self):
+        return {
+            'loaded': self.loaded,
+            'bytes': self.nbytes,
+            'loads': self.loads,
+            'hits': self.hits,
+            'evictions': self.evictions,
+            'last_load_seconds': self.last_load_seconds,
+            'idle_seconds': None if self.last_used is None else time.monotonic() - self.last_used
+        }
+
+
+class ModelRegistry:
+    """Lazily loaded per-store artifacts with LRU eviction under a memory budget"""
+
+    def __init__(self, stores_dir, memory_budget, poll_interval=30.0,
+                 model_dirname="grid_sales_model", data_filename="data.csv"):
+        self.stores_dir = stores_dir
+        self.memory_budget = memory_budget
+        self.poll_interval = poll_interval
+        self.model_dirname = model_dirname
+        self.data_filename = data_filename
+        # store id -> entry, least recently used first; entries stay after
+        # eviction so their statistics are kept
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._watcher = None
+
+    def _entry(self, store_id):
+        if not isinstance(store_id, str) or not STORE_ID.match(store_id):
+            raise UnknownStore(f"Invalid store id '{store_id}'")
+        with self._lock:
+            entry = self._entries.get(store_id)
+            if entry is None:
+                model_dir = os.path.join(self.stores_dir, store_id, self.model_dirname)
+                if not os.path.exists(os.path.join(model_dir, "metadata.json")):
+                    raise UnknownStore(f"No model found for store '{store_id}'")
+                entry = _StoreEntry(store_id, model_dir, os.path.join(self.stores_dir, store_id, self.data_filename))
+                self._entries[store_id] = entry
+            self._entries.move_to_end(store_id)
+            entry.last_used = time.monotonic()
+            return entry
+
+    def get(self, store_id):
+        """StoreArtifacts of a store, loading it on first use"""
+        entry = self._entry(store_id)
+        artifacts = entry.artifacts()
+        if artifacts is None:
+            # One load per store at a time; other stores are not blocked
+            with entry.load_lock:
+                artifacts = entry.artifacts()
+                if artifacts is None:
+                    entry.load()
+                    artifacts = entry.artifacts()
+            self._evict(keep=store_id)
+        else:
+            entry.hits += 1
+        return artifacts
+
+    def _evict(self, keep):
+        """Drop least recently used stores until the loaded ones fit the budget"""
+        with self._lock:
+            sizes = {store_id: entry.nbytes for store_id, entry in self._entries.items()}
+            used = sum(sizes.values())
+            for store_id, entry in list(self._entries.items()):
+                if used <= self.memory_budget:
+                    break
+                if store_id == keep or not entry.loaded:
+                    continue
+                used -= sizes[store_id]
+                entry.unload()
+                print(f"Evicted store '{store_id}' ({used / 1e6:.0f} MB of "
+                      f"{self.memory_budget / 1e6:.0f} MB in use)")
+
+    def loaded_stores(self):
+        with self._lock:
+            return [store_id for store_id, entry in self._entries.items() if entry.loaded]
+
+    def stats(self):
+        with self._lock:
+            entries = list(self._entries.items())
+        return {
+            'memory_budget': self.memory_budget,
+            'memory_used': sum(entry.nbytes for _, entry in entries),
+            'loaded': sum(entry.loaded for _, entry in entries),
+            'stores': {store_id: entry.stats() for store_id, entry in entries}
+        }
+
+    def start(self):
+        """Start the thread that reloads changed stores"""
+        if self.poll_interval and self._watcher is None:
+            self._stop_event.clear()
+            self._watcher = threading.Thread(target=self._watch, name="watch-stores", daemon=True)
+            self._watcher.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    def _watch(self):
+        while not self._stop_event.wait(self.poll_interval):
+            with self._lock:
+                entries = [entry for entry in self._entries.values() if entry.loaded]
+            for entry in entries:
+                try:
+                    with entry.load_lock:
+                        entry.refresh()
+                except Exception as e:
+                    print(f"Error while reloading store '{entry.store_id}': {e}")
+            self._evict(keep=None)
@@ -8,55 +8,95 @@ import numpy as np
 import pandas as pd
 import os
 import joblib
-import pickle
 import json
 import random
+import shutil
+import time
+import sklearn
 import warnings
+from contextlib import contextmanager
 warnings.filterwarnings('ignore')
 
 # For sklearn models
 from sklearn.ensemble import RandomForestRegressor
-from sklearn.preprocessing import StandardScaler, OneHotEncoder
+from sklearn.preprocessing import StandardScaler, OneHotEncoder, FunctionTransformer
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
 from sklearn.model_selection import train_test_split
+from scipy import sparse
 
 # For XGBoost
 from xgboost import XGBRegressor
 
-# Set random seed for reproducibility
-np.random.seed(42)
-random.seed(42)
+from prediction_table import PredictionTable, MONTH_SLOTS
+from tree_engine import CompiledEnsemble
+from artifact_holder import directory_bytes
+from layouts import DEFAULT_LAYOUT, StoreLayout, load_layout, split_grid_names
+from feature_cache import FeatureCache, file_digest, code_digest
+from atomic_write import save_json
 
-# Create output directories
-os.makedirs("saved_models", exist_ok=True)
+# The model class and loading live in inference.py so serving can import
+# them without the training libraries; re-exported for existing callers
+from inference import GridSalesEnsembleModel, load_model, season_of
 
-# Preprocess data function
-def preprocess_data(df):
-    """Preprocess the dataset for training"""
-    # Make a copy to avoid modifying the original
-    df = df.copy()
+# Training-only data kept outside the serving artifact
+TRAINING_DATA_DIR = os.path.join("saved_models", "grid_sales_model_training")
+
+# Engineered features and training matrices of recent training runs
+FEATURE_CACHE_DIR = os.path.join("saved_models", "feature_cache")
+
+def group_mode(df, keys, column, groups, default='Unknown'):
+    """Most frequent value of column for each row of groups
     
+    Matches Series.mode().iloc[0] per group: ties go to the smallest value,
+    missing values are ignored and groups without any value get default.
+    """
+    counts = df.groupby(keys + [column]).size().reset_index(name='_count')
+    counts = counts.sort_values(['_count', column], ascending=[False, True], kind='stable')
+    modes = counts.drop_duplicates(keys, keep='first').set_index(keys)[column]
+    
+    values = modes.reindex(pd.MultiIndex.from_frame(groups)).to_numpy(dtype=object)
+    values[pd.isna(values)] = default
+    return values
+
+# Columns of data.csv used for training
+RAW_COLUMNS = [
+    'Date', 'Product Name', 'Grid Position', 'Quantity', 'Profit Margin (%)',
+    'Total Profit ($)', 'Competitor Presence', 'Competitor Product Impact',
+    'Product Sales Velocity', 'Product Line', 'Product Size Category', 'Buying Decision'
+]
+
+def add_row_features(df):
+    """Derive the per-row date, grid and competitor columns (in place)"""
     # Convert date to datetime and extract month and year
     df['Date'] = pd.to_datetime(df['Date'])
     df['Month'] = df['Date'].dt.month
     df['Year'] = df['Date'].dt.year
-    df['Month_Year'] = df['Date'].dt.strftime('%Y-%m')
-    df['Month_Num'] = (df['Year'] - df['Year'].min()) * 12 + df['Month']
-    
-    # Extract grid components
-    df['Grid_Row'] = df['Grid Position'].str[0]
+    df['Month_Year'] = df['Date'].dt.to_period('M').astype(str).where(df['Date'].notna())
     
-    try:
-        df['Grid_Col'] = df['Grid Position'].str[1:].astype(int)
-    except ValueError:
-        df['Grid_Col'] = df['Grid Position'].str.extract(r'[A-Za-z](\d+)', expand=False).fillna(1).astype(int)
+    # Extract grid components once per distinct position
+    grid_codes, grid_names = pd.factorize(df['Grid Position'])
+    grid_rows, grid_cols = split_grid_names(list(grid_names) + [np.nan])
+    df['Grid_Row'] = grid_rows[grid_codes]  # code -1 (missing) picks the trailing NaN
+    df['Grid_Col'] = grid_cols[grid_codes]
         
     # Convert categorical variables
     df['Competitor_Presence_Binary'] = (df['Competitor Presence'] == 'Yes').astype(int)
+    return df
+
+# Preprocess data function
+def preprocess_data(df):
+    """Preprocess the dataset for training"""
+    # Make a copy to avoid modifying the original
+    df = add_row_features(df.copy())
+    df.insert(
+        df.columns.get_loc('Month_Year') + 1, 'Month_Num',
+        (df['Year'] - df['Year'].min()) * 12 + df['Month']
+    )
     
     # Create aggregated dataset
-    monthly_grid_sales = df.groupby(['Product Name', 'Grid Position', 'Month_Year', 'Month_Num']).agg({
+    group_keys = ['Product Name', 'Grid Position', 'Month_Year', 'Month_Num']
+    monthly_grid_sales = df.groupby(group_keys).agg({
         'Quantity': 'sum',
         'Profit Margin (%)': 'mean',
         'Total Profit ($)': 'sum',
@@ -68,23 +108,166 @@ def preprocess_data(df):
         'Product Line': 'first',
         'Product Size Category': 'first',
         'Grid_Row': 'first',
-        'Grid_Col': 'first',
-        'Buying Decision': lambda x: x.mode().iloc[0] if not x.mode().empty else 'Unknown'
+        'Grid_Col': 'first'
     }).reset_index()
     
-    # Create features for seasonality
-    monthly_grid_sales['Season'] = pd.cut(
-        monthly_grid_sales['Month'],
-        bins=[0, 3, 6, 9, 12],
-        labels=['Winter', 'Spring', 'Summer', 'Fall'],
-        include_lowest=True
+    # Most frequent buying decision per group
+    monthly_grid_sales['Buying Decision'] = group_mode(
+        df, group_keys, 'Buying Decision', monthly_grid_sales[group_keys]
     )
     
+    # Create features for seasonality
+    monthly_grid_sales['Season'] = season_of(monthly_grid_sales['Month'])
+    
     return df, monthly_grid_sales
 
+class MonthlyAggregator:
+    """Folds raw sales rows into (product, grid, month) aggregates chunk by chunk
+    
+    Keeps sums, non-null counts and first values per group plus buying
+    decision counts, so memory scales with the number of product-grid-months
+    rather than raw rows. result() returns the same monthly frame as
+    preprocess_data.
+    """
+    
+    KEYS = ['Product Name', 'Grid Position', 'Month_Year']
+    SUM_COLUMNS = ['Quantity', 'Total Profit ($)']
+    MEAN_COLUMNS = [
+        'Profit Margin (%)', 'Competitor_Presence_Binary',
+        'Competitor Product Impact', 'Product Sales Velocity'
+    ]
+    FIRST_COLUMNS = ['Month', 'Year', 'Product Line', 'Product Size Category', 'Grid_Row', 'Grid_Col']
+    
+    DEFAULT_COMPACT_ROWS = 1000000
+    
+    def __init__(self, compact_rows=DEFAULT_COMPACT_ROWS):
+        # Partial aggregates are merged once this many rows are pending
+        self.compact_rows = compact_rows
+        self.partial = None
+        self.decision_counts = None
+        self.rows_seen = 0
+        self._pending = []
+        self._pending_counts = []
+        self._pending_rows = 0
+    
+    def add(self, chunk):
+        """Fold a chunk of raw data.csv rows in; returns the group keys it touched"""
+        return self.add_rows(add_row_features(chunk.copy()))
+    
+    def add_rows(self, df):
+        """Fold rows that already have add_row_features applied"""
+        self.rows_seen += len(df)
+        
+        grouped = df.groupby(self.KEYS, sort=False)
+        agg_spec = {col: 'sum' for col in self.SUM_COLUMNS}
+        agg_spec.update({col: 'first' for col in self.FIRST_COLUMNS})
+        part = grouped.agg(agg_spec)
+        for col in self.MEAN_COLUMNS:
+            part[f'{col}__sum'] = grouped[col].sum()
+            part[f'{col}__count'] = grouped[col].count()
+        
+        part = part.reset_index()
+        self._pending.append(part)
+        self._pending_counts.append(
+            df.groupby(self.KEYS + ['Buying Decision']).size().rename('count').reset_index()
+        )
+        self._pending_rows += len(part)
+        
+        if self._pending_rows >= self.compact_rows:
+            self._compact()
+        return part[self.KEYS]
+    
+    def save_state(self, directory):
+        """Persist the partial aggregates (for incremental updates)"""
+        self._compact()
+        self.partial.to_pickle(os.path.join(directory, "monthly_partial.pkl"))
+        self.decision_counts.to_pickle(os.path.join(directory, "decision_counts.pkl"))
+    
+    @classmethod
+    def load_state(cls, directory, compact_rows=DEFAULT_COMPACT_ROWS):
+        """Restore saved partial aggregates, or None if there are none"""
+        partial_path = os.path.join(directory, "monthly_partial.pkl")
+        counts_path = os.path.join(directory, "decision_counts.pkl")
+        if not (os.path.exists(partial_path) and os.path.exists(counts_path)):
+            return None
+        aggregator = cls(compact_rows=compact_rows)
+        aggregator.partial = pd.read_pickle(partial_path)
+        aggregator.decision_counts = pd.read_pickle(counts_path)
+        return aggregator
+    
+    def _compact(self):
+        if not self._pending:
+            return
+        
+        # Older partials come first so 'first' keeps the earliest value
+        parts = ([self.partial] if self.partial is not None else []) + self._pending
+        combined = pd.concat(parts, ignore_index=True)
+        agg_spec = {col: 'sum' for col in combined.columns if col.endswith('__sum') or col.endswith('__count')}
+        agg_spec.update({col: 'sum' for col in self.SUM_COLUMNS})
+        agg_spec.update({col: 'first' for col in self.FIRST_COLUMNS})
+        self.partial = combined.groupby(self.KEYS, sort=False).agg(agg_spec).reset_index()
+        
+        counts = ([self.decision_counts] if self.decision_counts is not None else []) + self._pending_counts
+        self.decision_counts = (
+            pd.concat(counts, ignore_index=True)
+            .groupby(self.KEYS + ['Buying Decision'])['count'].sum()
+            .reset_index()
+        )
+        
+        self._pending = []
+        self._pending_counts = []
+        self._pending_rows = 0
+    
+    def result(self):
+        """The monthly (product, grid, month) frame preprocess_data returns"""
+        self._compact()
+        if self.partial is None:
+            raise ValueError("No rows were aggregated")
+        
+        partial = self.partial
+        monthly = partial[self.KEYS].copy()
+        monthly['Month_Num'] = (partial['Year'] - partial['Year'].min()) * 12 + partial['Month']
+        monthly['Quantity'] = partial['Quantity']
+        for col in ['Profit Margin (%)', 'Total Profit ($)', 'Competitor_Presence_Binary',
+                    'Competitor Product Impact', 'Product Sales Velocity']:
+            if col in self.MEAN_COLUMNS:
+                monthly[col] = partial[f'{col}__sum'] / partial[f'{col}__count'].where(partial[f'{col}__count'] > 0)
+            else:
+                monthly[col] = partial[col]
+        for col in self.FIRST_COLUMNS:
+            monthly[col] = partial[col]
+        
+        # Most frequent buying decision, ties to the smallest value
+        counts = self.decision_counts.sort_values(
+            ['count', 'Buying Decision'], ascending=[False, True], kind='stable'
+        )
+        modes = counts.drop_duplicates(self.KEYS, keep='first').set_index(self.KEYS)['Buying Decision']
+        decisions = modes.reindex(pd.MultiIndex.from_frame(monthly[self.KEYS])).to_numpy(dtype=object)
+        decisions[pd.isna(decisions)] = 'Unknown'
+        monthly['Buying Decision'] = decisions
+        
+        monthly['Season'] = season_of(monthly['Month'])
+        
+        # Same row order as the groupby in preprocess_data
+        return monthly.sort_values(self.KEYS + ['Month_Num'], kind='stable').reset_index(drop=True)
+
+def preprocess_data_chunked(data_file, chunksize=500000, aggregator=None):
+    """Stream data.csv in chunks into the monthly aggregates"""
+    if aggregator is None:
+        aggregator = MonthlyAggregator(compact_rows=chunksize)
+    for chunk in pd.read_csv(data_file, chunksize=chunksize, usecols=lambda col: col in RAW_COLUMNS):
+        aggregator.add(chunk)
+        print(f"  Aggregated {aggregator.rows_seen} rows...")
+    return aggregator.result()
+
 # Engineer features function
-def engineer_features(monthly_sales):
-    """Create additional features for better prediction performance"""
+def engineer_features(monthly_sales, layout=None):
+    """Create additional features for better prediction performance
+    
+    Distance from center and premium positions follow layout (default: the
+    standard 5x5 store).
+    """
+    layout = layout or DEFAULT_LAYOUT
     df = monthly_sales.copy()
     
     # Calculate grid popularity across all products
@@ -101,32 +284,14 @@ def engineer_features(monthly_sales):
     df['Row_Popularity'] = df.groupby('Grid_Row')['Quantity'].transform('sum')
     df['Col_Popularity'] = df.groupby('Grid_Col')['Quantity'].transform('sum')
     
-    # Calculate distance from center (C3)
-    def calculate_grid_distance(row):
-        try:
-            row_num = ord(row['Grid_Row']) - ord('A') + 1
-            col_num = row['Grid_Col']
-            center_row, center_col = 3, 3  # C3 position
-            return ((row_num - center_row) ** 2 + (col_num - center_col) ** 2) ** 0.5
-        except (TypeError, ValueError):
-            return 0
-            
-    df['Distance_From_Center'] = df.apply(calculate_grid_distance, axis=1)
+    # Calculate distance from the layout's center (rows outside it get 0)
+    df['Distance_From_Center'] = layout.grid_distance(df['Grid_Row'], df['Grid_Col'])
     
     # Competitor impact ratio with safe division
     df['Competitor_Impact_Ratio'] = df['Competitor Product Impact'] / df['Quantity'].clip(lower=1)
     
-    # Add premium location indicator
-    def premium_location(row):
-        row_letter = row['Grid_Row']
-        col_num = row['Grid_Col']
-        
-        # Corners and edges are premium
-        if row_letter in ['A', 'E'] or col_num in [1, 5]:
-            return 1
-        return 0
-        
-    df['Premium_Location'] = df.apply(premium_location, axis=1)
+    # Add premium location indicator: corners and edges are premium
+    df['Premium_Location'] = layout.is_premium(df['Grid_Row'], df['Grid_Col']).astype(int)
     
     # Add trend features
     df = df.sort_values(['Product Name', 'Grid Position', 'Month_Num'])
@@ -141,212 +306,321 @@ def engineer_features(monthly_sales):
     
     return df
 
-# Ensemble model class (no TensorFlow dependencies)
-class GridSalesEnsembleModel:
-    def __init__(self):
-        # Internal models
-        self.xgb_model = None
-        self.rf_model_1 = None
-        self.rf_model_2 = None  # Instead of neural network, use a second RF model
-        
-        # Preprocessor
-        self.preprocessor = None
-        
-        # Features
-        self.categorical_features = [
-            'Product Line', 'Product Size Category', 'Buying Decision',
-            'Season', 'Grid_Row'
-        ]
-        self.numerical_features = [
-            'Month', 'Month_Num', 'Grid_Col', 'Competitor_Presence_Binary',
-            'Competitor Product Impact', 'Product Sales Velocity',
-            'Profit Margin (%)', 'Grid_Popularity', 'Product_Popularity',
-            'Row_Popularity', 'Col_Popularity', 'Distance_From_Center',
-            'Competitor_Impact_Ratio', 'Premium_Location',
-            'Sales_Previous_Month', 'Sales_Growth', 'Sales_Growth_Pct'
-        ]
-        
-        # Ensemble weights
-        self.ensemble_weights = {
-            'xgb': 0.4,
-            'rf_1': 0.3,
-            'rf_2': 0.3
-        }
-        
-        # Product data storage
-        self.product_data = {}
-        self.all_grids = []
-    
-    def store_feature_info(self, data):
-        """Store which features are available in the dataset"""
-        # Validate that required columns exist
-        self.categorical_features = [col for col in self.categorical_features if col in data.columns]
-        self.numerical_features = [col for col in self.numerical_features if col in data.columns]
-
-    def store_preprocessor(self, preprocessor):
-        """Store the preprocessor"""
-        self.preprocessor = preprocessor
-        
-    def store_product_data(self, data):
-        """Store preprocessed data for each product"""
-        # Store all possible grid positions
-        self.all_grids = [f"{chr(65 + row)}{col + 1}" for row in range(5) for col in range(5)]
-        
-        # Get unique products
-        unique_products = data['Product Name'].unique()
-        
-        # Store data for each product
-        for product in unique_products:
-            product_data = data[data['Product Name'] == product].copy()
-            
-            if not product_data.empty:
-                # Get the latest month data for each grid
-                latest_data = product_data.sort_values('Month_Num').groupby('Grid Position').last().reset_index()
-                
-                # Store this for later prediction
-                self.product_data[product] = {
-                    'latest_data': latest_data,
-                    'all_data': product_data
-                }
-    
-    def store_models(self, xgb_model, rf_model_1, rf_model_2):
-        """Store the trained models"""
-        self.xgb_model = xgb_model
-        self.rf_model_1 = rf_model_1
-        self.rf_model_2 = rf_model_2
-        
-    def predict_sales(self, product_name, grid=None):
-        """Make predictions for a product using the ensemble model"""
-        # Check if models are trained
-        if self.xgb_model is None or self.rf_model_1 is None or self.rf_model_2 is None:
-            print("Models not trained.")
-            return None
+# Hyperparameters of the ensemble members
+XGB_PARAMS = {
+    'n_estimators': 100,
+    'learning_rate': 0.1,
+    'max_depth': 6,
+    'random_state': 42
+}
+RF_1_PARAMS = {
+    'n_estimators': 100,
+    'max_depth': 10,
+    'random_state': 42
+}
+RF_2_PARAMS = {
+    'n_estimators': 150,  # Different parameters to make it a distinct model
+    'max_depth': 12,
+    'min_samples_split': 5,
+    'random_state': 43  # Different seed
+}
+
+# Preprocessor output: 'dense' float64 arrays, or 'sparse' float32 CSR
+# matrices that store only the nonzero entries. Both modes give the members
+# the same float32 rows (see member_rows), so the fitted models and their
+# predictions are the same. 'sparse' only holds the preprocessed matrix (and
+# its feature cache entry) in less memory: the members are fit and run on a
+# dense copy, so the peak memory of training and inference is unchanged
+# (benchmark.py reports both peaks). Fitting the forests on the sparse
+# matrix directly gives the same trees but is several times slower.
+PREPROCESSING_MODES = ('dense', 'sparse')
+
+def member_rows(X):
+    """Rows as the members are fit and run on: dense float32
+    
+    XGBoost and sklearn split on float32 values, and XGBoost would take the
+    entries a sparse matrix leaves out as missing instead of zero.
+    """
+    if sparse.issparse(X):
+        return X.toarray()
+    return np.asarray(X, dtype=np.float32)
+
+def build_preprocessor(categorical_features, numerical_features, mode='dense'):
+    """One-hot encode categorical and standardize numerical features"""
+    if mode not in PREPROCESSING_MODES:
+        raise ValueError(f"Unknown preprocessing mode '{mode}'")
+    
+    # Define preprocessing steps
+    if mode == 'sparse':
+        categorical_transformer = Pipeline(steps=[
+            ('onehot', OneHotEncoder(handle_unknown='ignore', sparse_output=True, dtype=np.float32))
+        ])
         
-        # Check if we have stored data for this product
-        if product_name not in self.product_data:
-            print(f"No data found for product: {product_name}")
-            return None
+        # Scaled in float64 like the dense mode, then rounded to the float32
+        # values the members would see anyway
+        numerical_transformer = Pipeline(steps=[
+            ('scaler', StandardScaler()),
+            ('float32', FunctionTransformer(np.asarray, kw_args={'dtype': np.float32}))
+        ])
         
-        try:
-            # If specific grid is requested, filter for that grid
-            if grid is not None:
-                if grid in self.all_grids:
-                    grids_to_predict = [grid]
-                else:
-                    print(f"Invalid grid position: {grid}")
-                    return None
-            else:
-                # Otherwise predict for all grids
-                grids_to_predict = self.all_grids
-            
-            # Get stored data for this product
-            product_info = self.product_data[product_name]
-            latest_data = product_info['latest_data']
-            
-            # Create prediction data for each grid
-            prediction_rows = []
-            for grid_pos in grids_to_predict:
-                # Check if we have historical data for this grid
-                grid_data = latest_data[latest_data['Grid Position'] == grid_pos]
-                
-                if len(grid_data) > 0:
-                    # Use actual data for this grid
-                    row = grid_data.iloc[0].copy()
-                else:
-                    # Use data from another grid as template and modify
-                    if len(latest_data) > 0:
-                        row = latest_data.iloc[0].copy()
-                        row['Grid Position'] = grid_pos
-                        row['Grid_Row'] = grid_pos[0]
-                        try:
-                            row['Grid_Col'] = int(grid_pos[1:])
-                        except:
-                            row['Grid_Col'] = 1  # Default
-                    else:
-                        print(f"No data available for product {product_name}")
-                        return None
-                
-                # Update grid-specific features
-                try:
-                    row['Distance_From_Center'] = ((ord(grid_pos[0]) - ord('C')) ** 2 + (int(grid_pos[1:]) - 3) ** 2) ** 0.5
-                except:
-                    row['Distance_From_Center'] = 0
-                    
-                row['Premium_Location'] = 1 if (grid_pos[0] in ['A', 'E'] or grid_pos[1:] in ['1', '5']) else 0
-                
-                prediction_rows.append(row)
-            
-            # Convert to DataFrame
-            pred_df = pd.DataFrame(prediction_rows)
-            
-            # Get features for prediction (only available ones)
-            pred_features = []
-            for feat_list in [self.categorical_features, self.numerical_features]:
-                for col in feat_list:
-                    if col in pred_df.columns:
-                        pred_features.append(col)
-            
-            X_pred = pred_df[pred_features]
-            
-            # Preprocess the data
-            X_pred_processed = self.preprocessor.transform(X_pred)
-            
-            # Make predictions with each model
-            xgb_pred = self.xgb_model.predict(X_pred_processed)
-            rf_1_pred = self.rf_model_1.predict(X_pred_processed)
-            rf_2_pred = self.rf_model_2.predict(X_pred_processed)
-            
-            # Combine for ensemble prediction
-            predictions = (
-                self.ensemble_weights['xgb'] * xgb_pred +
-                self.ensemble_weights['rf_1'] * rf_1_pred +
-                self.ensemble_weights['rf_2'] * rf_2_pred
-            )
-            
-            # Ensure predictions are non-negative and apply amplification
-            predictions = np.maximum(predictions, 0) * 1.5
-            
-            # Add controlled randomness for diversity
-            for i in range(len(predictions)):
-                if predictions[i] > 0:
-                    grid_pos = grids_to_predict[i]
-                    if grid_pos[0] in ['A', 'E'] or grid_pos[1:] in ['1', '5']:
-                        randomness = random.uniform(-0.05, 0.15)
-                    else:
-                        randomness = random.uniform(-0.10, 0.10)
-                    predictions[i] *= (1 + randomness)
-            
-            # Create results DataFrame
-            results = pd.DataFrame({
-                'Grid Position': grids_to_predict,
-                'Predicted Monthly Sales': np.round(predictions).astype(int)
-            })
-            
-            # Sort by predicted sales in descending order
-            results = results.sort_values('Predicted Monthly Sales', ascending=False)
-            
-            return results
-            
-        except Exception as e:
-            print(f"Error during prediction: {e}")
-            return None
+        return ColumnTransformer(
+            transformers=[
+                ('cat', categorical_transformer, categorical_features),
+                ('num', numerical_transformer, numerical_features)
+            ],
+            sparse_threshold=1.0)
+    
+    categorical_transformer = Pipeline(steps=[
+        ('onehot', OneHotEncoder(handle_unknown='ignore', sparse_output=False))
+    ])
+    
+    numerical_transformer = Pipeline(steps=[
+        ('scaler', StandardScaler())
+    ])
+    
+    return ColumnTransformer(
+        transformers=[
+            ('cat', categorical_transformer, categorical_features),
+            ('num', numerical_transformer, numerical_features)
+        ])
 
-# Function to train and save the model
-def train_and_save_model():
-    """Train and save the ensemble model with all components"""
-    print("=== Training Grid Sales Ensemble Model ===")
+RF_PARAMS = {'rf_model_1': RF_1_PARAMS, 'rf_model_2': RF_2_PARAMS}
+
+MEMBER_LABELS = {
+    'xgb_model': 'XGBoost model',
+    'rf_model_1': 'Random Forest model 1',
+    'rf_model_2': 'Random Forest model 2'
+}
+
+# Relative fit time of each member (measured single-core), used to split the
+# training core budget
+MEMBER_COST = {'xgb_model': 0.1, 'rf_model_1': 1.0, 'rf_model_2': 1.7}
+
+def fit_xgb(X_train_processed, y_train, previous=None, n_estimators=None, n_jobs=None):
+    """Fit the XGBoost member, or add n_estimators rounds to a previous one"""
+    params = dict(XGB_PARAMS)
+    if n_estimators is not None:
+        params['n_estimators'] = n_estimators
+    xgb_model = XGBRegressor(**params, n_jobs=n_jobs)
+    X_train_processed = member_rows(X_train_processed)
+    if previous is None:
+        xgb_model.fit(X_train_processed, y_train)
+    else:
+        # Continue boosting from the previous booster's trees
+        xgb_model.fit(X_train_processed, y_train, xgb_model=previous.get_booster())
+    # The training core budget is not a property of the saved model
+    xgb_model.set_params(n_jobs=None)
+    return xgb_model
+
+def _fit_member(name, X_train_processed, y_train, n_jobs):
+    """Fit one ensemble member; returns (name, estimator, wall seconds)"""
+    start = time.perf_counter()
+    if name == 'xgb_model':
+        estimator = fit_xgb(X_train_processed, y_train, n_jobs=n_jobs)
+    else:
+        estimator = RandomForestRegressor(**RF_PARAMS[name], n_jobs=n_jobs)
+        estimator.fit(member_rows(X_train_processed), y_train)
+        estimator.set_params(n_jobs=None)
+    return name, estimator, time.perf_counter() - start
+
+def split_core_budget(n_jobs, members):
+    """Share n_jobs cores between members in proportion to MEMBER_COST
     
-    try:
+    Every member gets at least one core; leftover cores go to the members
+    with the largest remainders.
+    """
+    if n_jobs < len(members):
+        return {name: 1 for name in members}
+    
+    total_cost = sum(MEMBER_COST[name] for name in members)
+    shares = {name: n_jobs * MEMBER_COST[name] / total_cost for name in members}
+    cores = {name: max(1, int(share)) for name, share in shares.items()}
+    by_remainder = sorted(members, key=lambda name: shares[name] - int(shares[name]), reverse=True)
+    for name in by_remainder[:max(0, n_jobs - sum(cores.values()))]:
+        cores[name] += 1
+    return cores
+
+def fit_ensemble_members(X_train_processed, y_train, n_jobs=1, members=tuple(MEMBER_LABELS)):
+    """Fit the ensemble members with a total budget of n_jobs cores
+    
+    With more than one core per member the members are fit concurrently in a
+    process pool, each using its share of the budget for RF trees or XGBoost
+    threads. Otherwise they are fit one after another with all n_jobs cores.
+    Seeds are fixed in the member parameters, so the fitted models are the
+    same either way. Returns ({name: estimator}, {name: wall seconds}).
+    """
+    n_jobs = n_jobs or os.cpu_count() or 1
+    fitted = {}
+    seconds = {}
+    
+    if n_jobs >= len(members) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        
+        cores = split_core_budget(n_jobs, members)
+        print("Training in parallel: " + ", ".join(f"{MEMBER_LABELS[name]} ({cores[name]} cores)" for name in members))
+        with ProcessPoolExecutor(max_workers=len(members)) as pool:
+            futures = [
+                pool.submit(_fit_member, name, X_train_processed, y_train, cores[name])
+                for name in members
+            ]
+            for future in futures:
+                name, estimator, elapsed = future.result()
+                fitted[name] = estimator
+                seconds[name] = elapsed
+    else:
+        for name in members:
+            print(f"Training {MEMBER_LABELS[name]}...")
+            name, estimator, elapsed = _fit_member(name, X_train_processed, y_train, n_jobs)
+            fitted[name] = estimator
+            seconds[name] = elapsed
+    
+    for name in members:
+        print(f"  {MEMBER_LABELS[name]}: {seconds[name]:.2f}s")
+    return fitted, seconds
+
+# Set random seed for reproducibility
+def seed_random_state():
+    """Seed the global random generators (at the start of training, not on import)"""
+    np.random.seed(42)
+    random.seed(42)
+
+# Function to build the training features
+def prepare_training_features(data_file, chunksize, layout, preprocessing='dense'):
+    """Aggregate and engineer data_file and fit the preprocessor
+    
+    Returns (aggregator, processed_data, preprocessor, X_train_processed,
+    y_train).
+    """
+    # Monthly aggregates are persisted so 'update' can fold in new months
+    aggregator = MonthlyAggregator(compact_rows=chunksize or MonthlyAggregator.DEFAULT_COMPACT_ROWS)
+    
+    if chunksize:
+        # Stream the raw rows straight into the monthly aggregates
+        print(f"Streaming {data_file} in chunks of {chunksize} rows...")
+        monthly_data = preprocess_data_chunked(data_file, chunksize, aggregator)
+    else:
         # Load data
         print("Loading data...")
-        df = pd.read_csv("data.csv")
+        df = pd.read_csv(data_file)
         print(f"Data loaded: {df.shape[0]} rows, {df.shape[1]} columns")
         
         # Preprocess data
         print("Preprocessing data...")
         raw_data, monthly_data = preprocess_data(df)
-        processed_data = engineer_features(monthly_data)
-        print("Data preprocessing complete.")
+        aggregator.add_rows(raw_data)
+        del df, raw_data
+    
+    processed_data = engineer_features(monthly_data, layout)
+    del monthly_data
+    print(f"Data preprocessing complete: {len(processed_data)} product-grid-months.")
+    
+    # Features available in the data
+    model = GridSalesEnsembleModel()
+    model.store_feature_info(processed_data)
+    categorical_features = model.categorical_features
+    numerical_features = model.numerical_features
+    
+    # Extract features for training
+    X = processed_data[categorical_features + numerical_features].copy()
+    y = processed_data['Quantity']
+    
+    preprocessor = build_preprocessor(categorical_features, numerical_features, preprocessing)
+    
+    # Fit preprocessor
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    X_train_processed = preprocessor.fit_transform(X_train)
+    
+    return aggregator, processed_data, preprocessor, X_train_processed, y_train.to_numpy()
+
+def matrix_bytes(X):
+    """Memory held by a dense array or sparse matrix"""
+    if sparse.issparse(X):
+        return X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+    return X.nbytes
+
+# Everything the cached training features are computed by
+FEATURE_CODE = [
+    group_mode, add_row_features, season_of, preprocess_data, MonthlyAggregator,
+    preprocess_data_chunked, engineer_features, build_preprocessor, prepare_training_features,
+    GridSalesEnsembleModel.__init__, GridSalesEnsembleModel.store_feature_info,
+    split_grid_names, StoreLayout
+]
+
+def training_feature_key(data_file, chunksize, layout, preprocessing):
+    """Cache key of the training features: data content, feature code, layout and library versions"""
+    os.makedirs(FEATURE_CACHE_DIR, exist_ok=True)
+    return FeatureCache.key(
+        data=file_digest(data_file, memo_path=os.path.join(FEATURE_CACHE_DIR, "file_digests.json")),
+        code=code_digest(FEATURE_CODE),
+        raw_columns=RAW_COLUMNS,
+        chunked=bool(chunksize),
+        preprocessing=preprocessing,
+        layout=layout.to_config(),
+        versions=[np.__version__, pd.__version__, sklearn.__version__]
+    )
+
+def save_training_features(path, aggregator, processed_data, preprocessor, X_train_processed, y_train):
+    """Write training features to a feature cache entry"""
+    aggregator.save_state(path)
+    processed_data.to_pickle(os.path.join(path, "processed_data.pkl"), protocol=5)
+    joblib.dump(preprocessor, os.path.join(path, "preprocessor.joblib"))
+    if sparse.issparse(X_train_processed):
+        sparse.save_npz(os.path.join(path, "X_train.npz"), X_train_processed, compressed=False)
+    else:
+        np.save(os.path.join(path, "X_train.npy"), X_train_processed, allow_pickle=False)
+    np.save(os.path.join(path, "y_train.npy"), y_train, allow_pickle=False)
+
+def load_training_features(path):
+    """Read training features from a feature cache entry (see prepare_training_features)"""
+    sparse_path = os.path.join(path, "X_train.npz")
+    if os.path.exists(sparse_path):
+        X_train_processed = sparse.load_npz(sparse_path)
+    else:
+        X_train_processed = np.load(os.path.join(path, "X_train.npy"), allow_pickle=False)
+    return (
+        MonthlyAggregator.load_state(path),
+        pd.read_pickle(os.path.join(path, "processed_data.pkl")),
+        joblib.load(os.path.join(path, "preprocessor.joblib")),
+        X_train_processed,
+        np.load(os.path.join(path, "y_train.npy"), allow_pickle=False)
+    )
+
+# Function to train and save the model
+def train_and_save_model(data_file="data.csv", chunksize=None, n_jobs=None, layout_path=None,
+                         feature_cache=True, preprocessing='dense'):
+    """Train and save the ensemble model with all components
+    
+    With chunksize, data_file is streamed in chunks of that many rows and
+    only the monthly (product, grid, month) aggregates are held in memory.
+    n_jobs is the total core budget for fitting the members (default: all).
+    layout_path is the store layout JSON (default: the standard 5x5 store).
+    With feature_cache, the features and training matrix are reused from an
+    earlier run on the same data and feature code. preprocessing is one of
+    PREPROCESSING_MODES. Returns whether the model was saved.
+    """
+    print("=== Training Grid Sales Ensemble Model ===")
+    seed_random_state()
+    
+    try:
+        layout = load_layout(layout_path)
+        
+        features = None
+        if feature_cache:
+            cache = FeatureCache(FEATURE_CACHE_DIR)
+            key = training_feature_key(data_file, chunksize, layout, preprocessing)
+            cached_path = cache.lookup(key)
+            if cached_path is not None:
+                print(f"Using cached training features {key[:12]}")
+                features = load_training_features(cached_path)
+        
+        if features is None:
+            features = prepare_training_features(data_file, chunksize, layout, preprocessing)
+            if feature_cache:
+                with cache.writer(key, data_file=os.path.abspath(data_file)) as path:
+                    save_training_features(path, *features)
+        aggregator, processed_data, preprocessor, X_train_processed, y_train = features
+        print(f"Training matrix: {X_train_processed.shape[0]} x {X_train_processed.shape[1]} "
+              f"{preprocessing} ({matrix_bytes(X_train_processed) / 1e6:.1f} MB)")
         
         # Create and train the model
         print("Training ensemble model...")
@@ -357,164 +631,418 @@ def train_and_save_model():
         # 2. Store feature information
         model.store_feature_info(processed_data)
         
-        # 3. Prepare features and preprocessor
-        categorical_features = model.categorical_features
-        numerical_features = model.numerical_features
+        # 3. Train the individual models
+        members, member_seconds = fit_ensemble_members(X_train_processed, y_train, n_jobs=n_jobs)
         
-        # Extract features for training
-        X = processed_data[categorical_features + numerical_features].copy()
-        y = processed_data['Quantity']
+        # 4. Store models, preprocessor, and product data in the model
+        model.store_models(members['xgb_model'], members['rf_model_1'], members['rf_model_2'])
+        model.training_info = {'updates_since_rf_refresh': 0, 'member_seconds': member_seconds}
+        model.store_preprocessor(preprocessor)
+        model.preprocessing = preprocessing
+        model.store_product_data(processed_data, layout)
         
-        # Define preprocessing steps
-        categorical_transformer = Pipeline(steps=[
-            ('onehot', OneHotEncoder(handle_unknown='ignore', sparse_output=False))
-        ])
+        print("Ensemble model training complete.")
         
-        numerical_transformer = Pipeline(steps=[
-            ('scaler', StandardScaler())
-        ])
+        # 5. Save all components
+        model_dir = os.path.join("saved_models", "grid_sales_model")
+        save_model(model, model_dir)
         
-        preprocessor = ColumnTransformer(
-            transformers=[
-                ('cat', categorical_transformer, categorical_features),
-                ('num', numerical_transformer, numerical_features)
-            ])
+        # The monthly history and aggregates are only needed for training,
+        # keep them outside the serving artifact
+        save_training_state(aggregator, processed_data)
+        return True
         
-        # Fit preprocessor
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-        X_train_processed = preprocessor.fit_transform(X_train)
+    except Exception as e:
+        print(f"Error during model training and saving: {e}")
+        return False
+
+def save_training_state(aggregator, processed_data):
+    """Persist the monthly aggregates and engineered history for training"""
+    os.makedirs(TRAINING_DATA_DIR, exist_ok=True)
+    aggregator.save_state(TRAINING_DATA_DIR)
+    processed_data.to_pickle(os.path.join(TRAINING_DATA_DIR, "processed_data.pkl"))
+    print(f"Training history saved to {TRAINING_DATA_DIR}")
+
+# Function to fold new sales into the saved model
+def update_model(new_data_file, model_dir=os.path.join("saved_models", "grid_sales_model"),
+                 chunksize=500000, xgb_rounds=20, rf_refresh_every=3, n_jobs=None):
+    """Update the saved model with new sales rows instead of retraining
+    
+    The new rows are folded into the persisted monthly aggregates, and the
+    popularity and lag features are recomputed from those compact aggregates.
+    XGBoost continues boosting from its previous booster on the
+    product-grid-months the new rows touched. The Random Forests are refit on
+    the full history every rf_refresh_every updates (0 never refits). The
+    fitted preprocessor is kept so the existing trees stay valid. Returns
+    whether the updated model was saved.
+    """
+    print("=== Updating Grid Sales Ensemble Model ===")
+    seed_random_state()
+    
+    try:
+        aggregator = MonthlyAggregator.load_state(TRAINING_DATA_DIR)
+        if aggregator is None:
+            print(f"No training aggregates found in {TRAINING_DATA_DIR}. Run 'train' first.")
+            return False
         
-        # 4. Train the individual models
+        model = load_model(model_dir)
+        if model is None:
+            return False
+        model.load_members()
         
-        # XGBoost
-        print("Training XGBoost model...")
-        xgb_model = XGBRegressor(
-            n_estimators=100,
-            learning_rate=0.1,
-            max_depth=6,
-            random_state=42
-        )
-        xgb_model.fit(X_train_processed, y_train)
+        # 1. Fold the new rows into the aggregates
+        print(f"Adding {new_data_file}...")
+        touched = []
+        for chunk in pd.read_csv(new_data_file, chunksize=chunksize, usecols=lambda col: col in RAW_COLUMNS):
+            touched.append(aggregator.add(chunk))
+        touched = pd.concat(touched, ignore_index=True).drop_duplicates()
+        print(f"  {aggregator.rows_seen} new rows in {len(touched)} product-grid-months")
         
-        # Random Forest model 1
-        print("Training Random Forest model 1...")
-        rf_model_1 = RandomForestRegressor(
-            n_estimators=100,
-            max_depth=10,
-            random_state=42
-        )
-        rf_model_1.fit(X_train_processed, y_train)
-        
-        # Random Forest model 2 (instead of neural network)
-        print("Training Random Forest model 2...")
-        rf_model_2 = RandomForestRegressor(
-            n_estimators=150,  # Different parameters to make it a distinct model
-            max_depth=12,
-            min_samples_split=5,
-            random_state=43  # Different seed
+        processed_data = engineer_features(aggregator.result(), model.layout)
+        features = model.categorical_features + model.numerical_features
+        
+        # 2. Continue boosting on the product-grid-months with new sales
+        new_data = processed_data.merge(touched, on=MonthlyAggregator.KEYS)
+        print("Boosting XGBoost model...")
+        model.xgb_model = fit_xgb(
+            model.preprocessor.transform(new_data[features]), new_data['Quantity'],
+            previous=model.xgb_model, n_estimators=xgb_rounds, n_jobs=n_jobs or os.cpu_count()
         )
-        rf_model_2.fit(X_train_processed, y_train)
         
-        # 5. Store models, preprocessor, and product data in the model
-        model.store_models(xgb_model, rf_model_1, rf_model_2)
-        model.store_preprocessor(preprocessor)
-        model.store_product_data(processed_data)
+        # 3. Refresh the Random Forests on schedule
+        updates = model.training_info.get('updates_since_rf_refresh', 0) + 1
+        if rf_refresh_every and updates >= rf_refresh_every:
+            X_train, X_test, y_train, y_test = train_test_split(
+                processed_data[features], processed_data['Quantity'], test_size=0.2, random_state=42
+            )
+            members, member_seconds = fit_ensemble_members(
+                model.preprocessor.transform(X_train), y_train, n_jobs=n_jobs, members=('rf_model_1', 'rf_model_2')
+            )
+            model.rf_model_1, model.rf_model_2 = members['rf_model_1'], members['rf_model_2']
+            updates = 0
+        else:
+            print(f"Keeping Random Forest models ({updates}/{rf_refresh_every} updates since refresh)")
+        model.training_info['updates_since_rf_refresh'] = updates
         
-        print("Ensemble model training complete.")
+        # 4. Save a new artifact version
+        model.store_product_data(processed_data)
+        save_model(model, model_dir)
+        save_training_state(aggregator, processed_data)
+        return True
         
-        # 6. Save all components
-        model_dir = os.path.join("saved_models", "grid_sales_model")
-        os.makedirs(model_dir, exist_ok=True)
+    except Exception as e:
+        print(f"Error during model update: {e}")
+        return False
+
+def build_prediction_table(model, products_per_batch=256, use_compiled=False):
+    """Score every product x month slot x grid into a PredictionTable
+    
+    Slot 0 uses each product's latest data as is, slots 1-12 evaluate it as
+    that calendar month. Products are scored in batches with the estimators,
+    or with model.compiled when use_compiled (a pruned engine predicts
+    differently from the estimators).
+    """
+    grids = list(model.all_grids)
+    products = []
+    blocks = []
+    batch = []
+    
+    def score(batch):
+        predictions = model._predict_frame(pd.concat(batch, ignore_index=True), use_compiled=use_compiled)
+        return predictions.reshape(-1, MONTH_SLOTS, len(grids))
+    
+    for product_name in model.product_data:
+        frames = [model._build_prediction_frame(product_name, grids)]
+        if frames[0] is None:
+            continue
+        frames += [model._build_prediction_frame(product_name, grids, month) for month in range(1, MONTH_SLOTS)]
+        batch.extend(frames)
+        products.append(product_name)
+        if len(batch) >= products_per_batch * MONTH_SLOTS:
+            blocks.append(score(batch))
+            batch = []
+    if batch:
+        blocks.append(score(batch))
+    
+    values = np.concatenate(blocks) if blocks else np.zeros((0, MONTH_SLOTS, len(grids)))
+    return PredictionTable(values, products, grids)
+
+def replace_directory(new_dir, path):
+    """Move new_dir to path, replacing the directory there
+    
+    Two renames: path is briefly missing, but never holds a mix of old and
+    new files.
+    """
+    old_dir = None
+    if os.path.exists(path):
+        old_dir = f"{new_dir}.old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        os.rename(path, old_dir)
+    os.rename(new_dir, path)
+    if old_dir is not None:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+@contextmanager
+def staged_model_dir(model_dir, copy_existing=False):
+    """Yield a sibling directory to write a model into; it replaces model_dir
+    when the block succeeds and is removed when it fails
+    
+    With copy_existing the directory starts as a copy of model_dir, with
+    files hard-linked where possible (artifact files are replaced by rename,
+    never written in place, so the links are not modified).
+    """
+    model_dir = os.path.normpath(model_dir)
+    write_dir = os.path.join(os.path.dirname(model_dir), f".{os.path.basename(model_dir)}.tmp-{os.getpid()}")
+    shutil.rmtree(write_dir, ignore_errors=True)
+    if copy_existing:
+        shutil.copytree(model_dir, write_dir, copy_function=_link_or_copy)
+    else:
+        os.makedirs(write_dir)
+    try:
+        yield write_dir
+        replace_directory(write_dir, model_dir)
+    except BaseException:
+        shutil.rmtree(write_dir, ignore_errors=True)
+        raise
+
+# Function to save the model
+def save_model(model, model_dir, export_compiled=True, build_table=True):
+    """Save every component of a trained model to model_dir
+    
+    With export_compiled, the members are also exported as a flat-array engine
+    (compiled_ensemble/) that serving uses instead of the estimators. With
+    build_table, every product x month x grid prediction is precomputed
+    (prediction_table/) so serving is a lookup.
+    
+    The model is written to a sibling directory that then replaces model_dir,
+    so a server loading members lazily from model_dir sees either every old
+    file or every new one.
+    """
+    with staged_model_dir(model_dir) as write_dir:
+        version = time.strftime("%Y%m%d%H%M%S")
+        model.load_members()
         
         # Save all models
-        joblib.dump(xgb_model, os.path.join(model_dir, "xgb_model.joblib"))
-        joblib.dump(rf_model_1, os.path.join(model_dir, "rf_model_1.joblib"))
-        joblib.dump(rf_model_2, os.path.join(model_dir, "rf_model_2.joblib"))
+        joblib.dump(model.xgb_model, os.path.join(write_dir, "xgb_model.joblib"))
+        joblib.dump(model.rf_model_1, os.path.join(write_dir, "rf_model_1.joblib"))
+        joblib.dump(model.rf_model_2, os.path.join(write_dir, "rf_model_2.joblib"))
         
         # Save preprocessor
-        joblib.dump(preprocessor, os.path.join(model_dir, "preprocessor.joblib"))
-        
-        # Save product data
-        serializable_product_data = {}
-        for product, data_dict in model.product_data.items():
-            serializable_product_data[product] = {
-                'latest_data': data_dict['latest_data'].to_dict('records'),
-                'all_data': data_dict['all_data'].to_dict('records') 
-            }
-        
-        with open(os.path.join(model_dir, "product_data.pkl"), "wb") as f:
-            pickle.dump(serializable_product_data, f)
-        
-        # Save metadata
-        with open(os.path.join(model_dir, "metadata.json"), "w") as f:
-            json.dump({
-                "categorical_features": categorical_features,
-                "numerical_features": numerical_features,
-                "ensemble_weights": model.ensemble_weights,
-                "all_grids": model.all_grids
-            }, f, indent=4)
-        
-        print(f"\nModel saved to {model_dir}")
-        print("The saved model components include:")
-        print(f"  - XGBoost model (xgb_model.joblib)")
-        print(f"  - Random Forest model 1 (rf_model_1.joblib)")
-        print(f"  - Random Forest model 2 (rf_model_2.joblib)")
-        print(f"  - Preprocessor (preprocessor.joblib)")
-        print(f"  - Product data (product_data.pkl)")
-        print(f"  - Metadata (metadata.json)")
+        joblib.dump(model.preprocessor, os.path.join(write_dir, "preprocessor.joblib"))
         
-    except Exception as e:
-        print(f"Error during model training and saving: {e}")
+        # Save product data as a columnar, memory-mappable table
+        model.product_data.save(os.path.join(write_dir, "product_table"))
+        
+        # Export the compiled engine
+        if export_compiled:
+            model.compiled = model.compile()
+            save_compiled(model, write_dir, version)
+        
+        # Precompute the prediction table
+        if build_table:
+            print("Building prediction table...")
+            model.prediction_table = build_prediction_table(model)
+            save_prediction_table(model, write_dir, version)
+        
+        # Save metadata (last, so a reader never sees new metadata with old components)
+        write_metadata(model, write_dir, version)
+    
+    print(f"\nModel saved to {model_dir}")
+    print("The saved model components include:")
+    print(f"  - XGBoost model (xgb_model.joblib)")
+    print(f"  - Random Forest model 1 (rf_model_1.joblib)")
+    print(f"  - Random Forest model 2 (rf_model_2.joblib)")
+    print(f"  - Preprocessor (preprocessor.joblib)")
+    print(f"  - Product data (product_table/)")
+    if export_compiled:
+        print(f"  - Compiled ensemble (compiled_ensemble/)")
+    if build_table:
+        print(f"  - Prediction table (prediction_table/)")
+    print(f"  - Metadata (metadata.json)")
+
+def save_compiled(model, model_dir, version):
+    """Write model.compiled, tagged with the artifact version it belongs to"""
+    model.compiled.source_version = version
+    model.compiled.save(os.path.join(model_dir, "compiled_ensemble"))
 
-# Function to load the model
-def load_model(model_dir="saved_models/grid_sales_model"):
-    """Load the trained model with all components"""
-    print(f"Loading model from {model_dir}...")
+def save_prediction_table(model, model_dir, version):
+    """Write model.prediction_table, tagged with the artifact version it belongs to"""
+    model.prediction_table.source_version = version
+    model.prediction_table.save(os.path.join(model_dir, "prediction_table"))
+
+def write_metadata(model, model_dir, version):
+    """Write metadata.json; readers treat it as the end of an artifact write"""
+    save_json(os.path.join(model_dir, "metadata.json"), {
+        "categorical_features": model.categorical_features,
+        "numerical_features": model.numerical_features,
+        "ensemble_weights": model.ensemble_weights,
+        "preprocessing": model.preprocessing,
+        "all_grids": model.all_grids,
+        "layout": model.layout.to_config(),
+        "version": version,
+        "training": model.training_info
+    }, indent=4)
+    model.version = version
+
+# Function to compile the members of a saved model
+def compile_saved_model(model_dir=os.path.join("saved_models", "grid_sales_model")):
+    """Export a saved model's members as a compiled engine
     
-    if not os.path.exists(model_dir):
-        print(f"Model directory not found: {model_dir}")
-        return None
+    The engine is checked against the estimator blend on the training
+    history before it is written.
+    """
+    model = load_model(model_dir)
+    if model is None:
+        return
     
-    try:
-        # Create a new model instance
-        model = GridSalesEnsembleModel()
-        
-        # Load metadata
-        with open(os.path.join(model_dir, "metadata.json"), "r") as f:
-            metadata = json.load(f)
-        
-        # Set metadata
-        model.categorical_features = metadata["categorical_features"]
-        model.numerical_features = metadata["numerical_features"]
-        model.ensemble_weights = metadata["ensemble_weights"]
-        model.all_grids = metadata["all_grids"]
-        
-        # Load models
-        model.xgb_model = joblib.load(os.path.join(model_dir, "xgb_model.joblib"))
-        model.rf_model_1 = joblib.load(os.path.join(model_dir, "rf_model_1.joblib"))
-        model.rf_model_2 = joblib.load(os.path.join(model_dir, "rf_model_2.joblib"))
-        
-        # Load preprocessor
-        model.preprocessor = joblib.load(os.path.join(model_dir, "preprocessor.joblib"))
-        
-        # Load product data
-        with open(os.path.join(model_dir, "product_data.pkl"), "rb") as f:
-            serialized_product_data = pickle.load(f)
-            
-        # Convert back to DataFrame format
-        model.product_data = {}
-        for product, data_dict in serialized_product_data.items():
-            model.product_data[product] = {
-                'latest_data': pd.DataFrame(data_dict['latest_data']),
-                'all_data': pd.DataFrame(data_dict['all_data'])
-            }
-        
-        print("Model loaded successfully.")
-        return model
-        
-    except Exception as e:
-        print(f"Error loading model: {e}")
-        return None
+    model.compiled = model.compile()
+    print(f"Compiled {model.compiled.n_trees} trees, {model.compiled.n_nodes} nodes "
+          f"(max depth {model.compiled.max_depth})")
+    
+    history_path = os.path.join(TRAINING_DATA_DIR, "processed_data.pkl")
+    if os.path.exists(history_path):
+        history = pd.read_pickle(history_path)
+        X = model.preprocessor.transform(history[model.categorical_features + model.numerical_features])
+        compiled_pred = model.compiled.predict(X)
+        model.compiled, compiled = None, model.compiled
+        reference = model._predict_frame(history)
+        model.compiled = compiled
+        print(f"Max difference from the estimators on {X.shape[0]} rows: {np.abs(compiled_pred - reference).max():.3g}")
+    
+    # Same members, same version, written to a copy that is swapped in
+    with staged_model_dir(model_dir, copy_existing=True) as write_dir:
+        save_compiled(model, write_dir, model.version)
+        write_metadata(model, write_dir, model.version)
+    print(f"Compiled ensemble saved to {os.path.join(model_dir, 'compiled_ensemble')}")
+
+# Function to precompute the predictions of a saved model
+def build_saved_prediction_table(model_dir=os.path.join("saved_models", "grid_sales_model")):
+    """Build (or rebuild) the prediction table of a saved model"""
+    model = load_model(model_dir)
+    if model is None:
+        return
+    
+    start = time.perf_counter()
+    model.prediction_table = build_prediction_table(model)
+    values = model.prediction_table.values
+    print(f"Scored {values.shape[0]} products x {values.shape[1]} months x {values.shape[2]} grids "
+          f"in {time.perf_counter() - start:.1f}s ({values.nbytes / 1e6:.1f} MB)")
+    
+    # Same members, same version, written to a copy that is swapped in
+    with staged_model_dir(model_dir, copy_existing=True) as write_dir:
+        save_prediction_table(model, write_dir, model.version)
+        write_metadata(model, write_dir, model.version)
+    print(f"Prediction table saved to {os.path.join(model_dir, 'prediction_table')}")
+
+def serving_reference_frame(model, max_rows=50000, seed=0):
+    """Prediction inputs like serving's: sampled products x month slots x grids"""
+    grids = list(model.all_grids)
+    products = list(model.product_data)
+    n_products = max(1, min(len(products), max_rows // (MONTH_SLOTS * len(grids))))
+    chosen = np.sort(np.random.default_rng(seed).choice(len(products), n_products, replace=False))
+    
+    frames = []
+    for i in chosen:
+        frame = model._build_prediction_frame(products[i], grids)
+        if frame is None:
+            continue
+        frames.append(frame)
+        frames += [model._build_prediction_frame(products[i], grids, month) for month in range(1, MONTH_SLOTS)]
+    return pd.concat(frames, ignore_index=True)
+
+def measure_artifact(model_dir, repeat=5):
+    """Size on disk and load times of the compiled engine and prediction table"""
+    report = {}
+    for name, cls in [("compiled_ensemble", CompiledEnsemble), ("prediction_table", PredictionTable)]:
+        path = os.path.join(model_dir, name)
+        if not os.path.exists(path):
+            continue
+        report[name] = {'bytes': directory_bytes(path)}
+        for mmap in (False, True):
+            seconds = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                cls.load(path, mmap=mmap)
+                seconds.append(time.perf_counter() - start)
+            report[name]['mmap_load_ms' if mmap else 'load_ms'] = 1000 * float(np.median(seconds))
+    return report
+
+# Function to shrink a saved model for serving
+def shrink_saved_model(model_dir=os.path.join("saved_models", "grid_sales_model"), tolerance=0.0,
+                       float32=True, max_rows=50000, max_tolerance=None):
+    """Shrink the compiled engine and prediction table of a saved model
+    
+    float32 stores thresholds, leaf values and table values as float32.
+    tolerance > 0 also drops the least important trees while the mean
+    absolute change of predictions on serving-like rows stays within that
+    fraction of their mean, and the change of each row within max_tolerance
+    (default 10 x tolerance) of it (see CompiledEnsemble.shrink). When trees
+    are dropped the prediction table is rebuilt from the pruned engine, so
+    table lookups and live predictions agree. Reports the size, load time
+    and accuracy changes. The estimators are not changed.
+    """
+    model = load_model(model_dir)
+    if model is None:
+        return
+    if model.compiled is None:
+        print("The model has no compiled ensemble. Run 'compile' first.")
+        return
+    if tolerance > 0 and model.compiled.members is None:
+        print("The compiled ensemble predates tree pruning. Run 'compile' again first.")
+        return
+    
+    before = measure_artifact(model_dir)
+    
+    # Accuracy is measured against the current engine on the inputs serving predicts
+    frame = serving_reference_frame(model, max_rows)
+    model.load_preprocessor()
+    X = model.preprocessor.transform(frame[model.categorical_features + model.numerical_features])
+    reference = model.compiled.predict(X)
+    if max_tolerance is None:
+        max_tolerance = 10 * tolerance
+    compiled, dropped = model.compiled.shrink(X, tolerance=tolerance, float32=float32,
+                                              max_tolerance=max_tolerance)
+    difference = np.abs(compiled.predict(X) - reference)
+    mean_prediction = np.abs(reference).mean()
+    print(f"Kept {compiled.n_trees} of {model.compiled.n_trees} trees ({len(dropped)} dropped), "
+          f"{compiled.n_nodes} nodes")
+    print(f"Prediction change on {X.shape[0]} rows: mean {difference.mean():.4g}, max {difference.max():.4g} "
+          f"(mean prediction {mean_prediction:.4g})")
+    if dropped:
+        print(f"Bounds: mean change {tolerance * mean_prediction:.4g}, "
+              f"row change {max_tolerance * mean_prediction:.4g}")
+    model.compiled = compiled
+    
+    if model.prediction_table is not None and (dropped or float32):
+        old_table = model.prediction_table
+        if dropped:
+            # Serve the pruned engine's numbers from the table as well
+            table = build_prediction_table(model, use_compiled=True)
+        else:
+            table = old_table
+        values = np.asarray(table.values, dtype=np.float32) if float32 else table.values
+        print(f"Prediction table change: max {np.abs(values - old_table.values).max():.4g}")
+        model.prediction_table = PredictionTable(values, table.products, table.grids)
+    
+    # Same members, same version, written to a copy that is swapped in
+    with staged_model_dir(model_dir, copy_existing=True) as write_dir:
+        save_compiled(model, write_dir, model.version)
+        if model.prediction_table is not None:
+            save_prediction_table(model, write_dir, model.version)
+        write_metadata(model, write_dir, model.version)
+    
+    after = measure_artifact(model_dir)
+    print(f"\n{'artifact':<20}{'MB':>16}{'load ms':>18}{'mmap load ms':>18}")
+    for name in before:
+        old, new = before[name], after[name]
+        print(f"{name:<20}{old['bytes'] / 1e6:>7.2f} -> {new['bytes'] / 1e6:<6.2f}"
+              f"{old['load_ms']:>8.2f} -> {new['load_ms']:<7.2f}{old['mmap_load_ms']:>8.2f} -> {new['mmap_load_ms']:<7.2f}")
 
 # Function to use the loaded model
 def use_saved_model():
@@ -566,15 +1094,71 @@ def use_saved_model():
 # Main execution
 if __name__ == "__main__":
     # Choose which operation to run
+    import argparse
     import sys
     
     if len(sys.argv) > 1:
-        if sys.argv[1] == "train":
-            train_and_save_model()
-        elif sys.argv[1] == "predict":
+        parser = argparse.ArgumentParser(description="Grid sales ensemble model")
+        commands = parser.add_subparsers(dest="command", required=True)
+        
+        train_parser = commands.add_parser("train", help="train the model from scratch")
+        train_parser.add_argument("--data", default="data.csv", help="sales history CSV")
+        train_parser.add_argument("--chunksize", type=int, default=None,
+                                  help="stream the CSV in chunks of this many rows (for data larger than RAM)")
+        train_parser.add_argument("--n-jobs", type=int, default=None,
+                                  help="total cores for fitting the ensemble members (default: all)")
+        train_parser.add_argument("--layout", default=None,
+                                  help="store layout JSON (default: the standard 5x5 store)")
+        train_parser.add_argument("--no-feature-cache", action="store_true",
+                                  help="recompute the training features even if an earlier run cached them")
+        train_parser.add_argument("--preprocessing", choices=PREPROCESSING_MODES, default="dense",
+                                  help="'sparse' holds the training matrix as float32 CSR (same model, smaller "
+                                       "stored matrix; the training peak is unchanged)")
+        
+        update_parser = commands.add_parser("update", help="fold new sales rows into the saved model")
+        update_parser.add_argument("data", help="CSV with only the new rows (e.g. the latest month)")
+        update_parser.add_argument("--chunksize", type=int, default=500000)
+        update_parser.add_argument("--xgb-rounds", type=int, default=20,
+                                   help="boosting rounds added to the XGBoost model")
+        update_parser.add_argument("--rf-refresh-every", type=int, default=3,
+                                   help="refit the Random Forests every N updates (0 = never)")
+        update_parser.add_argument("--n-jobs", type=int, default=None,
+                                   help="total cores for fitting (default: all)")
+        
+        commands.add_parser("compile", help="export the saved model as a flat-array tree engine")
+        commands.add_parser("build-table", help="precompute every product x month x grid prediction")
+        commands.add_parser("predict", help="run sample predictions with the saved model")
+        shrink_parser = commands.add_parser("shrink", help="store the compiled engine and prediction table smaller")
+        shrink_parser.add_argument("--tolerance", type=float, default=0.0,
+                                   help="drop trees while the mean prediction change stays within this "
+                                        "fraction of the mean prediction (default: keep all trees)")
+        shrink_parser.add_argument("--max-tolerance", type=float, default=None,
+                                   help="bound on any single row's prediction change, as a fraction "
+                                        "of the mean prediction (default: 10x --tolerance)")
+        shrink_parser.add_argument("--keep-float64", action="store_true",
+                                   help="keep float64 thresholds and values")
+        shrink_parser.add_argument("--max-rows", type=int, default=50000,
+                                   help="serving-like rows to measure the prediction change on")
+        args = parser.parse_args()
+        
+        if args.command == "train":
+            if not train_and_save_model(args.data, chunksize=args.chunksize, n_jobs=args.n_jobs,
+                                        layout_path=args.layout, feature_cache=not args.no_feature_cache,
+                                        preprocessing=args.preprocessing):
+                sys.exit(1)
+        elif args.command == "update":
+            if not update_model(args.data, chunksize=args.chunksize, xgb_rounds=args.xgb_rounds,
+                                rf_refresh_every=args.rf_refresh_every, n_jobs=args.n_jobs):
+                sys.exit(1)
+        elif args.command == "compile":
+            compile_saved_model()
+        elif args.command == "build-table":
+            build_saved_prediction_table()
+        elif args.command == "predict":
             use_saved_model()
-        else:
-            print("Unknown command. Use 'train' or 'predict'")
+        elif args.command == "shrink":
+            shrink_saved_model(tolerance=args.tolerance, float32=not args.keep_float64, max_rows=args.max_rows,
+                               max_tolerance=args.max_tolerance)
     else:
         # If no arguments, ask what to do
         action = input("Enter 'train' to train the model, or 'predict' to use the saved model: ").strip().lower()
@@ -584,4 +1168,4 @@ if __name__ == "__main__":
         elif action == "predict":
             use_saved_model()
         else:
-            print("Unknown command. Use 'train' or 'predict'")
\ No newline at end of file
+            print("Unknown command. Use 'train' or 'predict'")
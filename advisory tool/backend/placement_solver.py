@@ -0,0 +1,151 @@
+"""
+Solvers for the single-product shelf placement problem
+------------------------------------------------------
+Choose between min_placements and max_placements candidate grids to maximize
+the summed objective, subject to a slotting-fee budget and "at least one of
+these grids" constraints (positive profit, eye level for high margin or
+competitor response, product size shelves, impulse positions).
+
+Backends:
+  - 'enumeration': in-process depth-first branch and bound (default)
+  - 'pulp': the PuLP model solved by CBC, kept as a fallback
+"""
+
+import os
+
+DEFAULT_SOLVER = os.environ.get("PLACEMENT_SOLVER", "enumeration")
+
+
+class PlacementProblem:
+    """Binary placement problem over a list of candidate grids"""
+
+    def __init__(self, name, candidates, objective, fees, max_budget,
+                 min_placements=1, max_placements=3, cover_constraints=None):
+        self.name = name
+        self.candidates = list(candidates)
+        self.objective = [float(v) for v in objective]
+        self.fees = [float(v) for v in fees]
+        self.max_budget = max_budget
+        self.min_placements = min_placements
+        self.max_placements = max_placements
+        # Constraint name -> grids of which at least one must be selected
+        self.cover_constraints = dict(cover_constraints or {})
+
+
+class PlacementSolution:
+    """Result of a solve: status is 'Optimal' or 'Infeasible'"""
+
+    def __init__(self, status, selected=None, objective_value=None):
+        self.status = status
+        self.selected = selected or []
+        self.objective_value = objective_value
+
+
+class BranchAndBoundSolver:
+    """Exact in-process solver for small cardinality-limited placements"""
+
+    name = 'enumeration'
+
+    def solve(self, problem):
+        n = len(problem.candidates)
+        objective = problem.objective
+        fees = problem.fees
+
+        # Bit i of cover_masks[j] is set when candidate j satisfies constraint i
+        position = {grid: j for j, grid in enumerate(problem.candidates)}
+        cover_masks = [0] * n
+        required_mask = 0
+        for i, grids in enumerate(problem.cover_constraints.values()):
+            required_mask |= 1 << i
+            for grid in grids:
+                if grid in position:
+                    cover_masks[position[grid]] |= 1 << i
+
+        # Visit candidates best-first so the bound below is a prefix sum
+        order = sorted(range(n), key=lambda j: -objective[j])
+        values = [objective[j] for j in order]
+
+        best_value = float('-inf')
+        best_selection = None
+        max_count = min(problem.max_placements, n)
+
+        # Iterative DFS over (next index, count, value, fee, cover mask, chosen)
+        stack = [(0, 0, 0.0, 0.0, 0, ())]
+        while stack:
+            start, count, value, fee, mask, chosen = stack.pop()
+
+            if count >= problem.min_placements and mask == required_mask and value > best_value:
+                best_value = value
+                best_selection = chosen
+
+            remaining = max_count - count
+            if remaining == 0:
+                continue
+
+            # Upper bound: add the best remaining positive objectives
+            bound = value
+            for v in values[start:start + remaining]:
+                if v <= 0:
+                    break
+                bound += v
+            if bound <= best_value:
+                continue
+
+            # Push in reverse so the best candidate is expanded first
+            for k in range(n - 1, start - 1, -1):
+                j = order[k]
+                new_fee = fee + fees[j]
+                if new_fee > problem.max_budget:
+                    continue
+                stack.append((k + 1, count + 1, value + objective[j], new_fee,
+                              mask | cover_masks[j], chosen + (j,)))
+
+        if best_selection is None:
+            return PlacementSolution('Infeasible')
+
+        selected = [problem.candidates[j] for j in sorted(best_selection)]
+        return PlacementSolution('Optimal', selected, best_value)
+
+
+class PulpSolver:
+    """The original PuLP formulation solved by CBC in a subprocess"""
+
+    name = 'pulp'
+
+    def solve(self, problem):
+        from pulp import LpProblem, LpMaximize, LpVariable, LpStatus, lpSum, value, PULP_CBC_CMD
+
+        model = LpProblem(name=problem.name, sense=LpMaximize)
+        X = {grid: LpVariable(f"X_{grid}", cat='Binary') for grid in problem.candidates}
+
+        model += lpSum(c * X[grid] for grid, c in zip(problem.candidates, problem.objective))
+
+        model += (lpSum(X.values()) >= problem.min_placements, "Minimum_Placement")
+        model += (lpSum(X.values()) <= problem.max_placements, "Maximum_Placement")
+        model += (lpSum(f * X[grid] for grid, f in zip(problem.candidates, problem.fees)) <= problem.max_budget,
+                  "Budget_Constraint")
+        for name, grids in problem.cover_constraints.items():
+            model += (lpSum(X[grid] for grid in grids if grid in X) >= 1, name)
+
+        model.solve(PULP_CBC_CMD(msg=False))
+
+        status = LpStatus[model.status]
+        if status != 'Optimal':
+            return PlacementSolution(status)
+
+        selected = [grid for grid in problem.candidates if value(X[grid]) == 1]
+        return PlacementSolution('Optimal', selected, value(model.objective))
+
+
+SOLVERS = {
+    BranchAndBoundSolver.name: BranchAndBoundSolver,
+    PulpSolver.name: PulpSolver,
+}
+
+
+def get_solver(name=None):
+    """Return a solver instance by name (defaults to PLACEMENT_SOLVER)"""
+    name = name or DEFAULT_SOLVER
+    if name not in SOLVERS:
+        raise ValueError(f"Unknown placement solver '{name}', choose from {sorted(SOLVERS)}")
+    return SOLVERS[name]()
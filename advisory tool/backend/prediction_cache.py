@@ -0,0 +1,101 @@
+"""
+Bounded cache for ensemble predictions
+--------------------------------------
+predict_sales output only changes when the model or its stored product data
+changes, so repeat requests for the same product are served from memory.
+Entries are keyed by (product, grids, model version, jitter seed), evicted
+least-recently-used beyond maxsize and expire after ttl seconds.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """Thread-safe LRU cache with a time-to-live and hit/miss counters"""
+
+    def __init__(self, maxsize=1024, ttl=3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def make_key(product_name, grids, model_version, seed):
+        return (product_name, tuple(grids) if grids is not None else None, model_version, seed)
+
+    def get(self, key):
+        """Return the cached value or None; counts a hit or a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if self.ttl is None or time.monotonic() - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entries if full"""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry (counters are kept)"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+def combine_stats(stats):
+    """Sum the stats() of the caches of several processes
+
+    size and the counters are totals; maxsize and ttl are per process.
+    """
+    stats = list(stats)
+    combined = {
+        'size': sum(s['size'] for s in stats),
+        'maxsize': stats[0]['maxsize'] if stats else None,
+        'ttl': stats[0]['ttl'] if stats else None,
+        'hits': sum(s['hits'] for s in stats),
+        'misses': sum(s['misses'] for s in stats),
+        'hit_rate': 0.0,
+        'evictions': sum(s['evictions'] for s in stats),
+        'expirations': sum(s['expirations'] for s in stats),
+        'processes': len(stats),
+    }
+    lookups = combined['hits'] + combined['misses']
+    if lookups:
+        combined['hit_rate'] = combined['hits'] / lookups
+    return combined
@@ -0,0 +1,75 @@
+"""
+Precomputed ensemble predictions
+--------------------------------
+The model only predicts known products at the store's grid positions, either
+for the month in each product's latest data or for one of the 12 calendar
+months. The raw ensemble blend for every such combination is computed once
+after training, so serving a prediction is an array lookup and the
+estimators are only needed for products missing from the table.
+
+Layout of a saved table directory:
+    manifest.json   products, grids and the version of the source model
+    values.npy      float64 [product, month slot, grid]; slot 0 is the
+                    latest month, slot m (1-12) is calendar month m
+"""
+
+import json
+import os
+
+import numpy as np
+
+from atomic_write import save_array, save_json
+
+MONTH_SLOTS = 13
+
+
+class PredictionTable:
+    """Raw ensemble predictions for products x month slots x grids"""
+
+    def __init__(self, values, products, grids, source_version=None):
+        self.values = values
+        self.products = list(products)
+        self.grids = list(grids)
+        self.source_version = source_version
+        self._positions = {product: i for i, product in enumerate(self.products)}
+        self._grid_positions = {grid: i for i, grid in enumerate(self.grids)}
+
+    def __contains__(self, product_name):
+        return product_name in self._positions
+
+    def __len__(self):
+        return len(self.products)
+
+    @property
+    def nbytes(self):
+        """Bytes of the values (memory-mapped or in memory)"""
+        return self.values.nbytes
+
+    def lookup(self, product_name, grids=None, month=None):
+        """Raw predictions of one product for grids (default: all), or None"""
+        position = self._positions.get(product_name)
+        if position is None:
+            return None
+        row = np.asarray(self.values[position, month or 0])
+        if grids is None or grids == self.grids:
+            return row
+        return row[[self._grid_positions[grid] for grid in grids]]
+
+    def save(self, path):
+        """Write the values and the manifest (last) to a directory"""
+        os.makedirs(path, exist_ok=True)
+        save_array(os.path.join(path, "values.npy"), np.ascontiguousarray(self.values))
+
+        save_json(os.path.join(path, "manifest.json"), {
+            'products': self.products,
+            'grids': self.grids,
+            'source_version': self.source_version
+        })
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Open a saved table; with mmap rows are paged in on demand"""
+        with open(os.path.join(path, "manifest.json"), "r") as f:
+            manifest = json.load(f)
+        values = np.load(os.path.join(path, "values.npy"), mmap_mode='r' if mmap else None, allow_pickle=False)
+        return cls(values, manifest['products'], manifest['grids'], manifest.get('source_version'))
@@ -0,0 +1,112 @@
+"""
+In-memory product index over data.csv
+-------------------------------------
+Parses the sales history once and keeps the per-product aggregates the
+optimization endpoint needs, so a request is a dictionary lookup instead of a
+CSV parse plus a scan per grid position.
+"""
+
+import sys
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from layouts import DEFAULT_LAYOUT
+
+# Grid positions of the standard store, the default order of grid_sales
+ALL_GRIDS = list(DEFAULT_LAYOUT.grids)
+
+
+class ProductStats:
+    """Precomputed aggregates for one product"""
+
+    __slots__ = (
+        'product_name', 'row_count', 'product_line', 'avg_profit_per_unit',
+        'avg_margin', 'product_size', 'avg_velocity', 'competitor_present',
+        'buying_decision', 'grid_sales', 'grids'
+    )
+
+    def __init__(self, **values):
+        for key, value in values.items():
+            setattr(self, key, value)
+
+    def predicted_sales(self):
+        """Per-grid sales estimate as a {grid: units} dictionary"""
+        return dict(zip(self.grids, self.grid_sales.tolist()))
+
+
+class ProductIndex:
+    """Product name -> ProductStats, built once from the sales history
+
+    grid_sales follow the order of grids (a store layout's positions).
+    """
+
+    def __init__(self, data, grids=None):
+        self.grids = list(grids if grids is not None else ALL_GRIDS)
+        self.products = {}
+
+        if len(data) == 0:
+            return
+
+        by_product = data.groupby('Product Name', sort=False)
+        row_counts = by_product.size()
+        mean_quantity = by_product['Quantity'].mean()
+        avg_profit_per_unit = by_product['Total Profit ($)'].mean() / mean_quantity
+        avg_margin = by_product['Profit Margin (%)'].mean()
+        avg_velocity = by_product['Product Sales Velocity'].mean()
+        competitor_present = (data['Competitor Presence'] == 'Yes').groupby(data['Product Name'], sort=False).any()
+
+        # Attributes taken from the first row of each product
+        first_rows = data.drop_duplicates('Product Name').set_index('Product Name')
+
+        # Mean quantity per grid as one row of len(grids) slots per product;
+        # grids without history get the conservative half-of-average estimate
+        grid_means = (
+            data.groupby(['Product Name', 'Grid Position'], sort=False)['Quantity'].mean()
+            .unstack('Grid Position')
+            .reindex(index=row_counts.index, columns=self.grids)
+        )
+        fallback = (mean_quantity * 0.5).reindex(row_counts.index).to_numpy()[:, None]
+        grid_sales = grid_means.to_numpy(dtype=float)
+        grid_sales = np.where(np.isnan(grid_sales), fallback, grid_sales)
+
+        for i, product in enumerate(row_counts.index):
+            first = first_rows.loc[product]
+            self.products[product] = ProductStats(
+                product_name=product,
+                row_count=int(row_counts[product]),
+                product_line=first['Product Line'],
+                avg_profit_per_unit=avg_profit_per_unit[product],
+                avg_margin=avg_margin[product],
+                product_size=first['Product Size Category'],
+                avg_velocity=avg_velocity[product],
+                competitor_present='Yes' if competitor_present[product] else 'No',
+                buying_decision=first['Buying Decision'],
+                grid_sales=grid_sales[i],
+                grids=self.grids
+            )
+
+    def __contains__(self, product_name):
+        return product_name in self.products
+
+    def __len__(self):
+        return len(self.products)
+
+    @cached_property
+    def nbytes(self):
+        """Approximate memory of the per-product aggregates"""
+        return sum(sys.getsizeof(stats) + stats.grid_sales.nbytes for stats in self.products.values())
+
+    def get(self, product_name):
+        """Return the ProductStats for a product, or None if it has no history"""
+        return self.products.get(product_name)
+
+
+def load_product_index(data_path="data.csv", grids=None):
+    """Read the sales history and build the product index"""
+    print(f"Building product index from {data_path}...")
+    data = pd.read_csv(data_path)
+    index = ProductIndex(data, grids)
+    print(f"Indexed {len(index)} products from {len(data)} rows")
+    return index
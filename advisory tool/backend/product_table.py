@@ -0,0 +1,167 @@
+"""
+Columnar storage for the per-product data used at serving time
+---------------------------------------------------------------
+All products' latest rows live in one table sorted by product, with an offset
+index marking where each product's rows start. Every column is saved as its
+own uncompressed .npy file (strings dictionary-encoded as int32 codes) so the
+table can be memory-mapped, and a product's DataFrame is only built the first
+time it is requested. The most recently requested frames (max_frames) are
+kept, so memory does not grow with the number of products served.
+
+Layout of a saved table directory:
+    manifest.json   column names, kinds, categories and product names
+    offsets.npy     row offsets, len(products) + 1 entries
+    col_<i>.npy     one array per column
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+from atomic_write import save_array, save_json
+
+DEFAULT_MAX_FRAMES = 1024
+
+
+class ProductTable(Mapping):
+    """Mapping of product name -> {'latest_data': DataFrame}, built lazily"""
+
+    def __init__(self, columns, column_kinds, categories, products, offsets, max_frames=DEFAULT_MAX_FRAMES):
+        # columns: list of (name, ndarray); strings are int32 category codes
+        self.columns = columns
+        self.column_kinds = column_kinds
+        self.categories = categories
+        self.products = list(products)
+        self.offsets = offsets
+        self._positions = {product: i for i, product in enumerate(self.products)}
+        # product name -> (frame, bytes), least recently used first
+        self.max_frames = max_frames
+        self._frames = OrderedDict()
+        self._frame_bytes = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_frame(cls, data):
+        """Build a table from a frame holding the rows of every product"""
+        # Stable sort keeps each product's rows in their original order
+        data = data.sort_values('Product Name', kind='stable')
+        product_codes, products = pd.factorize(data['Product Name'], sort=False)
+        counts = np.bincount(product_codes, minlength=len(products))
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        columns = []
+        column_kinds = {}
+        categories = {}
+        for name in data.columns:
+            series = data[name]
+            if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                columns.append((name, series.to_numpy()))
+                column_kinds[name] = 'numeric'
+            else:
+                codes, uniques = pd.factorize(series.astype(object), sort=False)
+                columns.append((name, codes.astype(np.int32)))
+                column_kinds[name] = 'category'
+                categories[name] = [str(value) for value in uniques]
+
+        return cls(columns, column_kinds, categories, [str(p) for p in products], offsets)
+
+    @classmethod
+    def from_records(cls, serialized_product_data):
+        """Build a table from the legacy product_data.pkl contents"""
+        frames = [pd.DataFrame(data_dict['latest_data']) for data_dict in serialized_product_data.values()]
+        frames = [frame for frame in frames if len(frame) > 0]
+        if not frames:
+            return cls([], {}, {}, [], np.zeros(1, dtype=np.int64))
+        return cls.from_frame(pd.concat(frames, ignore_index=True))
+
+    def save(self, path):
+        """Write the table as a directory of .npy files plus a manifest"""
+        os.makedirs(path, exist_ok=True)
+
+        files = []
+        for i, (name, values) in enumerate(self.columns):
+            file_name = f"col_{i}.npy"
+            save_array(os.path.join(path, file_name), np.ascontiguousarray(values))
+            files.append({
+                'name': name,
+                'kind': self.column_kinds[name],
+                'file': file_name,
+                'categories': self.categories.get(name)
+            })
+        save_array(os.path.join(path, "offsets.npy"), self.offsets)
+
+        # Remove columns left over from an older table
+        keep = {entry['file'] for entry in files} | {"offsets.npy", "manifest.json"}
+        for file_name in os.listdir(path):
+            if file_name.startswith("col_") and file_name not in keep:
+                os.remove(os.path.join(path, file_name))
+
+        # The manifest is written last
+        save_json(os.path.join(path, "manifest.json"), {'columns': files, 'products': self.products})
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Open a saved table; with mmap the columns are paged in on demand"""
+        with open(os.path.join(path, "manifest.json"), "r") as f:
+            manifest = json.load(f)
+
+        mmap_mode = 'r' if mmap else None
+        columns = []
+        column_kinds = {}
+        categories = {}
+        for entry in manifest['columns']:
+            values = np.load(os.path.join(path, entry['file']), mmap_mode=mmap_mode, allow_pickle=False)
+            columns.append((entry['name'], values))
+            column_kinds[entry['name']] = entry['kind']
+            if entry['kind'] == 'category':
+                categories[entry['name']] = entry['categories']
+
+        offsets = np.load(os.path.join(path, "offsets.npy"), allow_pickle=False)
+        return cls(columns, column_kinds, categories, manifest['products'], offsets)
+
+    def _materialize(self, position):
+        start, stop = int(self.offsets[position]), int(self.offsets[position + 1])
+        data = {}
+        for name, values in self.columns:
+            block = np.array(values[start:stop])
+            if self.column_kinds[name] == 'category':
+                labels = np.array(self.categories[name] + [None], dtype=object)
+                block = labels[block]  # code -1 (missing) maps to None
+            data[name] = block
+        return {'latest_data': pd.DataFrame(data)}
+
+    def __getitem__(self, product_name):
+        position = self._positions[product_name]  # KeyError for unknown products
+        with self._lock:
+            cached = self._frames.get(product_name)
+            if cached is not None:
+                self._frames.move_to_end(product_name)
+                return cached[0]
+
+            frame = self._materialize(position)
+            nbytes = int(frame['latest_data'].memory_usage(deep=True).sum())
+            self._frames[product_name] = (frame, nbytes)
+            self._frame_bytes += nbytes
+            while len(self._frames) > self.max_frames:
+                _, (_, evicted_bytes) = self._frames.popitem(last=False)
+                self._frame_bytes -= evicted_bytes
+        return frame
+
+    def __contains__(self, product_name):
+        return product_name in self._positions
+
+    def __iter__(self):
+        return iter(self.products)
+
+    def __len__(self):
+        return len(self.products)
+
+    @property
+    def nbytes(self):
+        """Bytes of the columns (memory-mapped or in memory) and the built frames"""
+        return sum(values.nbytes for _, values in self.columns) + self.offsets.nbytes + self._frame_bytes
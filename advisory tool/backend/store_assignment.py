@@ -0,0 +1,233 @@
+"""
+Store-wide joint shelf assignment
+---------------------------------
+Assigns every product to the grid positions at once, instead of optimizing
+each product on its own against the slotting fee table. Each grid holds a
+limited number of products and each product gets between min_facings and
+max_facings positions, maximizing the total predicted net profit
+
+    predicted monthly sales x avg profit per unit - slotting fee
+
+from the ensemble's product x grid prediction matrix.
+
+The model is a bipartite b-matching (a transportation problem), so its LP
+relaxation is integral and CBC usually finishes at the root node. Only each
+product's most profitable grids get a variable (plus the grids it holds in the
+previous layout), the previous layout is passed to CBC as a warm start and a
+time limit bounds the nightly run.
+
+Usage:
+    python store_assignment.py --capacity 40 --time-limit 3600
+"""
+
+import argparse
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+
+def build_net_profit_matrix(model, product_index, products, fees):
+    """Predicted net profit for every product x grid in model.all_grids order
+
+    Returns (products, matrix, errors); products that cannot be predicted or
+    have no sales history are left out and reported in errors.
+    """
+    predictions, errors = model.predict_sales_batch(products, jitter=False)
+
+    kept = []
+    rows = []
+    for product in products:
+        if product not in predictions:
+            continue
+        stats = product_index.get(product)
+        if stats is None:
+            errors[product] = f"No data found for product '{product}'"
+            continue
+        sales = (
+            predictions[product]
+            .set_index('Grid Position')['Predicted Monthly Sales']
+            .reindex(model.all_grids)
+            .to_numpy(dtype=float)
+        )
+        rows.append(sales * stats.avg_profit_per_unit)
+        kept.append(product)
+
+    if not rows:
+        return kept, np.zeros((0, len(fees))), errors
+
+    return kept, np.vstack(rows) - np.asarray(fees, dtype=float)[None, :], errors
+
+
+def _candidate_pairs(net_profit, candidates_per_product, previous_pairs):
+    """Sparse variable set: each product's top grids plus its previous ones"""
+    n_products, n_grids = net_profit.shape
+    k = min(candidates_per_product, n_grids)
+    top = np.argpartition(-net_profit, k - 1, axis=1)[:, :k] if k < n_grids else \
+        np.tile(np.arange(n_grids), (n_products, 1))
+
+    pairs = set()
+    for p in range(n_products):
+        pairs.update((p, int(g)) for g in top[p])
+    pairs.update(previous_pairs)
+    return sorted(pairs)
+
+
+def assign_store(net_profit, products, grids, capacity, min_facings=1, max_facings=3,
+                 candidates_per_product=10, previous_layout=None, time_limit=3600, msg=False):
+    """Jointly assign products to grids
+
+    capacity, min_facings and max_facings are scalars or per-grid/per-product
+    sequences. previous_layout ({product: [grids]}) warm-starts the solver.
+    Returns (layout, info) where layout maps each product to its grids.
+    """
+    from pulp import (LpProblem, LpMaximize, LpVariable, LpStatus, lpSum, PULP_CBC_CMD,
+                      LpSolutionOptimal, LpSolutionIntegerFeasible)
+
+    n_products, n_grids = net_profit.shape
+    capacity = np.broadcast_to(np.asarray(capacity, dtype=int), (n_grids,))
+    min_facings = np.broadcast_to(np.asarray(min_facings, dtype=int), (n_products,))
+    max_facings = np.broadcast_to(np.asarray(max_facings, dtype=int), (n_products,))
+
+    if min_facings.sum() > capacity.sum():
+        raise ValueError(
+            f"Minimum facings ({min_facings.sum()}) exceed total grid capacity ({capacity.sum()})"
+        )
+    if (min_facings > np.minimum(max_facings, n_grids)).any():
+        raise ValueError("min_facings must not exceed max_facings or the number of grids")
+
+    grid_position = {grid: g for g, grid in enumerate(grids)}
+    product_position = {product: p for p, product in enumerate(products)}
+    previous_pairs = set()
+    for product, product_grids in (previous_layout or {}).items():
+        if product in product_position:
+            for grid in product_grids:
+                if grid in grid_position:
+                    previous_pairs.add((product_position[product], grid_position[grid]))
+
+    start = time.perf_counter()
+    k = max(candidates_per_product, int(max_facings.max()))
+    while True:
+        pairs = _candidate_pairs(net_profit, k, previous_pairs)
+
+        model = LpProblem(name="Store_Assignment", sense=LpMaximize)
+        X = {(p, g): LpVariable(f"X_{p}_{g}", cat='Binary') for p, g in pairs}
+
+        by_product = [[] for _ in range(n_products)]
+        by_grid = [[] for _ in range(n_grids)]
+        for (p, g), var in X.items():
+            by_product[p].append(var)
+            by_grid[g].append(var)
+
+        model += lpSum(net_profit[p, g] * var for (p, g), var in X.items())
+        for p in range(n_products):
+            model += (lpSum(by_product[p]) >= int(min_facings[p]), f"Min_Facings_{p}")
+            model += (lpSum(by_product[p]) <= int(max_facings[p]), f"Max_Facings_{p}")
+        for g in range(n_grids):
+            if by_grid[g]:
+                model += (lpSum(by_grid[g]) <= int(capacity[g]), f"Grid_Capacity_{g}")
+
+        # Warm start from the previous layout
+        for pair, var in X.items():
+            var.setInitialValue(1 if pair in previous_pairs else 0)
+
+        remaining = max(1, int(time_limit - (time.perf_counter() - start))) if time_limit else None
+        model.solve(PULP_CBC_CMD(msg=msg, timeLimit=remaining, warmStart=bool(previous_pairs)))
+
+        if model.sol_status in (LpSolutionOptimal, LpSolutionIntegerFeasible):
+            break
+        if k >= n_grids:
+            raise RuntimeError(f"Store assignment failed: {LpStatus[model.status]}")
+        # The sparse candidate set was too tight for the capacities, widen it
+        k = min(n_grids, k * 2)
+
+    layout = {product: [] for product in products}
+    total = 0.0
+    for (p, g), var in X.items():
+        if var.value() is not None and var.value() > 0.5:
+            layout[products[p]].append(grids[g])
+            total += float(net_profit[p, g])
+    for product in layout:
+        layout[product].sort(key=grid_position.get)
+
+    info = {
+        'status': LpStatus[model.status],
+        'optimal': model.sol_status == LpSolutionOptimal,
+        'objective': total,
+        'variables': len(X),
+        'candidates_per_product': k,
+        'solve_seconds': time.perf_counter() - start,
+    }
+    return layout, info
+
+
+def load_previous_assignment(path):
+    """Read a saved layout ({product: [grids]}), or None if there is none"""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f).get("layout")
+
+
+def save_layout(path, layout, info):
+    """Write the layout and solve summary as JSON"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"layout": layout, "info": info}, f, indent=4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Store-wide joint shelf assignment")
+    parser.add_argument("--model-dir", default="saved_models/grid_sales_model")
+    parser.add_argument("--data", default="data.csv")
+    parser.add_argument("--output", default="saved_models/store_layout.json",
+                        help="layout file, also read as the warm start for the next run")
+    parser.add_argument("--capacity", type=int, default=None,
+                        help="products per grid (default: just enough room for the minimum facings)")
+    parser.add_argument("--min-facings", type=int, default=1)
+    parser.add_argument("--max-facings", type=int, default=3)
+    parser.add_argument("--candidates", type=int, default=10,
+                        help="grids per product in the sparse formulation")
+    parser.add_argument("--time-limit", type=float, default=3600, help="solver time limit in seconds")
+    args = parser.parse_args()
+
+    from inference import load_model
+    from product_index import load_product_index
+
+    model = load_model(args.model_dir)
+    if model is None:
+        return
+    product_index = load_product_index(args.data, model.all_grids)
+
+    # Fees of the store layout the model was trained for
+    fees = model.layout.fees[model.layout.positions(model.all_grids)]
+    products = [product for product in model.product_data if product in product_index]
+
+    print(f"Predicting {len(products)} products x {len(model.all_grids)} grids...")
+    products, net_profit, errors = build_net_profit_matrix(model, product_index, products, fees)
+    for product, message in errors.items():
+        print(f"  Skipping {product}: {message}")
+
+    capacity = args.capacity
+    if capacity is None:
+        capacity = math.ceil(len(products) * args.min_facings / len(model.all_grids))
+
+    print(f"Assigning {len(products)} products (capacity {capacity} per grid)...")
+    layout, info = assign_store(
+        net_profit, products, model.all_grids, capacity,
+        min_facings=args.min_facings, max_facings=args.max_facings,
+        candidates_per_product=args.candidates, previous_layout=load_previous_assignment(args.output),
+        time_limit=args.time_limit
+    )
+    info['model_version'] = model.version
+    save_layout(args.output, layout, info)
+
+    print(f"Status: {info['status']}, total net profit: ${info['objective']:.2f}, "
+          f"{info['variables']} variables, {info['solve_seconds']:.1f}s")
+    print(f"Layout saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
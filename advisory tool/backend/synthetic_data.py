@@ -0,0 +1,112 @@
+"""
+Synthetic sales history
+-----------------------
+Seeded generator for data.csv files in the schema preprocess_data expects
+(see RAW_COLUMNS in monthly.py), at any scale, for benchmarks and for trying
+the pipeline without real data. The same arguments always give the same file.
+
+Each product has a fixed line, size, buying behaviour, price and demand
+level; quantities depend on the shelf position (eye level and end caps sell
+more), the season and noise, so the models have something to learn.
+
+Usage:
+    python synthetic_data.py --products 50 --months 36 --rows 200000 --output data.csv
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from layouts import DEFAULT_LAYOUT, load_layout
+
+PRODUCT_LINES = ['Electronics', 'Sports & Outdoors', 'Home', 'Grocery', 'Health & Beauty']
+SIZE_CATEGORIES = ['Small', 'Medium', 'Large']
+BUYING_DECISIONS = ['Impulsive', 'Discretionary', 'Planned']
+
+# Same order as RAW_COLUMNS in monthly.py
+COLUMNS = [
+    'Date', 'Product Name', 'Grid Position', 'Quantity', 'Profit Margin (%)',
+    'Total Profit ($)', 'Competitor Presence', 'Competitor Product Impact',
+    'Product Sales Velocity', 'Product Line', 'Product Size Category', 'Buying Decision'
+]
+
+
+def generate_sales_data(products=12, months=24, rows=20000, seed=0, layout=DEFAULT_LAYOUT, start="2022-01-01"):
+    """Sales rows for products x layout positions over months, as a DataFrame"""
+    if products < 1 or months < 1 or rows < 1:
+        raise ValueError("products, months and rows must be positive")
+    rng = np.random.default_rng(seed)
+
+    # Fixed attributes of each product
+    names = np.array([f"Product {i + 1}" for i in range(products)], dtype=object)
+    lines = rng.choice(PRODUCT_LINES, products)
+    sizes = rng.choice(SIZE_CATEGORIES, products)
+    decisions = rng.choice(BUYING_DECISIONS, products)
+    demand = rng.lognormal(np.log(8), 0.5, products)
+    unit_profit = rng.uniform(20, 250, products)
+    margin = rng.uniform(5, 45, products)
+    velocity = rng.uniform(5, 900, products)
+    competitor_rate = rng.uniform(0.1, 0.9, products)
+
+    # Position effect: eye level and end caps sell more
+    position_effect = 1 + 0.4 * layout.eye_level + 0.2 * layout.end_cap
+
+    product = rng.integers(0, products, rows)
+    position = rng.integers(0, len(layout), rows)
+    month = rng.integers(0, months, rows)
+    first_day = pd.Timestamp(start).to_period('M').to_timestamp()
+    month_start = pd.DatetimeIndex([first_day + pd.DateOffset(months=int(m)) for m in range(months)])
+    dates = month_start[month] + pd.to_timedelta(rng.integers(0, 28, rows), unit='D')
+
+    # Summer and December peaks
+    calendar_month = month_start.month.to_numpy()[month]
+    season_effect = 1 + 0.15 * np.isin(calendar_month, [6, 7, 8]) + 0.3 * (calendar_month == 12)
+
+    competitor = rng.random(rows) < competitor_rate[product]
+    quantity = rng.poisson(demand[product] * position_effect[position] * season_effect * np.where(competitor, 0.85, 1.0))
+    quantity = np.maximum(quantity, 1)
+
+    # Mostly the product's usual buying decision
+    decision = np.where(rng.random(rows) < 0.8, decisions[product], rng.choice(BUYING_DECISIONS, rows))
+
+    df = pd.DataFrame({
+        'Date': dates.strftime('%Y-%m-%d'),
+        'Product Name': names[product],
+        'Grid Position': np.array(layout.grids, dtype=object)[position],
+        'Quantity': quantity,
+        'Profit Margin (%)': np.round(margin[product] + rng.normal(0, 2, rows), 1),
+        'Total Profit ($)': np.round(quantity * unit_profit[product] * rng.uniform(0.9, 1.1, rows), 2),
+        'Competitor Presence': np.where(competitor, 'Yes', 'No'),
+        'Competitor Product Impact': np.round(np.where(competitor, rng.uniform(10, 300, rows), 0), 2),
+        'Product Sales Velocity': np.round(velocity[product] * rng.uniform(0.8, 1.2, rows), 3),
+        'Product Line': lines[product],
+        'Product Size Category': sizes[product],
+        'Buying Decision': decision
+    })
+    return df.sort_values('Date', kind='stable').reset_index(drop=True)[COLUMNS]
+
+
+def write_sales_data(path, **kwargs):
+    """Generate and write a data.csv; returns the number of rows"""
+    df = generate_sales_data(**kwargs)
+    df.to_csv(path, index=False)
+    return len(df)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic data.csv")
+    parser.add_argument("--products", type=int, default=12)
+    parser.add_argument("--months", type=int, default=24)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start", default="2022-01-01", help="first month of the history")
+    parser.add_argument("--layout", default=None, help="store layout JSON (default: the standard 5x5 store)")
+    parser.add_argument("--output", default="data.csv")
+    args = parser.parse_args()
+
+    n = write_sales_data(
+        args.output, products=args.products, months=args.months, rows=args.rows,
+        seed=args.seed, layout=load_layout(args.layout), start=args.start
+    )
+    print(f"Wrote {n} rows ({args.products} products, {args.months} months) to {args.output}")
@@ -0,0 +1,25 @@
+import json
+
+import numpy as np
+
+from atomic_write import save_array, save_json
+
+
+def test_mapped_reader_keeps_the_old_array(tmp_path):
+    path = tmp_path / "values.npy"
+    save_array(str(path), np.arange(4, dtype=np.float64))
+    mapped = np.load(path, mmap_mode='r')
+
+    save_array(str(path), np.full(4, -1.0))
+
+    np.testing.assert_array_equal(mapped, np.arange(4))
+    np.testing.assert_array_equal(np.load(path), np.full(4, -1.0))
+    assert [p.name for p in tmp_path.iterdir()] == ["values.npy"]
+
+
+def test_save_json_replaces_the_file(tmp_path):
+    path = tmp_path / "manifest.json"
+    save_json(str(path), {'version': 1})
+    save_json(str(path), {'version': 2}, indent=4)
+    assert json.loads(path.read_text()) == {'version': 2}
+    assert [p.name for p in tmp_path.iterdir()] == ["manifest.json"]
@@ -0,0 +1,38 @@
+import pandas as pd
+import pytest
+
+import monthly
+from synthetic_data import write_sales_data
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = str(tmp_path / "data.csv")
+    write_sales_data(path, products=4, months=8, rows=3000, seed=2)
+    return path
+
+
+def test_chunked_aggregation_matches_in_memory(data_file):
+    _, expected = monthly.preprocess_data(pd.read_csv(data_file))
+    chunked = monthly.preprocess_data_chunked(data_file, chunksize=173)
+    pd.testing.assert_frame_equal(chunked, expected)
+
+
+def test_aggregation_resumes_from_saved_state(data_file, tmp_path):
+    _, expected = monthly.preprocess_data(pd.read_csv(data_file))
+    raw = pd.read_csv(data_file)
+    first, second = raw.iloc[:1700], raw.iloc[1700:]
+
+    aggregator = monthly.MonthlyAggregator(compact_rows=50)
+    for start in range(0, len(first), 400):
+        aggregator.add(first.iloc[start:start + 400])
+    aggregator.save_state(str(tmp_path))
+
+    resumed = monthly.MonthlyAggregator.load_state(str(tmp_path), compact_rows=50)
+    for start in range(0, len(second), 400):
+        resumed.add(second.iloc[start:start + 400])
+    pd.testing.assert_frame_equal(resumed.result(), expected)
+
+
+def test_load_state_without_saved_state(tmp_path):
+    assert monthly.MonthlyAggregator.load_state(str(tmp_path)) is None
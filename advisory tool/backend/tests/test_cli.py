@@ -0,0 +1,18 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("args", [
+    ["train", "--data", "missing.csv"],
+    ["update", "missing.csv"],
+])
+def test_failed_training_exits_non_zero(tmp_path, args):
+    result = subprocess.run([sys.executable, os.path.join(BACKEND_DIR, "monthly.py"), *args],
+                            cwd=tmp_path, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 1
+    assert not (tmp_path / "saved_models" / "grid_sales_model").exists()
@@ -0,0 +1,30 @@
+import pandas as pd
+import pytest
+
+import feature_reference
+import monthly
+from synthetic_data import generate_sales_data
+
+
+@pytest.mark.parametrize("products, months, rows, seed", [
+    (3, 4, 500, 0),
+    (12, 24, 20000, 1),
+])
+def test_vectorized_features_match_reference(products, months, rows, seed):
+    df = generate_sales_data(products=products, months=months, rows=rows, seed=seed)
+
+    expected_raw, expected_monthly = feature_reference.preprocess_data(df)
+    actual_raw, actual_monthly = monthly.preprocess_data(df)
+    pd.testing.assert_frame_equal(actual_raw, expected_raw)
+    pd.testing.assert_frame_equal(actual_monthly, expected_monthly)
+
+    expected = feature_reference.engineer_features(expected_monthly)
+    actual = monthly.engineer_features(actual_monthly)
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_input_frame_is_not_modified():
+    df = generate_sales_data(products=3, months=4, rows=500, seed=2)
+    original = df.copy()
+    monthly.preprocess_data(df)
+    pd.testing.assert_frame_equal(df, original)
@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import monthly
+from benchmark import COLD_START_CODE
+from synthetic_data import write_sales_data
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a fresh interpreter so modules imported by other tests do not count
+LAZY_IMPORT_CODE = """
+import sys
+import main
+heavy = sorted(name for name in ('sklearn', 'xgboost') if name in sys.modules)
+print(','.join(heavy))
+"""
+
+NO_SIDE_EFFECTS_CODE = """
+import pickle
+import random
+import sys
+import numpy as np
+before = pickle.dumps((random.getstate(), np.random.get_state()))
+import {module}
+after = pickle.dumps((random.getstate(), np.random.get_state()))
+print(before == after)
+"""
+
+# Cold start budgets in seconds: importing main (about 0.8s here) and
+# importing it, loading a model and answering a first prediction. Loose
+# enough for a slow CI machine, tight enough to catch sklearn or xgboost
+# coming back into the import.
+IMPORT_BUDGET = float(os.environ.get("ADVISORY_TEST_IMPORT_BUDGET", "3.0"))
+COLD_START_BUDGET = float(os.environ.get("ADVISORY_TEST_COLD_START_BUDGET", "5.0"))
+
+
+def run_python(code, cwd):
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR, ADVISORY_LOG_LEVEL="OFF")
+    result = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    return result.stdout.strip().splitlines()[-1] if result.stdout.strip() else ""
+
+
+def test_importing_main_does_not_load_training_libraries(tmp_path):
+    assert run_python(LAZY_IMPORT_CODE, tmp_path) == ""
+    assert not (tmp_path / "saved_models").exists()
+
+
+@pytest.mark.parametrize("module", ["inference", "monthly"])
+def test_import_has_no_side_effects(tmp_path, module):
+    assert run_python(NO_SIDE_EFFECTS_CODE.format(module=module), tmp_path) == "True"
+    assert os.listdir(tmp_path) == []
+
+
+def test_cold_start_is_within_budget(tmp_path, monkeypatch, record_property):
+    monkeypatch.chdir(tmp_path)
+    write_sales_data("data.csv", products=3, months=6, rows=1500, seed=0)
+    monthly.train_and_save_model("data.csv", n_jobs=1, feature_cache=False)
+
+    imported, started, sklearn = run_python(COLD_START_CODE, tmp_path).split()
+    record_property("import_main_seconds", float(imported))
+    record_property("cold_start_seconds", float(started))
+    assert float(imported) < IMPORT_BUDGET
+    assert float(started) < COLD_START_BUDGET
+    # The prediction comes from the table, without sklearn
+    assert sklearn == "False"
+
@@ -0,0 +1,36 @@
+import json
+
+import pandas as pd
+
+from layouts import DEFAULT_LAYOUT, DEFAULT_LAYOUT_CONFIG, StoreLayout, load_layout
+
+
+def test_empty_lists_in_a_layout_config_mean_none(tmp_path):
+    config = dict(DEFAULT_LAYOUT_CONFIG, eye_level_rows=[], end_cols=[], premium_rows=[])
+    path = tmp_path / "layout.json"
+    path.write_text(json.dumps(config))
+
+    layout = load_layout(str(path))
+
+    assert layout.eye_level_rows == []
+    assert layout.end_cols == []
+    assert layout.premium_rows == []
+    assert not layout.eye_level.any()
+    assert not layout.end_cap.any()
+    assert not layout.premium.any()
+    assert not layout.is_premium(pd.Series(['A', 'C', 'E']), [1, 3, 5]).any()
+
+    # Omitted fields still get their defaults
+    assert layout.large_item_rows == DEFAULT_LAYOUT.large_item_rows
+    assert layout.small_item_rows == DEFAULT_LAYOUT.small_item_rows
+
+
+def test_config_round_trip_keeps_empty_lists():
+    layout = StoreLayout.from_config(dict(DEFAULT_LAYOUT_CONFIG, eye_level_rows=[]))
+    assert StoreLayout.from_config(layout.to_config()).eye_level_rows == []
+
+
+def test_default_layout_fields():
+    assert DEFAULT_LAYOUT.eye_level_rows == ['C']
+    assert DEFAULT_LAYOUT.end_cols == [1, 5]
+    assert DEFAULT_LAYOUT.premium_rows == ['A', 'E']
@@ -0,0 +1,66 @@
+import os
+import shutil
+
+import pytest
+
+import monthly
+from model_registry import ModelRegistry, UnknownStore
+from synthetic_data import write_sales_data
+
+STORES = ["store-a", "store-b", "store-c"]
+
+
+@pytest.fixture(scope="module")
+def stores_dir(tmp_path_factory):
+    root = tmp_path_factory.mktemp("registry")
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        write_sales_data("data.csv", products=3, months=6, rows=1500, seed=0)
+        monthly.train_and_save_model("data.csv", n_jobs=1, feature_cache=False)
+    finally:
+        os.chdir(cwd)
+    for store_id in STORES:
+        shutil.copytree(root / "saved_models" / "grid_sales_model", root / "stores" / store_id / "grid_sales_model")
+        shutil.copy(root / "data.csv", root / "stores" / store_id / "data.csv")
+    return str(root / "stores")
+
+
+def test_store_size_is_the_loaded_components(stores_dir):
+    registry = ModelRegistry(stores_dir, memory_budget=float("inf"), poll_interval=0)
+    store = registry.get("store-a")
+    model = store.model
+    size = registry.stats()['stores']['store-a']['bytes']
+    assert size == (model.compiled.nbytes + model.prediction_table.nbytes + model.product_data.nbytes
+                    + store.product_index.nbytes)
+
+    # Estimators count once they are loaded
+    model.load_members()
+    assert registry.stats()['stores']['store-a']['bytes'] > size
+
+
+def test_least_recently_used_store_is_evicted_over_budget(stores_dir):
+    probe = ModelRegistry(stores_dir, memory_budget=float("inf"), poll_interval=0)
+    probe.get("store-a")
+    size = probe.stats()['memory_used']
+
+    registry = ModelRegistry(stores_dir, memory_budget=2.5 * size, poll_interval=0)
+    registry.get("store-a")
+    registry.get("store-b")
+    assert registry.loaded_stores() == ["store-a", "store-b"]
+
+    registry.get("store-a")  # store-b is now the least recently used
+    registry.get("store-c")
+    assert registry.loaded_stores() == ["store-a", "store-c"]
+    stats = registry.stats()
+    assert stats['memory_used'] <= stats['memory_budget']
+    assert stats['stores']['store-b']['evictions'] == 1
+    assert stats['stores']['store-b']['bytes'] == 0
+
+
+def test_unknown_store(stores_dir):
+    registry = ModelRegistry(stores_dir, memory_budget=float("inf"), poll_interval=0)
+    with pytest.raises(UnknownStore):
+        registry.get("store-z")
+    with pytest.raises(UnknownStore):
+        registry.get("../store-a")
@@ -0,0 +1,55 @@
+import random
+
+import pytest
+
+from placement_solver import BranchAndBoundSolver, PlacementProblem, PulpSolver, get_solver
+
+# PuLP warns about its own deprecated API on every solve
+pytestmark = pytest.mark.filterwarnings("ignore::DeprecationWarning:pulp")
+
+
+def random_problem(rng):
+    n = rng.randint(1, 12)
+    candidates = [f"R{i // 5 + 1}C{i % 5 + 1}" for i in range(n)]
+    cover_constraints = {}
+    for i in range(rng.randint(0, 3)):
+        cover_constraints[f"Cover_{i}"] = rng.sample(candidates, rng.randint(1, min(4, n)))
+    min_placements = rng.randint(1, 2)
+    return PlacementProblem(
+        "random", candidates,
+        objective=[rng.uniform(-20, 100) for _ in range(n)],
+        fees=[rng.choice([0, 10, 25, 50, 100]) for _ in range(n)],
+        max_budget=rng.choice([0, 50, 100, 300]),
+        min_placements=min_placements,
+        max_placements=rng.randint(min_placements, 4),
+        cover_constraints=cover_constraints
+    )
+
+
+def check_feasible(problem, selected):
+    fees = dict(zip(problem.candidates, problem.fees))
+    assert problem.min_placements <= len(selected) <= problem.max_placements
+    assert sum(fees[grid] for grid in selected) <= problem.max_budget
+    for grids in problem.cover_constraints.values():
+        assert set(grids) & set(selected)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_branch_and_bound_matches_pulp(seed):
+    rng = random.Random(seed)
+    for _ in range(20):
+        problem = random_problem(rng)
+        expected = PulpSolver().solve(problem)
+        solution = BranchAndBoundSolver().solve(problem)
+
+        assert solution.status == expected.status
+        if expected.status == 'Optimal':
+            # Ties may select different grids, but never a different value
+            assert solution.objective_value == pytest.approx(expected.objective_value, abs=1e-6)
+            check_feasible(problem, solution.selected)
+
+
+def test_get_solver():
+    assert isinstance(get_solver("enumeration"), BranchAndBoundSolver)
+    with pytest.raises(ValueError):
+        get_solver("simplex")
@@ -0,0 +1,64 @@
+import os
+import subprocess
+import sys
+
+from prediction_cache import PredictionCache, combine_stats
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A job that looks up the same key twice in the worker's prediction cache
+CACHE_JOB_MODULE = """
+import main
+
+def cached_lookup(key):
+    if main.prediction_cache.get(key) is None:
+        main.prediction_cache.put(key, 1.0)
+    return main.prediction_cache.get(key)
+"""
+
+# Run the job in a worker process and read the stats the API reports
+WORKER_STATS_CODE = """
+import asyncio
+import main
+import cache_job
+
+async def scenario():
+    main.worker_pool.start()
+    try:
+        assert await main.run_job(cache_job.cached_lookup, "key") == 1.0
+    finally:
+        main.worker_pool.stop()
+
+asyncio.run(scenario())
+stats = main.prediction_cache_stats()
+print(stats['hits'], stats['misses'], stats['size'], stats['processes'])
+print('advisory_prediction_cache{field="hits"} 1' in main.metrics().body.decode())
+"""
+
+
+def test_combine_stats_sums_counters_and_recomputes_hit_rate():
+    first, second = PredictionCache(maxsize=8, ttl=60.0), PredictionCache(maxsize=8, ttl=60.0)
+    first.put("a", 1)
+    first.get("a")
+    second.get("a")
+    second.get("b")
+    combined = combine_stats([first.stats(), second.stats()])
+    assert combined['size'] == 1
+    assert (combined['hits'], combined['misses']) == (1, 2)
+    assert combined['hit_rate'] == 1 / 3
+    assert (combined['maxsize'], combined['ttl'], combined['processes']) == (8, 60.0, 2)
+
+
+def test_combine_stats_of_no_processes_is_empty():
+    combined = combine_stats([])
+    assert (combined['size'], combined['hits'], combined['hit_rate'], combined['processes']) == (0, 0, 0.0, 0)
+
+
+def test_stats_come_from_the_worker_processes(tmp_path):
+    (tmp_path / "cache_job.py").write_text(CACHE_JOB_MODULE)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([BACKEND_DIR, str(tmp_path)]),
+               ADVISORY_LOG_LEVEL="OFF", ADVISORY_WORKERS="1")
+    result = subprocess.run([sys.executable, "-c", WORKER_STATS_CODE], cwd=tmp_path, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-2:] == ["1 1 1 1", "True"]
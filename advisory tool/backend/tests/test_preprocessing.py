@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+import monthly
+from synthetic_data import generate_sales_data
+
+
+@pytest.fixture(scope="module")
+def features():
+    _, monthly_data = monthly.preprocess_data(generate_sales_data(products=6, months=12, rows=3000, seed=1))
+    processed = monthly.engineer_features(monthly_data)
+    model = monthly.GridSalesEnsembleModel()
+    model.store_feature_info(processed)
+    return model, processed
+
+
+def transformed(model, processed, mode):
+    preprocessor = monthly.build_preprocessor(model.categorical_features, model.numerical_features, mode)
+    X = preprocessor.fit_transform(processed[model.categorical_features + model.numerical_features])
+    return preprocessor, X
+
+
+def test_sparse_matrix_holds_the_dense_float32_rows(features):
+    model, processed = features
+    _, X_dense = transformed(model, processed, 'dense')
+    _, X_sparse = transformed(model, processed, 'sparse')
+
+    assert sparse.issparse(X_sparse)
+    assert X_sparse.dtype == np.float32
+    assert monthly.matrix_bytes(X_sparse) < monthly.matrix_bytes(X_dense)
+    np.testing.assert_array_equal(monthly.member_rows(X_sparse), monthly.member_rows(X_dense))
+
+
+def test_sparse_and_dense_modes_predict_the_same(features):
+    model, processed = features
+    y = processed['Quantity'].to_numpy()
+    predictions = {}
+    for mode in monthly.PREPROCESSING_MODES:
+        preprocessor, X = transformed(model, processed, mode)
+        members, _ = monthly.fit_ensemble_members(X, y, n_jobs=1)
+        model.store_models(members['xgb_model'], members['rf_model_1'], members['rf_model_2'])
+        model.store_preprocessor(preprocessor)
+        model.preprocessing = mode
+        predictions[mode] = model._predict_frame(processed, use_compiled=False)
+        compiled = model.compile().predict(preprocessor.transform(
+            processed[model.categorical_features + model.numerical_features]
+        ))
+        np.testing.assert_allclose(compiled, predictions[mode], rtol=1e-5, atol=1e-4)
+
+    np.testing.assert_allclose(predictions['sparse'], predictions['dense'], rtol=1e-6, atol=1e-5)
@@ -0,0 +1,47 @@
+import pandas as pd
+
+from inference import GridSalesEnsembleModel
+from product_table import ProductTable
+
+
+def product_rows(products, rows=3):
+    return pd.DataFrame({
+        'Product Name': [f"P{i}" for i in range(products) for _ in range(rows)],
+        'Grid Position': ["R1C1", "R1C2", "R2C1"] * products,
+        'Quantity': [float(i) for i in range(products * rows)]
+    })
+
+
+def test_round_trip_through_a_saved_table(tmp_path):
+    table = ProductTable.from_frame(product_rows(4))
+    table.save(str(tmp_path / "table"))
+    loaded = ProductTable.load(str(tmp_path / "table"))
+    assert list(loaded) == ["P0", "P1", "P2", "P3"]
+    pd.testing.assert_frame_equal(loaded["P2"]['latest_data'], table["P2"]['latest_data'])
+
+
+def test_built_frames_are_bounded():
+    table = ProductTable.from_frame(product_rows(10))
+    table.max_frames = 3
+    empty_bytes = table.nbytes
+    for product in ["P0", "P1", "P2", "P0", "P3", "P4"]:
+        table[product]
+    assert list(table._frames) == ["P0", "P3", "P4"]
+    three_frames = table.nbytes - empty_bytes
+    assert three_frames > 0
+
+    # Evicted frames are rebuilt and stop counting once dropped
+    assert table["P1"]['latest_data']['Quantity'].tolist() == [3.0, 4.0, 5.0]
+    assert list(table._frames) == ["P3", "P4", "P1"]
+    assert table.nbytes - empty_bytes == three_frames
+
+
+def test_feature_templates_are_bounded(monkeypatch):
+    monkeypatch.setattr(GridSalesEnsembleModel, "TEMPLATE_CACHE_SIZE", 2)
+    model = GridSalesEnsembleModel()
+    model.categorical_features = []
+    model.numerical_features = ['Quantity']
+    model.product_data = ProductTable.from_frame(product_rows(5))
+    for product in ["P0", "P1", "P0", "P2"]:
+        assert model._product_template(product) is not None
+    assert list(model._templates) == ["P0", "P2"]
@@ -0,0 +1,110 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+import monthly
+from synthetic_data import write_sales_data
+
+MODEL_DIR = os.path.join("saved_models", "grid_sales_model")
+
+
+@pytest.fixture
+def trained(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_sales_data("data.csv", products=3, months=6, rows=1500, seed=0)
+    write_sales_data("new.csv", products=3, months=1, rows=200, seed=1, start="2022-07-01")
+    monthly.train_and_save_model("data.csv", n_jobs=1, feature_cache=False)
+    assert os.path.exists(os.path.join(MODEL_DIR, "metadata.json"))
+    return tmp_path
+
+
+def test_update_swaps_in_a_complete_model_directory(trained):
+    served = monthly.load_model(MODEL_DIR)
+    assert served.xgb_model is None  # members load lazily from MODEL_DIR
+
+    # Versions have one-second resolution
+    time.sleep(1.1)
+    monthly.update_model("new.csv", MODEL_DIR, xgb_rounds=2, rf_refresh_every=0, n_jobs=1)
+
+    updated = monthly.load_model(MODEL_DIR)
+    assert updated.version != served.version
+    assert sorted(os.listdir("saved_models")) == ["grid_sales_model", "grid_sales_model_training"]
+
+    # The old model never reads members of the new version
+    with pytest.raises(RuntimeError):
+        served.load_members()
+    updated.load_members()
+    assert updated.xgb_model.get_booster().num_boosted_rounds() == monthly.XGB_PARAMS['n_estimators'] + 2
+
+
+def test_failed_save_leaves_the_model_in_place(trained, monkeypatch):
+    model = monthly.load_model(MODEL_DIR)
+    files = sorted(os.listdir(MODEL_DIR))
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+    monkeypatch.setattr(monthly, "write_metadata", fail)
+    with pytest.raises(OSError):
+        monthly.save_model(model, MODEL_DIR)
+
+    assert sorted(os.listdir(MODEL_DIR)) == files
+    assert monthly.load_model(MODEL_DIR).version == model.version
+    assert sorted(os.listdir("saved_models")) == ["grid_sales_model", "grid_sales_model_training"]
+
+
+def test_shrink_rebuilds_the_table_from_the_pruned_engine(trained):
+    full = monthly.load_model(MODEL_DIR)
+    monthly.shrink_saved_model(MODEL_DIR, tolerance=0.05, max_tolerance=0.2, max_rows=2000)
+
+    shrunk = monthly.load_model(MODEL_DIR)
+    assert shrunk.compiled.n_trees < full.compiled.n_trees
+    table, shrunk.prediction_table = shrunk.prediction_table, None
+    frame = monthly.serving_reference_frame(shrunk, max_rows=2000)
+    reference = full._predict_frame(frame)
+    live = shrunk._predict_frame(frame)
+    mean_prediction = np.abs(reference).mean()
+    assert np.abs(live - reference).mean() <= 0.05 * mean_prediction
+    assert np.abs(live - reference).max() <= 0.2 * mean_prediction + 1e-6
+
+    # Table lookups give the pruned engine's predictions
+    for product_name in table.products:
+        for month in (None, 3):
+            frame = shrunk._build_prediction_frame(product_name, table.grids, month)
+            np.testing.assert_allclose(table.lookup(product_name, month=month),
+                                       shrunk._predict_frame(frame), rtol=1e-5, atol=1e-4)
+
+
+def file_states(path):
+    states = {}
+    for root, _, names in os.walk(path):
+        for name in names:
+            stat = os.stat(os.path.join(root, name))
+            states[os.path.relpath(os.path.join(root, name), path)] = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    return states
+
+
+@pytest.mark.parametrize("rewrite", [
+    monthly.compile_saved_model,
+    monthly.build_saved_prediction_table,
+    lambda model_dir: monthly.shrink_saved_model(model_dir, tolerance=0.05, max_rows=2000),
+])
+def test_rewrites_swap_in_a_copy_of_the_model_directory(trained, monkeypatch, rewrite):
+    before = file_states(MODEL_DIR)
+    write_metadata = monthly.write_metadata
+
+    def checked_write_metadata(model, model_dir, version):
+        # Nothing in the live directory changes while the new files are written
+        assert os.path.normpath(model_dir) != os.path.normpath(MODEL_DIR)
+        assert file_states(MODEL_DIR) == before
+        write_metadata(model, model_dir, version)
+    monkeypatch.setattr(monthly, "write_metadata", checked_write_metadata)
+    rewrite(MODEL_DIR)
+
+    after = file_states(MODEL_DIR)
+    assert after.keys() == before.keys()
+    assert after["metadata.json"] != before["metadata.json"]
+    assert sorted(os.listdir("saved_models")) == ["grid_sales_model", "grid_sales_model_training"]
+    model = monthly.load_model(MODEL_DIR)
+    assert model.compiled is not None and model.prediction_table is not None
@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+import monthly
+from model_registry import StoreArtifacts
+from product_index import load_product_index
+from synthetic_data import write_sales_data
+
+
+@pytest.fixture(scope="module")
+def trained(tmp_path_factory):
+    root = tmp_path_factory.mktemp("serving")
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        write_sales_data("data.csv", products=4, months=6, rows=2000, seed=3)
+        monthly.train_and_save_model("data.csv", n_jobs=1, feature_cache=False)
+    finally:
+        os.chdir(cwd)
+    return str(root)
+
+
+@pytest.fixture
+def store(trained, monkeypatch):
+    model = monthly.load_model(os.path.join(trained, "saved_models", "grid_sales_model"))
+    product_index = load_product_index(os.path.join(trained, "data.csv"), grids=model.layout.grids)
+    store = StoreArtifacts(None, model, product_index, model.layout)
+    monkeypatch.setattr(main, "get_store", lambda store_id=None: store)
+    main.prediction_cache.clear()
+    return store
+
+
+def live_model(trained, compiled):
+    """The saved model without its prediction table (and optionally its engine)"""
+    model = monthly.load_model(os.path.join(trained, "saved_models", "grid_sales_model"))
+    model.prediction_table = None
+    if not compiled:
+        model.compiled = None
+    return model
+
+
+def test_batch_reports_errors_per_product(store):
+    products = list(store.model.product_data)
+    response = main.optimize_batch([products[0], "Unknown Product", products[1]])
+
+    results = response['results']
+    assert [result['product_name'] for result in results] == [products[0], "Unknown Product", products[1]]
+    assert results[1]['status'] == 'Error'
+    for result in (results[0], results[2]):
+        assert result.get('status') != 'Error', result
+        # Same answer as the single-product endpoint
+        single = main.optimize_product(result['product_name'])
+        assert {**single, 'product_name': result['product_name']} == result
+
+
+def test_batch_without_a_model_is_one_error(store, monkeypatch):
+    monkeypatch.setattr(main, "get_store", lambda store_id=None: StoreArtifacts(None, None, store.product_index, store.layout))
+    response = main.optimize_batch(["A", "B"])
+    assert response['status'] == 'Error'
+    assert "not loaded" in response['message']
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_table_hits_match_the_live_path(trained, store, compiled):
+    served = store.model
+    live = live_model(trained, compiled)
+    assert served.prediction_table is not None
+    # The table is built with the estimators; the compiled engine is float32
+    tolerance = dict(rtol=1e-5, atol=1e-4) if compiled else dict(rtol=1e-9, atol=1e-9)
+
+    products = list(served.product_data)
+    for month in (None, 1, 7, 12):
+        for product_name in products:
+            expected = live.predict_sales(product_name, jitter=False, month=month)
+            table_hit = served.predict_sales(product_name, jitter=False, month=month)
+            pd.testing.assert_frame_equal(table_hit, expected, **tolerance)
+
+        table_hits, errors = served.predict_sales_batch(products, jitter=False, month=month)
+        live_results, _ = live.predict_sales_batch(products, jitter=False, month=month)
+        assert not errors
+        for product_name in products:
+            pd.testing.assert_frame_equal(table_hits[product_name], live_results[product_name], **tolerance)
+
+
+def test_seeded_jitter_is_the_same_for_table_hits(trained, store):
+    live = live_model(trained, compiled=False)
+    for product_name in store.model.product_data:
+        table_hit = store.model.predict_sales(product_name, seed=42)
+        expected = live.predict_sales(product_name, seed=42)
+        np.testing.assert_allclose(table_hit['Predicted Monthly Sales'], expected['Predicted Monthly Sales'],
+                                   rtol=1e-9)
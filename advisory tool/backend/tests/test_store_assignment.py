@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from store_assignment import assign_store, load_previous_assignment, save_layout
+
+# PuLP warns about its own deprecated API on every solve
+pytestmark = pytest.mark.filterwarnings("ignore::DeprecationWarning:pulp")
+
+PRODUCTS = [f"Product {i}" for i in range(12)]
+GRIDS = [f"R{r}C{c}" for r in range(1, 3) for c in range(1, 5)]
+
+
+@pytest.fixture
+def net_profit():
+    return np.random.default_rng(7).uniform(-20, 100, size=(len(PRODUCTS), len(GRIDS)))
+
+
+def check_layout(layout, capacity, min_facings, max_facings):
+    assert sorted(layout) == sorted(PRODUCTS)
+    for grids in layout.values():
+        assert min_facings <= len(grids) <= max_facings
+        assert set(grids) <= set(GRIDS)
+    for grid in GRIDS:
+        assert sum(grid in grids for grids in layout.values()) <= capacity
+
+
+def test_warm_start_from_the_previous_layout(net_profit, tmp_path):
+    cold, cold_info = assign_store(net_profit, PRODUCTS, GRIDS, capacity=3, max_facings=2,
+                                   candidates_per_product=3, time_limit=60)
+    check_layout(cold, 3, 1, 2)
+    assert cold_info['optimal']
+
+    path = str(tmp_path / "store_layout.json")
+    assert load_previous_assignment(path) is None
+    save_layout(path, cold, cold_info)
+    previous = load_previous_assignment(path)
+    assert previous == cold
+
+    # Profits shift; previous grids outside a product's top candidates still
+    # get a variable, and entries for unknown products or grids are ignored
+    shifted = net_profit[:, ::-1].copy()
+    previous["Gone Product"] = [GRIDS[0]]
+    previous[PRODUCTS[0]] = previous[PRODUCTS[0]] + ["R9C9"]
+    warm, warm_info = assign_store(shifted, PRODUCTS, GRIDS, capacity=3, max_facings=2,
+                                   candidates_per_product=3, previous_layout=previous, time_limit=60)
+    fresh, fresh_info = assign_store(shifted, PRODUCTS, GRIDS, capacity=3, max_facings=2,
+                                     candidates_per_product=3, time_limit=60)
+    check_layout(warm, 3, 1, 2)
+    assert warm_info['optimal']
+    assert warm_info['variables'] >= fresh_info['variables']
+    assert warm_info['objective'] >= fresh_info['objective'] - 1e-6
+
+
+def test_sparse_candidates_stay_within_the_full_optimum(net_profit):
+    sparse_layout, sparse_info = assign_store(net_profit, PRODUCTS, GRIDS, capacity=2, max_facings=2,
+                                              candidates_per_product=2, time_limit=60)
+    _, full_info = assign_store(net_profit, PRODUCTS, GRIDS, capacity=2, max_facings=2,
+                                candidates_per_product=len(GRIDS), time_limit=60)
+    check_layout(sparse_layout, 2, 1, 2)
+    assert sparse_info['objective'] <= full_info['objective'] + 1e-6
+
+
+def test_minimum_facings_beyond_capacity(net_profit):
+    with pytest.raises(ValueError):
+        assign_store(net_profit, PRODUCTS, GRIDS, capacity=1, min_facings=1)
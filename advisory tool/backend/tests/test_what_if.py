@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+def test_sweep_values_of_a_range():
+    assert main.sweep_values(main.SweepRange(start=0, stop=1, steps=3), 5.0) == [0.0, 0.5, 1.0]
+    assert main.sweep_values(None, 5.0) == [5.0]
+
+
+def test_sweep_values_rejects_oversized_ranges_before_building_them(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("linspace called")
+    monkeypatch.setattr(np, "linspace", fail)
+    with pytest.raises(ValueError):
+        main.sweep_values(main.SweepRange(start=0, stop=1, steps=10 ** 9), 5.0)
+
+
+def test_what_if_answers_oversized_ranges_with_an_error():
+    # Validation happens before any model is needed
+    client = TestClient(main.app)
+    response = client.post("/what-if", json={"product_name": "any",
+                                             "budgets": {"start": 0, "stop": 300, "steps": 10 ** 9}})
+    assert response.status_code == 200
+    assert response.json()['status'] == 'Error'
+    assert str(main.MAX_WHAT_IF_SCENARIOS) in response.json()['message']
@@ -0,0 +1,35 @@
+import asyncio
+import threading
+
+from worker_pool import WorkerPool
+
+
+def test_in_process_job_is_reported_running():
+    started = threading.Event()
+    release = threading.Event()
+
+    def job():
+        started.set()
+        release.wait(5)
+        return 42
+
+    async def scenario():
+        pool = WorkerPool(workers=0, max_in_flight=4)
+        pool.start()
+        try:
+            task = asyncio.ensure_future(pool.run(job))
+            assert await asyncio.to_thread(started.wait, 5)
+            during = pool.stats()
+            release.set()
+            assert await task == 42
+            return during, pool.stats()
+        finally:
+            pool.stop()
+
+    during, after = asyncio.run(scenario())
+    assert during['in_flight'] == 1
+    assert during['running'] == 1
+    assert during['queued'] == 0
+    assert after['in_flight'] == 0
+    assert after['running'] == 0
+    assert after['completed'] == 1
@@ -0,0 +1,329 @@
+"""
+Flat-array inference engine for tree ensembles
+----------------------------------------------
+Compiles the XGBoost booster and the sklearn Random Forests of the grid sales
+ensemble into one set of node arrays, with each member's blend weight folded
+into its leaf values. The whole ensemble is then evaluated for a batch of
+rows in a single vectorized walk down all trees at once.
+
+Every node is stored as "go left when x <= threshold". sklearn splits already
+have that form (on float32 inputs); XGBoost splits are "x < threshold" on
+float32 values and are converted with the next float32 below the threshold.
+Leaves point to themselves, so walking max_depth steps lands every row on a
+leaf without per-tree bookkeeping.
+
+A saved engine is loaded memory-mapped by default, so worker processes
+serving the same model share its pages. shrink() makes a smaller engine:
+float32 thresholds (exact, since inputs are float32) and leaf values, and
+optionally without the trees that change predictions least.
+
+Layout of a saved engine directory:
+    manifest.json   counts, bias, member tree counts and the version of the
+                    source model
+    <array>.npy     one file per node array (see ARRAYS)
+"""
+
+import json
+import os
+
+import numpy as np
+
+from atomic_write import save_array, save_json
+
+# Node arrays, all indexed by global node id
+ARRAYS = ('feature', 'threshold', 'left', 'right', 'default_left', 'value', 'roots')
+
+
+class _TreeBuilder:
+    """Accumulates trees as global node arrays"""
+
+    def __init__(self):
+        self.parts = {name: [] for name in ARRAYS if name != 'roots'}
+        self.roots = []
+        self.n_nodes = 0
+        self.max_depth = 0
+
+    def add_tree(self, feature, threshold, left, right, default_left, value, depth):
+        """Add one tree given per-node arrays with local ids (-1 children = leaf)"""
+        offset = self.n_nodes
+        n = len(feature)
+        local = np.arange(n)
+        is_leaf = left < 0
+
+        self.parts['feature'].append(np.where(is_leaf, 0, feature).astype(np.int32))
+        self.parts['threshold'].append(np.where(is_leaf, 0.0, threshold).astype(np.float64))
+        self.parts['left'].append((np.where(is_leaf, local, left) + offset).astype(np.int32))
+        self.parts['right'].append((np.where(is_leaf, local, right) + offset).astype(np.int32))
+        self.parts['default_left'].append(np.asarray(default_left, dtype=bool))
+        self.parts['value'].append(np.where(is_leaf, value, 0.0).astype(np.float64))
+
+        self.roots.append(offset)
+        self.n_nodes += n
+        self.max_depth = max(self.max_depth, int(depth))
+
+    def build(self, n_features, bias, members):
+        arrays = {name: np.concatenate(parts) for name, parts in self.parts.items()}
+        arrays['roots'] = np.asarray(self.roots, dtype=np.int32)
+        return CompiledEnsemble(arrays, n_features=n_features, bias=bias, max_depth=self.max_depth, members=members)
+
+
+def _tree_depth(left, right):
+    """Depth of a tree given local child arrays (leaves have -1)"""
+    max_depth = 0
+    stack = [(0, 0)]
+    while stack:
+        node, depth = stack.pop()
+        max_depth = max(max_depth, depth)
+        if left[node] >= 0:
+            stack.append((left[node], depth + 1))
+            stack.append((right[node], depth + 1))
+    return max_depth
+
+
+def _float32_at_most(values):
+    """Largest float32 <= each value, so x <= t and x <= the result agree for float32 x"""
+    rounded = np.asarray(values, dtype=np.float32)
+    return np.where(rounded > values, np.nextafter(rounded, np.float32(-np.inf)), rounded)
+
+
+def add_sklearn_forest(builder, forest, weight):
+    """Add a fitted RandomForestRegressor (the mean of its trees) x weight"""
+    scale = weight / len(forest.estimators_)
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        missing_left = getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=np.uint8))
+        builder.add_tree(
+            feature=tree.feature,
+            threshold=tree.threshold,
+            left=tree.children_left,
+            right=tree.children_right,
+            default_left=missing_left.astype(bool),
+            value=tree.value[:, 0, 0] * scale,
+            depth=tree.max_depth
+        )
+
+
+def add_xgboost(builder, booster, weight):
+    """Add a gbtree regression booster x weight; returns its weighted bias"""
+    model = json.loads(booster.save_raw('json'))['learner']
+    if model['gradient_booster']['name'] != 'gbtree':
+        raise ValueError(f"Cannot compile '{model['gradient_booster']['name']}' boosters")
+    if model['objective']['name'] != 'reg:squarederror':
+        raise ValueError(f"Cannot compile objective '{model['objective']['name']}'")
+
+    for tree in model['gradient_booster']['model']['trees']:
+        left = np.asarray(tree['left_children'], dtype=np.int64)
+        right = np.asarray(tree['right_children'], dtype=np.int64)
+        conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+        # x < c on float32 inputs is x <= (largest float32 below c)
+        thresholds = np.nextafter(conditions, np.float32(-np.inf))
+        builder.add_tree(
+            feature=np.asarray(tree['split_indices'], dtype=np.int64),
+            threshold=thresholds.astype(np.float64),
+            left=left,
+            right=right,
+            default_left=np.asarray(tree['default_left'], dtype=bool),
+            # Split conditions hold the leaf values at leaves
+            value=conditions.astype(np.float64) * weight,
+            depth=_tree_depth(left, right)
+        )
+
+    # Stored as a bracketed string such as '[2.2014587E1]'
+    base_score = float(model['learner_model_param']['base_score'].strip('[]'))
+    return base_score * weight
+
+
+class CompiledEnsemble:
+    """Weighted sum of trees evaluated over flat node arrays"""
+
+    def __init__(self, arrays, n_features, bias, max_depth, source_version=None, members=None):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.n_features = n_features
+        self.bias = bias
+        self.max_depth = max_depth
+        self.source_version = source_version
+        # [kind, number of trees] per member in tree order ('xgboost' or
+        # 'forest'); None for engines saved before it was recorded
+        self.members = members
+
+    @classmethod
+    def from_members(cls, members, n_features):
+        """Compile [(estimator, weight), ...] of XGBRegressor / RandomForestRegressor"""
+        builder = _TreeBuilder()
+        bias = 0.0
+        tree_counts = []
+        for estimator, weight in members:
+            n_trees = len(builder.roots)
+            if hasattr(estimator, 'get_booster'):
+                bias += add_xgboost(builder, estimator.get_booster(), weight)
+                kind = 'xgboost'
+            elif hasattr(estimator, 'estimators_'):
+                add_sklearn_forest(builder, estimator, weight)
+                kind = 'forest'
+            else:
+                raise TypeError(f"Cannot compile {type(estimator).__name__}")
+            tree_counts.append([kind, len(builder.roots) - n_trees])
+        return builder.build(n_features, bias, tree_counts)
+
+    @property
+    def nbytes(self):
+        """Bytes of the node arrays (memory-mapped or in memory)"""
+        return sum(getattr(self, name).nbytes for name in ARRAYS)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    def _leaves(self, X):
+        """Leaf node of every tree for each row, shape (rows, trees)"""
+        # Both libraries split on float32 inputs
+        if hasattr(X, 'toarray'):
+            X = X.toarray()
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected rows with {self.n_features} features, got shape {X.shape}")
+
+        rows = np.arange(X.shape[0])[:, None]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], self.n_trees)).copy()
+        for _ in range(self.max_depth):
+            x = X[rows, self.feature[nodes]]
+            go_left = np.where(np.isnan(x), self.default_left[nodes], x <= self.threshold[nodes])
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict(self, X):
+        """Ensemble prediction for a 2-D array of preprocessed rows"""
+        return self.value[self._leaves(X)].sum(axis=1, dtype=np.float64) + self.bias
+
+    def tree_outputs(self, X):
+        """Weighted output of every tree for each row, shape (rows, trees)"""
+        return np.asarray(self.value[self._leaves(X)], dtype=np.float64)
+
+    def subset(self, keep, tree_scale=None, bias=None, members=None):
+        """Engine with only the trees in keep, their leaf values times tree_scale"""
+        keep = np.sort(np.asarray(keep, dtype=np.int64))
+        starts = self.roots.astype(np.int64)
+        ends = np.append(starts[1:], self.n_nodes)
+        tree_of_node = np.repeat(np.arange(self.n_trees), ends - starts)
+        kept = np.zeros(self.n_trees, dtype=bool)
+        kept[keep] = True
+        node_mask = kept[tree_of_node]
+        new_id = (np.cumsum(node_mask) - 1).astype(np.int32)
+
+        value = self.value[node_mask]
+        if tree_scale is not None:
+            value = value * np.asarray(tree_scale)[tree_of_node[node_mask]].astype(value.dtype)
+        arrays = {
+            'feature': self.feature[node_mask],
+            'threshold': self.threshold[node_mask],
+            'left': new_id[self.left[node_mask]],
+            'right': new_id[self.right[node_mask]],
+            'default_left': self.default_left[node_mask],
+            'value': value,
+            'roots': new_id[starts[keep]]
+        }
+        return CompiledEnsemble(
+            arrays, self.n_features, self.bias if bias is None else bias, self.max_depth,
+            source_version=self.source_version, members=self.members if members is None else members
+        )
+
+    def shrink(self, X=None, tolerance=0.0, float32=True, max_tolerance=None):
+        """Smaller engine, and the trees it dropped
+
+        float32 stores thresholds (rounded down, which is exact for float32
+        inputs) and leaf values as float32. With reference rows X and a
+        tolerance, trees are dropped, least important first, while the mean
+        absolute change of the predictions on X stays within tolerance x
+        their mean absolute value, and the change of every single row within
+        max_tolerance x that value (if given). A dropped XGBoost tree is
+        replaced by its mean output in the bias; the rest of a forest is
+        rescaled to stay its mean. Each member keeps at least one tree.
+        """
+        engine = self
+        if float32:
+            arrays = {name: getattr(self, name) for name in ARRAYS}
+            arrays['threshold'] = _float32_at_most(self.threshold)
+            arrays['value'] = np.asarray(self.value, dtype=np.float32)
+            engine = CompiledEnsemble(arrays, self.n_features, self.bias, self.max_depth,
+                                      source_version=self.source_version, members=self.members)
+        if X is None or tolerance <= 0:
+            return engine, []
+        if self.members is None:
+            raise ValueError("The engine does not record its members; compile it again to prune")
+
+        outputs = self.tree_outputs(X)
+        reference = outputs.sum(axis=1) + self.bias
+        budget = tolerance * np.abs(reference).mean()
+        row_budget = np.inf if max_tolerance is None else max_tolerance * np.abs(reference).mean()
+        group = np.repeat(np.arange(len(self.members)), [count for _, count in self.members])
+        group_size = np.array([count for _, count in self.members])
+        is_forest = np.array([kind == 'forest' for kind, _ in self.members])
+        group_sum = np.stack([outputs[:, group == g].sum(axis=1) for g in range(len(self.members))], axis=1)
+
+        # Change of the predictions when one tree is dropped on its own
+        tree_mean = outputs.mean(axis=0)
+        importance = np.abs(outputs - tree_mean).mean(axis=0)
+        for g in np.flatnonzero(is_forest & (group_size > 1)):
+            trees = group == g
+            n = group_size[g]
+            importance[trees] = np.abs(group_sum[:, [g]] - n * outputs[:, trees]).mean(axis=0) / (n - 1)
+
+        kept_sum = group_sum.copy()
+        kept_count = group_size.copy()
+        bias_shift = 0.0
+        dropped = []
+        for tree in np.argsort(importance, kind='stable'):
+            g = group[tree]
+            if kept_count[g] == 1:
+                continue
+            kept_sum[:, g] -= outputs[:, tree]
+            kept_count[g] -= 1
+            shift = bias_shift if is_forest[g] else bias_shift + tree_mean[tree]
+            scale = np.where(is_forest, group_size / kept_count, 1.0)
+            predictions = kept_sum @ scale + self.bias + shift
+            change = np.abs(predictions - reference)
+            if change.mean() > budget or change.max() > row_budget:
+                kept_sum[:, g] += outputs[:, tree]
+                kept_count[g] += 1
+                break
+            bias_shift = shift
+            dropped.append(int(tree))
+
+        if not dropped:
+            return engine, []
+        keep = np.setdiff1d(np.arange(self.n_trees), dropped)
+        scale = np.where(is_forest, group_size / kept_count, 1.0)
+        members = [[kind, int(count)] for (kind, _), count in zip(self.members, kept_count)]
+        return engine.subset(keep, tree_scale=scale[group], bias=self.bias + bias_shift, members=members), dropped
+
+    def save(self, path):
+        """Write the node arrays and the manifest (last) to a directory"""
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAYS:
+            save_array(os.path.join(path, f"{name}.npy"), getattr(self, name))
+
+        save_json(os.path.join(path, "manifest.json"), {
+            'n_features': self.n_features,
+            'bias': self.bias,
+            'max_depth': self.max_depth,
+            'n_trees': self.n_trees,
+            'n_nodes': self.n_nodes,
+            'members': self.members,
+            'source_version': self.source_version
+        }, indent=4)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Open a saved engine; with mmap the node arrays are paged in on demand"""
+        with open(os.path.join(path, "manifest.json"), "r") as f:
+            manifest = json.load(f)
+        mmap_mode = 'r' if mmap else None
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode, allow_pickle=False)
+                  for name in ARRAYS}
+        return cls(arrays, manifest['n_features'], manifest['bias'], manifest['max_depth'],
+                   source_version=manifest.get('source_version'), members=manifest.get('members'))
@@ -0,0 +1,135 @@
+"""
+Bounded pool for the CPU-bound part of a request
+------------------------------------------------
+Prediction and placement solving run in a pool of worker processes so the
+event loop stays free and requests are not limited by one interpreter. At
+most max_in_flight jobs are accepted at a time (running plus waiting for a
+worker); beyond that run() raises PoolFull and the API answers 503 with a
+Retry-After header instead of letting latency grow without bound.
+
+With workers=0 jobs run in a thread pool in this process, under the same
+in-flight limit.
+"""
+
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class PoolFull(Exception):
+    """Raised when max_in_flight jobs are already accepted"""
+
+
+class WorkerPool:
+    """Process pool with an in-flight cap and queue statistics"""
+
+    def __init__(self, workers=0, max_in_flight=32, initializer=None):
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self.initializer = initializer
+        self._executor = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.running = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.failed = 0
+        self.completed = 0
+        self.last_job_seconds = None
+
+    def start(self):
+        """Start the worker processes (or the thread pool for workers=0)"""
+        if self._executor is not None:
+            return
+        if self.workers > 0:
+            # spawn: workers start from a clean interpreter instead of a fork
+            # of a process that already runs threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=self.initializer
+            )
+            # Workers are spawned on demand; start them all now so loading
+            # the artifacts does not land on the first requests
+            for _ in range(self.workers):
+                self._executor.submit(_noop)
+        else:
+            self._executor = ThreadPoolExecutor(thread_name_prefix="advisory-job")
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, fn, *args):
+        """Run fn(*args) in the pool; raises PoolFull when the queue is full"""
+        if self._executor is None:
+            raise RuntimeError("Worker pool is not started")
+
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                self.rejected += 1
+                raise PoolFull(f"{self.in_flight} jobs in flight")
+            self.in_flight += 1
+            self.accepted += 1
+
+        start = time.perf_counter()
+        try:
+            if self.workers > 0:
+                future = self._executor.submit(fn, *args)
+            else:
+                future = self._executor.submit(_run_tracked, self, fn, args)
+        except Exception:
+            with self._lock:
+                self.in_flight -= 1
+                self.failed += 1
+            raise
+
+        # Accounting follows the job, not the request: a job whose client
+        # went away still holds its slot until it finishes
+        future.add_done_callback(lambda done: self._finish(done, start))
+        return await asyncio.wrap_future(future)
+
+    def _finish(self, future, start):
+        with self._lock:
+            self.in_flight -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+                self.last_job_seconds = time.perf_counter() - start
+
+    def stats(self):
+        with self._lock:
+            # In-process jobs report when they start; worker processes do not,
+            # so there every job beyond one per worker is counted as queued
+            running = self.running if self.workers == 0 else min(self.in_flight, self.workers)
+            return {
+                'workers': self.workers,
+                'max_in_flight': self.max_in_flight,
+                'in_flight': self.in_flight,
+                'running': running,
+                'queued': self.in_flight - running,
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+                'failed': self.failed,
+                'completed': self.completed,
+                'last_job_seconds': self.last_job_seconds,
+            }
+
+
+def _run_tracked(pool, fn, args):
+    """Run an in-process job, tracking it as running"""
+    with pool._lock:
+        pool.running += 1
+    try:
+        return fn(*args)
+    finally:
+        with pool._lock:
+            pool.running -= 1
+
+
+def _noop():
+    pass